@@ -0,0 +1,213 @@
+# analytics.py
+
+import numpy as np
+import pandas as pd
+
+# ANSI C84.1 service voltage ranges [pu].
+RANGE_A = (0.95, 1.05)
+RANGE_B = (0.917, 1.058)
+
+# Histogram bin edges [pu]; values outside fall into the first/last bin.
+HISTOGRAM_EDGES = np.round(np.arange(0.90, 1.10 + 1e-9, 0.005), 3)
+
+# Rows read per chunk when analysing a stored CSV file.
+CHUNK_SIZE = 100_000
+
+
+class VoltageStatistics:
+    """
+    Streaming per-node voltage statistics.
+
+    Rows are folded in with update(t, V), where V holds one column per node.
+    Each sample is weighted by the time since the previous sample (the first
+    one by default_dt). Only per-node accumulators are kept, so memory does
+    not grow with the run length.
+    """
+
+    def __init__(self, nodes, range_a=RANGE_A, range_b=RANGE_B,
+                 histogram_edges=HISTOGRAM_EDGES, default_dt=1.0):
+        self.nodes = list(nodes)
+        self.ranges = {"A": range_a, "B": range_b}
+        self.edges = np.asarray(histogram_edges, dtype=float)
+        self.default_dt = default_dt
+
+        n = len(self.nodes)
+        self.samples = np.zeros(n, dtype=np.int64)
+        self.total_time = np.zeros(n)
+        self.v_min = np.full(n, np.inf)
+        self.v_max = np.full(n, -np.inf)
+        self.v_sum = np.zeros(n)
+        self.t_min = np.full(n, np.nan)
+        self.t_max = np.full(n, np.nan)
+        self.histogram = np.zeros((n, len(self.edges) + 1), dtype=np.int64)
+
+        # Per range and side ('under'/'over'): samples, time, events, longest event.
+        self.violations = {}
+        for name in self.ranges:
+            for side in ("under", "over"):
+                self.violations[(name, side)] = {
+                    "samples": np.zeros(n, dtype=np.int64),
+                    "time": np.zeros(n),
+                    "events": np.zeros(n, dtype=np.int64),
+                    "longest": np.zeros(n),
+                    "current": np.zeros(n),
+                    "active": np.zeros(n, dtype=bool),
+                }
+        self._t_prev = None
+
+    def update(self, t, voltages):
+        """Fold in rows of times t (k,) and voltages (k, nodes)."""
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        v = np.asarray(voltages, dtype=float).reshape(len(t), len(self.nodes))
+        if len(t) == 0:
+            return
+
+        dt = np.diff(t, prepend=t[0] - self.default_dt if self._t_prev is None else self._t_prev)
+        self._t_prev = t[-1]
+        valid = ~np.isnan(v)
+        weights = np.where(valid, dt[:, None], 0.0)
+
+        self.samples += valid.sum(axis=0)
+        self.total_time += weights.sum(axis=0)
+        self.v_sum += np.where(valid, v, 0.0).sum(axis=0)
+
+        chunk_min = np.where(valid, v, np.inf)
+        i_min = chunk_min.argmin(axis=0)
+        cols = np.arange(v.shape[1])
+        lower = chunk_min[i_min, cols] < self.v_min
+        self.v_min[lower] = chunk_min[i_min, cols][lower]
+        self.t_min[lower] = t[i_min][lower]
+
+        chunk_max = np.where(valid, v, -np.inf)
+        i_max = chunk_max.argmax(axis=0)
+        higher = chunk_max[i_max, cols] > self.v_max
+        self.v_max[higher] = chunk_max[i_max, cols][higher]
+        self.t_max[higher] = t[i_max][higher]
+
+        bins = np.searchsorted(self.edges, v, side='right')
+        rows, node_idx = np.nonzero(valid)
+        np.add.at(self.histogram, (node_idx, bins[rows, node_idx]), 1)
+
+        for (name, side), acc in self.violations.items():
+            low, high = self.ranges[name]
+            mask = (v < low) if side == "under" else (v > high)
+            mask &= valid
+            acc["samples"] += mask.sum(axis=0)
+            acc["time"] += np.where(mask, weights, 0.0).sum(axis=0)
+            # Events start where a node enters violation.
+            previous = np.vstack([acc["active"][None, :], mask[:-1]])
+            acc["events"] += (mask & ~previous).sum(axis=0)
+            # Run durations: cumulative violation time minus its value at the
+            # last non-violating sample (c is non-decreasing down each column).
+            c = acc["current"] + np.cumsum(np.where(mask, weights, 0.0), axis=0)
+            base = np.maximum.accumulate(np.where(mask, 0.0, c), axis=0)
+            run = np.where(mask, c - base, 0.0)
+            np.maximum(acc["longest"], run.max(axis=0), out=acc["longest"])
+            acc["current"] = run[-1]
+            acc["active"] = mask[-1]
+
+    def summary(self):
+        """Return a per-node DataFrame of the accumulated statistics."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            data = {
+                "samples": self.samples,
+                "v_min": np.where(self.samples > 0, self.v_min, np.nan),
+                "t_min": self.t_min,
+                "v_max": np.where(self.samples > 0, self.v_max, np.nan),
+                "t_max": self.t_max,
+                "v_mean": self.v_sum / self.samples,
+            }
+            for (name, side), acc in self.violations.items():
+                prefix = f"range_{name.lower()}_{side}"
+                data[f"{prefix}_samples"] = acc["samples"]
+                data[f"{prefix}_time"] = acc["time"]
+                data[f"{prefix}_events"] = acc["events"]
+                data[f"{prefix}_longest"] = acc["longest"]
+                data[f"{prefix}_fraction"] = acc["time"] / self.total_time
+        return pd.DataFrame(data, index=pd.Index(self.nodes, name="node"))
+
+    def histogram_frame(self):
+        """Return the per-node histogram with one column per bin."""
+        labels = ([f"<{self.edges[0]:.3f}"]
+                  + [f"{lo:.3f}-{hi:.3f}" for lo, hi in zip(self.edges[:-1], self.edges[1:])]
+                  + [f">={self.edges[-1]:.3f}"])
+        return pd.DataFrame(self.histogram, index=pd.Index(self.nodes, name="node"), columns=labels)
+
+
+class InverterUsage:
+    """
+    Streaming per-inverter active/reactive power usage.
+
+    update(t, p, q) takes one value per inverter. Reactive energy is split
+    into injection (q > 0) and absorption (q < 0); if sbar is given, the
+    peak |q| is also reported as a fraction of the rating.
+    """
+
+    def __init__(self, nodes, sbar=None, default_dt=1.0):
+        self.nodes = list(nodes)
+        self.sbar = None if sbar is None else np.asarray(sbar, dtype=float)
+        self.default_dt = default_dt
+
+        n = len(self.nodes)
+        self.total_time = 0.0
+        self.p_energy = np.zeros(n)
+        self.q_inject_energy = np.zeros(n)
+        self.q_absorb_energy = np.zeros(n)
+        self.q_inject_time = np.zeros(n)
+        self.q_absorb_time = np.zeros(n)
+        self.q_abs_max = np.zeros(n)
+        self._t_prev = None
+
+    def update(self, t, p, q):
+        """Fold in one step of active (p) and reactive (q) injections."""
+        dt = self.default_dt if self._t_prev is None else t - self._t_prev
+        self._t_prev = t
+        p = np.asarray(p, dtype=float)
+        q = np.asarray(q, dtype=float)
+
+        self.total_time += dt
+        self.p_energy += p * dt
+        self.q_inject_energy += np.where(q > 0, q, 0.0) * dt
+        self.q_absorb_energy += np.where(q < 0, -q, 0.0) * dt
+        self.q_inject_time += (q > 0) * dt
+        self.q_absorb_time += (q < 0) * dt
+        np.maximum(self.q_abs_max, np.abs(q), out=self.q_abs_max)
+
+    def summary(self):
+        """Return a per-inverter DataFrame; energies are in kWh/kvarh."""
+        data = {
+            "p_energy_kwh": self.p_energy / 3600.0,
+            "q_inject_kvarh": self.q_inject_energy / 3600.0,
+            "q_absorb_kvarh": self.q_absorb_energy / 3600.0,
+            "q_inject_time": self.q_inject_time,
+            "q_absorb_time": self.q_absorb_time,
+            "q_abs_max": self.q_abs_max,
+        }
+        if self.sbar is not None:
+            data["q_abs_max_fraction_of_sbar"] = self.q_abs_max / self.sbar
+        return pd.DataFrame(data, index=pd.Index(self.nodes, name="node"))
+
+
+def analyze_voltage_csv(path, nodes=None, chunksize=CHUNK_SIZE, **kwargs):
+    """
+    Compute VoltageStatistics for a stored voltage timeseries in one
+    chunked pass. nodes defaults to every column except 'time'.
+    """
+    if nodes is None:
+        nodes = [c for c in pd.read_csv(path, nrows=0).columns if c != 'time']
+    stats = VoltageStatistics(nodes, **kwargs)
+    for chunk in pd.read_csv(path, usecols=['time'] + list(nodes), chunksize=chunksize):
+        stats.update(chunk['time'].to_numpy(dtype=float), chunk[nodes].to_numpy(dtype=float))
+    return stats
+
+
+if __name__ == "__main__":
+    stats = analyze_voltage_csv("voltage_timeseries.csv")
+    summary = stats.summary()
+    summary.to_csv("voltage_summary.csv")
+    stats.histogram_frame().to_csv("voltage_histogram.csv")
+    print("[Analytics] Saved 'voltage_summary.csv' and 'voltage_histogram.csv'")
+
+    violating = summary[summary["range_a_under_samples"] + summary["range_a_over_samples"] > 0]
+    print(f"[Analytics] {len(violating)} of {len(summary)} nodes leave ANSI Range A")
+    print(violating[["v_min", "v_max", "range_a_under_time", "range_a_over_time"]].to_string())
@@ -0,0 +1,163 @@
+# broker_topology.py
+
+import argparse
+import time
+import helics as h
+import numpy as np
+
+from main import close_broker
+
+# Port of the root broker on localhost (the HELICS default ZMQ port).
+# Sub-brokers get free ports assigned by the root.
+ROOT_PORT = 23404
+
+# Benchmark defaults.
+BENCHMARK_FEDERATES = (4, 16, 64)
+BENCHMARK_STEPS = 200
+
+
+class BrokerTree:
+    """
+    Root broker with one sub-broker per group of federates, on localhost.
+
+    group_sizes[g] is the number of federates that connect to sub-broker g
+    (see address()). Federates in the same group coordinate time through
+    their sub-broker; only traffic between groups passes the root.
+    BrokerTree.flat(n) is the root alone, taking n federates directly.
+    """
+
+    def __init__(self, group_sizes, root_port=ROOT_PORT, flat_federates=None):
+        self.group_sizes = list(group_sizes)
+        self.root_port = root_port
+        if flat_federates is not None:
+            self.root = h.helicsCreateBroker("zmq", "root", f"--federates={flat_federates} --port={root_port} "
+                                                            f"--loglevel=warning")
+            self.subs = []
+        else:
+            self.root = h.helicsCreateBroker("zmq", "root", f"--subbrokers={len(self.group_sizes)} "
+                                                            f"--port={root_port} --loglevel=warning")
+            self.subs = [h.helicsCreateBroker("zmq", f"sub_broker_{g}",
+                                              f"--federates={size} --broker_address=tcp://127.0.0.1:{root_port} "
+                                              f"--loglevel=warning")
+                         for g, size in enumerate(self.group_sizes)]
+        self.addresses = [h.helicsBrokerGetAddress(sub) for sub in self.subs]
+
+    @classmethod
+    def flat(cls, n_federates, root_port=ROOT_PORT):
+        """A single broker for n_federates, as start_broker() creates."""
+        return cls([], root_port, flat_federates=n_federates)
+
+    @classmethod
+    def for_federates(cls, names, groups):
+        """
+        Tree for the federates in names, where groups maps a federate name
+        to its group number. Returns the tree and each federate's broker
+        address.
+        """
+        numbers = sorted({groups[name] for name in names})
+        index = {number: g for g, number in enumerate(numbers)}
+        tree = cls([sum(1 for name in names if groups[name] == number) for number in numbers])
+        return tree, {name: tree.address(index[groups[name]]) for name in names}
+
+    def address(self, group=None):
+        """Broker address for a federate of group (the root when None)."""
+        if group is None:
+            return h.helicsBrokerGetAddress(self.root)
+        return self.addresses[group]
+
+    def close(self):
+        for sub in self.subs:
+            close_broker(sub)
+        close_broker(self.root)
+
+
+class GrantProbe:
+    """
+    Minimal value federate for the benchmark: publishes one value per step
+    and subscribes to the next probe's publication, so time grants carry
+    data dependencies as in the co-simulation.
+    """
+
+    def __init__(self, index, n_probes, broker=None, time_step=1.0):
+        fedinfo = h.helicsCreateFederateInfo()
+        h.helicsFederateInfoSetCoreName(fedinfo, f"probe_core_{index}")
+        h.helicsFederateInfoSetCoreTypeFromString(fedinfo, "zmq")
+        if broker:
+            h.helicsFederateInfoSetBroker(fedinfo, broker)
+        h.helicsFederateInfoSetTimeProperty(fedinfo, h.HELICS_PROPERTY_TIME_DELTA, time_step)
+        self.fed = h.helicsCreateValueFederate(f"probe_{index}", fedinfo)
+        self.pub = h.helicsFederateRegisterPublication(self.fed, "value", h.HELICS_DATA_TYPE_DOUBLE, "")
+        self.sub = h.helicsFederateRegisterSubscription(self.fed, f"probe_{(index + 1) % n_probes}/value", "")
+
+
+def grant_latency(n_federates, n_groups=None, steps=BENCHMARK_STEPS):
+    """
+    Step n_federates probes for steps time steps from one thread, against
+    a flat broker (n_groups None) or a tree of n_groups sub-brokers with
+    the probes spread evenly. Returns the setup time and the wall-clock
+    latency of every step (all probes granted) in seconds.
+    """
+    start = time.perf_counter()
+    if n_groups is None:
+        tree = BrokerTree.flat(n_federates)
+        groups = [None] * n_federates
+    else:
+        groups = [i * n_groups // n_federates for i in range(n_federates)]
+        tree = BrokerTree(np.bincount(groups, minlength=n_groups).tolist())
+    probes = [GrantProbe(i, n_federates, tree.address(g)) for i, g in enumerate(groups)]
+    for probe in probes:
+        h.helicsFederateEnterExecutingModeAsync(probe.fed)
+    for probe in probes:
+        h.helicsFederateEnterExecutingModeComplete(probe.fed)
+    setup_time = time.perf_counter() - start
+
+    latencies = np.empty(steps)
+    for step in range(steps):
+        step_start = time.perf_counter()
+        for probe in probes:
+            h.helicsPublicationPublishDouble(probe.pub, float(step))
+            h.helicsFederateRequestTimeAsync(probe.fed, step + 1.0)
+        for probe in probes:
+            h.helicsFederateRequestTimeComplete(probe.fed)
+        latencies[step] = time.perf_counter() - step_start
+
+    for probe in probes:
+        h.helicsFederateFinalize(probe.fed)
+        h.helicsFederateFree(probe.fed)
+    tree.close()
+    h.helicsCleanupLibrary()
+    return setup_time, latencies
+
+
+def benchmark(federate_counts=BENCHMARK_FEDERATES, group_size=None, steps=BENCHMARK_STEPS):
+    """
+    Print the grant latency of a flat broker against a broker tree as the
+    number of federates grows. group_size is the number of federates per
+    sub-broker (default: about the square root of the count).
+    """
+    print(f"Grant latency ({steps} steps, all probes driven from one thread):")
+    results = []
+    for n in federate_counts:
+        size = group_size or max(int(round(np.sqrt(n))), 1)
+        n_groups = max(-(-n // size), 1)
+        for label, groups in (("flat", None), (f"tree {n_groups}x{size}", n_groups)):
+            setup_time, latencies = grant_latency(n, groups, steps)
+            results.append({"federates": n, "topology": label, "setup_s": setup_time,
+                            "mean_ms": 1e3 * latencies.mean(),
+                            "p50_ms": 1e3 * np.percentile(latencies, 50),
+                            "p99_ms": 1e3 * np.percentile(latencies, 99),
+                            "per_federate_us": 1e6 * latencies.mean() / n})
+            r = results[-1]
+            print(f"  {n:4d} federates  {label:12s} setup={r['setup_s']:6.2f} s  step mean={r['mean_ms']:7.3f} ms  "
+                  f"p50={r['p50_ms']:7.3f} ms  p99={r['p99_ms']:7.3f} ms  "
+                  f"per federate={r['per_federate_us']:6.1f} us", flush=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark time-grant latency of flat and hierarchical brokers.")
+    parser.add_argument("--federates", type=int, nargs="+", default=list(BENCHMARK_FEDERATES))
+    parser.add_argument("--group-size", type=int, default=None, help="federates per sub-broker")
+    parser.add_argument("--steps", type=int, default=BENCHMARK_STEPS)
+    args = parser.parse_args()
+    benchmark(args.federates, args.group_size, args.steps)
@@ -12,3 +12,116 @@ TIME_STEP = 1.0        # Time step in seconds
 
 # Scaling factors for the simulation
 Sbar_scaling = 1.1
+
+# Power-flow engine used by the OpenDSS federate:
+# "exact" solves every step, "linear" uses the voltage-sensitivity surrogate.
+# The surrogate first spends 2 * loads + 2 power flows on its sensitivities,
+# so it only pays off over longer runs: on IEEE 37 with inverter feedback,
+# 104 power flows for the first 59 steps, 203 for 599 and 223 for 1799,
+# within 0.002 pu of the exact run (orchestrator.py --surrogate-report).
+POWER_FLOW_SOLVER = "exact"
+
+# Optional feeder reduction after the circuit is loaded (see
+# federates/feeder_reduction.py): None for the full model, or a list of
+# "default" (merge series segments), "dangling" (remove unloaded branch
+# ends) and "shortlines". Load buses and MONITORED_BUSES are always kept.
+FEEDER_REDUCTION = None
+MONITORED_BUSES = []
+
+# Memoize exact power-flow solutions in an LRU cache of this many entries
+# (0 disables), keyed on the load kW/kvar rounded to the resolution.
+POWER_FLOW_CACHE_SIZE = 0
+POWER_FLOW_CACHE_RESOLUTION = 0.01
+
+# Compute voltage-violation and inverter-usage statistics during the run.
+LIVE_ANALYTICS = False
+
+# Voltage monitoring (federates/voltage_monitor.py): None publishes and
+# records every node. Otherwise only the "record" nodes are recorded at
+# full resolution, the "aggregates" are computed live per time window, and
+# "exclude" drops nodes from both (shell-style node patterns), e.g.
+# MONITOR = {"record": ["701?", "727?"], "exclude": ["sourcebus*", "799r*"],
+#            "aggregates": [{"name": "feeder", "stats": ["min", "max", "mean"], "window": 60},
+#                           {"name": "lateral_711", "nodes": ["711?", "740?", "741?"], "window": 10}]}
+# Without "record" only the aggregates are kept (voltage_timeseries.csv
+# then holds just the times), as on large feeders:
+# MONITOR = {"aggregates": [{"name": "feeder", "stats": ["min", "max"], "window": 60}]}
+MONITOR = None
+
+# Event logging (event_log.py): lowest level recorded, lowest level also
+# printed to the console, and the JSON-lines log file (None keeps the
+# records in the in-memory ring buffer only).
+LOG_LEVEL = "INFO"
+LOG_CONSOLE_LEVEL = "WARN"
+LOG_FILE = "simulation_events.jsonl"
+
+# Inverter ensemble: None for a single run, or a list of member settings
+# evaluated together in one batched pass. Each member may set
+# "sbar_scaling", "lpf_m", "lpf_o", "control_setting" (five breakpoints for
+# every node), "curves" (a CONTROL_CURVES curve set for every node) or
+# "breakpoint_offset" (added to the node-specific curves), e.g.
+# ENSEMBLE = [{}, {"sbar_scaling": 1.3}, {"breakpoint_offset": 0.01, "lpf_m": 2.0}]
+ENSEMBLE = None
+
+# Inverter control curves with any number of points, overriding the
+# five-breakpoint curves of solar_VV_breakpoints.csv: None, or a dict
+# mapping node patterns ("s701a", "s7*"; the first match applies) to a
+# curve set {"volt_var": [(v, q), ...], "volt_watt": [(v, p), ...]}, with v
+# in pu, q a fraction of the available reactive power and p of the solar
+# production. A node uses only the curves in its set, e.g.
+# CONTROL_CURVES = {"s74*": {"volt_watt": [(1.06, 1.0), (1.10, 0.2)]},
+#                   "*": {"volt_var": [(0.92, 0.44), (0.98, 0.0), (1.02, 0.0), (1.08, -0.44)],
+#                         "volt_watt": [(1.06, 1.0), (1.10, 0.2)]}}
+CONTROL_CURVES = None
+
+# Inverter populations: None for one inverter per PV node, or a dict
+# describing the devices behind every node, evaluated as binned clusters
+# (federates/inverter_clusters.py): "devices", "bins", "offset_std"
+# (breakpoint spread [pu]), "sbar_sigma" (rating spread), "seed" and
+# "verify" (report the error against a per-device run at the end), e.g.
+# INVERTER_CLUSTERS = {"devices": 1000, "bins": 16, "offset_std": 0.01, "verify": True}
+INVERTER_CLUSTERS = None
+
+# Solve the ensemble members on their own OpenDSS circuit instances in
+# parallel (exact solver only), using at most CIRCUIT_WORKERS threads
+# (None: one per core).
+PARALLEL_CIRCUITS = False
+CIRCUIT_WORKERS = None
+
+# Broker topology: None for one broker, or a dict mapping each federate
+# ("consumer", "opendss", "inverter") to a group number; every group gets
+# its own sub-broker under a root broker (broker_topology.py), e.g.
+# BROKER_GROUPS = {"consumer": 0, "opendss": 0, "inverter": 1}
+BROKER_GROUPS = None
+
+# Multi-rate scheduling (orchestrator.py): None steps every federate every
+# TIME_STEP, or a dict mapping a federate ("consumer", "opendss",
+# "inverter") to its update period in seconds, or to (period, offset) to
+# sample at offset + k * period. "data" steps the consumer at the
+# resolution of the load profile. Federates left out use TIME_STEP, e.g.
+# FEDERATE_PERIODS = {"inverter": 0.1, "opendss": 5.0, "consumer": "data"}
+FEDERATE_PERIODS = None
+
+# Real-time pacing (orchestrator.py): None runs as fast as possible, or a
+# speed-up factor over wall-clock time (1.0 for real time, 10.0 for ten
+# times faster). A round released more than DEADLINE_TOLERANCE seconds
+# late is a deadline miss, logged with its slowest phase to pacing_log.csv.
+REAL_TIME_SPEEDUP = None
+DEADLINE_TOLERANCE = 0.005
+
+# Interpolation of the load and solar profiles onto the consumer's time
+# grid: "zoh" (hold the last row), "linear" or "cubic" (shape-preserving,
+# never beyond the neighbouring rows). The grid is resampled
+# PROFILE_CHUNK_STEPS points at a time.
+PROFILE_INTERPOLATION = "zoh"
+PROFILE_CHUNK_STEPS = 4096
+
+# Voltages the inverter uses between OpenDSS solutions when it steps
+# faster: "hold" keeps the last solution, "linear" extrapolates from the
+# last two solutions (for at most one solution interval).
+VOLTAGE_INTERPOLATION = "hold"
+
+# Local address and authentication key of the warm simulation server
+# (sim_server.py).
+SERVER_ADDRESS = ("localhost", 6500)
+SERVER_AUTHKEY = b"helics-sim"
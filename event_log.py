@@ -0,0 +1,214 @@
+# event_log.py
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+import config  # Import the configuration
+
+# Levels, lowest first.
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARN: "WARN", ERROR: "ERROR"}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+# Records kept in memory between flushes; the oldest are dropped on overflow.
+BUFFER_CAPACITY = 100_000
+
+# Seconds between background flushes to the log file.
+FLUSH_INTERVAL = 1.0
+
+# At most RATE_LIMIT_BURST records per (source, event, key) in any
+# RATE_LIMIT_WINDOW seconds; the rest are counted and reported later.
+RATE_LIMIT_BURST = 1
+RATE_LIMIT_WINDOW = 60.0
+
+
+def _level(value, default):
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return LEVELS[value.upper()]
+    return int(value)
+
+
+class _Writer:
+    """
+    Process-wide ring buffer of records, drained to a JSON-lines file by a
+    daemon thread. Each flush is a single append, so processes sharing a
+    file interleave whole batches of lines.
+    """
+
+    def __init__(self, path, capacity=BUFFER_CAPACITY, interval=FLUSH_INTERVAL):
+        self.path = path
+        self.buffer = deque(maxlen=capacity)
+        self.dropped = 0
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def append(self, record):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(record)
+        if self._thread is None and self.path is not None:
+            self._thread = threading.Thread(target=self._run, name="event-log-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write all buffered records to the file (no-op without a file)."""
+        if self.path is None:
+            return
+        with self._lock:
+            lines = []
+            while self.buffer:
+                lines.append(json.dumps(self.buffer.popleft()))
+            if self.dropped:
+                lines.append(json.dumps({"ts": time.time(), "level": "WARN", "source": "event_log",
+                                         "event": "records_dropped", "count": self.dropped}))
+                self.dropped = 0
+            if lines:
+                with open(self.path, "a") as f:
+                    f.write("\n".join(lines) + "\n")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+_loggers = {}
+
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                path = getattr(config, "LOG_FILE", None)
+                _writer = _Writer(os.path.abspath(path) if path else None)
+    return _writer
+
+
+class EventLog:
+    """
+    Structured, level-gated event log for one source (usually a federate).
+
+    Records are dicts with a wall-clock timestamp, level, source, event id,
+    formatted message and the keyword fields. The message is only
+    formatted once a record passes the level check and the rate limiter.
+    Hot loops should test the precomputed flags (debug_enabled,
+    info_enabled, ...) before building any arguments, so a disabled level
+    costs a single attribute lookup.
+
+    Records at or above console_level are also printed in the usual
+    "[WARN] ..." form; everything at or above level goes to the buffer.
+    """
+
+    def __init__(self, source, level=None, console_level=None):
+        self.source = source
+        self._rate = {}
+        self.set_level(_level(level, _level(getattr(config, "LOG_LEVEL", None), INFO)),
+                       _level(console_level, _level(getattr(config, "LOG_CONSOLE_LEVEL", None), WARN)))
+
+    def set_level(self, level, console_level=None):
+        self.level = level
+        if console_level is not None:
+            self.console_level = console_level
+        self.debug_enabled = level <= DEBUG
+        self.info_enabled = level <= INFO
+        self.warn_enabled = level <= WARN
+        self.error_enabled = level <= ERROR
+
+    def log(self, level, event, message, key=None, rate_limit=True, **fields):
+        """
+        Record event at level. message is a str.format template filled
+        from fields. Repeats of the same (event, key) are rate limited
+        unless rate_limit is False (for per-step trace records).
+        """
+        if level < self.level:
+            return
+        now = time.monotonic()
+        suppressed = 0
+        if rate_limit:
+            state = self._rate.get((event, key))
+            if state is None:
+                self._rate[(event, key)] = [now, 1, 0]
+            elif now - state[0] >= RATE_LIMIT_WINDOW:
+                suppressed = state[2]
+                state[:] = [now, 1, 0]
+            elif state[1] < RATE_LIMIT_BURST:
+                state[1] += 1
+            else:
+                state[2] += 1
+                return
+
+        text = message.format(**fields) if fields else message
+        if suppressed:
+            text += f" ({suppressed} similar messages suppressed)"
+        record = {"ts": time.time(), "level": LEVEL_NAMES.get(level, str(level)),
+                  "source": self.source, "event": event, "msg": text}
+        if key is not None:
+            record["key"] = key
+        if suppressed:
+            record["suppressed"] = suppressed
+        for name, value in fields.items():
+            record[name] = value if isinstance(value, (int, float, str, bool, type(None))) else str(value)
+        _get_writer().append(record)
+        if level >= self.console_level:
+            print(f"[{record['level']}] {text}")
+
+    def debug(self, event, message, key=None, rate_limit=True, **fields):
+        if self.debug_enabled:
+            self.log(DEBUG, event, message, key, rate_limit, **fields)
+
+    def info(self, event, message, key=None, rate_limit=True, **fields):
+        if self.info_enabled:
+            self.log(INFO, event, message, key, rate_limit, **fields)
+
+    def warn(self, event, message, key=None, rate_limit=True, **fields):
+        if self.warn_enabled:
+            self.log(WARN, event, message, key, rate_limit, **fields)
+
+    def error(self, event, message, key=None, rate_limit=True, **fields):
+        if self.error_enabled:
+            self.log(ERROR, event, message, key, rate_limit, **fields)
+
+    def close(self):
+        """Record the messages still held back by the rate limiter."""
+        for (event, key), (_, _, suppressed) in self._rate.items():
+            if suppressed:
+                record = {"ts": time.time(), "level": "INFO", "source": self.source,
+                          "event": event, "msg": f"{suppressed} similar messages suppressed",
+                          "suppressed": suppressed}
+                if key is not None:
+                    record["key"] = key
+                _get_writer().append(record)
+        self._rate.clear()
+
+
+def get_logger(source):
+    """Return the shared EventLog for source."""
+    with _writer_lock:
+        if source not in _loggers:
+            _loggers[source] = EventLog(source)
+        return _loggers[source]
+
+
+def flush():
+    """Close all loggers and write the buffer to the log file now."""
+    for logger in _loggers.values():
+        logger.close()
+    if _writer is not None:
+        _writer.flush()
+
+
+atexit.register(flush)
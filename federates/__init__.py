@@ -1,5 +1,6 @@
 # federates/__init__.py
 
-from .opendss_federate import run_opendss_federate
-from .voltage_consumer_federate import run_voltage_consumer_federate
-from .inverter_federate import run_inverter_federate
+from .opendss_federate import run_opendss_federate, OpenDSSFederate
+from .voltage_consumer_federate import run_voltage_consumer_federate, VoltageConsumerFederate
+from .inverter_federate import run_inverter_federate, InverterFederate
+from .circuit_pool import CircuitPool
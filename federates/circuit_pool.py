@@ -0,0 +1,162 @@
+# federates/circuit_pool.py
+
+# numpy has to be loaded before the OpenDSS engine: with the engine loaded
+# first, solving from a worker thread crashes the interpreter.
+import numpy as np
+from opendssdirect import dss
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from event_log import get_logger
+from .linear_surrogate import get_voltage_keys, apply_loads
+from .feeder_reduction import reduce_feeder
+
+log = get_logger("Circuit_Pool")
+
+
+class CircuitPool:
+    """
+    Independent OpenDSS circuit instances solved concurrently.
+
+    Every instance is its own engine context (dss.NewContext()) holding a
+    copy of one feeder, including its control state such as regulator
+    taps, so ensemble members, scenarios or different feeders never share
+    a solution. Solves run on a thread pool; the engine releases the GIL
+    while solving, so the instances spread over the available cores.
+    Results are returned per instance, in dss_files order, and
+    converged[k] tells whether instance k's last solve converged to finite
+    voltages. With a list of reduction options every instance is reduced
+    after loading, as in feeder_reduction.reduce_feeder().
+    """
+
+    def __init__(self, dss_files, workers=None, reduction=None, keep_buses=()):
+        if not hasattr(dss, "NewContext"):
+            raise RuntimeError("Parallel circuits need OpenDSSDirect.py 0.9 or newer (dss.NewContext)")
+        # Contexts used from several threads must not change the process's
+        # working directory.
+        dss.Basic.AllowChangeDir(False)
+
+        self.engines = []
+        self.load_names = []
+        self.voltage_keys = []
+        for path in dss_files:
+            engine = dss.NewContext()
+            engine.Command(f"Redirect {os.path.abspath(path)}")
+            if reduction:
+                reduce_feeder(keep_buses, reduction, engine)
+            self.engines.append(engine)
+            self.load_names.append(engine.Loads.AllNames())
+            self.voltage_keys.append(get_voltage_keys(engine))
+
+        self.converged = np.ones(len(self.engines), dtype=bool)
+        self.workers = min(workers or os.cpu_count() or 1, len(self.engines))
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="opendss")
+        self.solve_count = 0
+        self.solve_time = 0.0
+        log.info("pool_created", "Loaded {n_instances} circuit instances on {workers} worker threads",
+                 n_instances=len(self.engines), workers=self.workers)
+
+    def __len__(self):
+        return len(self.engines)
+
+    def _solve_one(self, k, kw, kvar):
+        engine = self.engines[k]
+        if kw is not None:
+            apply_loads(self.load_names[k], kw, kvar, engine)
+        engine.Solution.Solve()
+        voltages = np.asarray(engine.Circuit.AllBusMagPu())
+        self.converged[k] = engine.Solution.Converged() and np.isfinite(voltages).all()
+        if not self.converged[k]:
+            log.warn("not_converged", "Power flow of instance {instance} did not converge",
+                     key=k, instance=k)
+        return voltages
+
+    def solve(self, kw=None, kvar=None, instances=None):
+        """
+        Apply kw[k] and kvar[k] (in load_names[k] order) to instance k and
+        solve all instances concurrently. A None entry, or kw=None, leaves
+        that instance's loads as they are. Returns one |V| vector in pu per
+        instance, in voltage_keys[k] order. With instances (a number n),
+        only the first n instances are solved and kw/kvar cover just those.
+        """
+        start = time.perf_counter()
+        n_instances = len(self.engines) if instances is None else instances
+        kw = [None] * n_instances if kw is None else kw
+        kvar = [None] * n_instances if kvar is None else kvar
+        futures = [self.executor.submit(self._solve_one, k, kw[k], kvar[k]) for k in range(n_instances)]
+        voltages = [future.result() for future in futures]
+        self.solve_count += 1
+        self.solve_time += time.perf_counter() - start
+        return voltages
+
+    @staticmethod
+    def reinitialize(engine):
+        """
+        Discard engine's solution so its next solve starts flat, e.g. after
+        it diverged (a diverged solution is otherwise the starting point of
+        every later solve).
+        """
+        engine.Command("Set Mode=Snap")
+
+    def map(self, fn, args=None):
+        """
+        Run fn(engine, arg) for every instance concurrently, e.g. to edit a
+        scenario's circuit, and return the results in instance order.
+        """
+        args = [None] * len(self.engines) if args is None else args
+        futures = [self.executor.submit(fn, engine, arg) for engine, arg in zip(self.engines, args)]
+        return [future.result() for future in futures]
+
+    def summary(self):
+        return {
+            "instances": len(self.engines),
+            "workers": self.workers,
+            "solves": self.solve_count,
+            "mean_solve_ms": 1e3 * self.solve_time / max(self.solve_count, 1),
+        }
+
+    def close(self):
+        self.executor.shutdown()
+        for engine in self.engines:
+            engine.Basic.ClearAll()
+        self.engines = []
+
+
+if __name__ == "__main__":
+    import sys
+    import config
+
+    # Time N instances solved one after another on the shared engine
+    # against the same solves spread over a CircuitPool.
+    n_instances = int(sys.argv[1]) if len(sys.argv) > 1 else (os.cpu_count() or 1)
+    steps = int(config.SIMULATION_TIME / config.TIME_STEP)
+    feeder = f"{config.DATA_DIR}/ieee37.dss"
+
+    dss.Command(f"Redirect {feeder}")
+    names = dss.Loads.AllNames()
+    base_kw = np.empty(len(names))
+    base_kvar = np.empty(len(names))
+    for j, name in enumerate(names):
+        dss.Loads.Name(name)
+        base_kw[j] = dss.Loads.kW()
+        base_kvar[j] = dss.Loads.kvar()
+    rng = np.random.default_rng(0)
+    scale = rng.uniform(0.5, 1.5, (steps, n_instances, len(names)))
+
+    start = time.perf_counter()
+    for t in range(steps):
+        for k in range(n_instances):
+            apply_loads(names, base_kw * scale[t, k], base_kvar * scale[t, k])
+            dss.Solution.Solve()
+            dss.Circuit.AllBusMagPu()
+    sequential = time.perf_counter() - start
+
+    pool = CircuitPool([feeder] * n_instances)
+    start = time.perf_counter()
+    for t in range(steps):
+        pool.solve(list(base_kw * scale[t]), list(base_kvar * scale[t]))
+    parallel = time.perf_counter() - start
+    pool.close()
+
+    print(f"{n_instances} instances x {steps} steps on {pool.workers} worker threads:")
+    print(f"  sequential: {sequential:.2f} s  pool: {parallel:.2f} s  speed-up: {sequential / parallel:.2f}x")
@@ -0,0 +1,112 @@
+# federates/control_curves.py
+
+from fnmatch import fnmatchcase
+import numpy as np
+
+# Control functions of an inverter, each a piecewise-linear curve of the
+# filtered voltage [pu]:
+#   volt_var   reactive power as a fraction of the available reactive power
+#              (positive: injection, negative: absorption)
+#   volt_watt  active power as a fraction of the solar production
+CURVES = ("volt_var", "volt_watt")
+
+# Constant curves of a function a node does not use.
+DISABLED = {"volt_var": ([1.0], [0.0]), "volt_watt": ([1.0], [1.0])}
+
+
+def legacy_curves(breakpoints):
+    """
+    Curves of the five-breakpoint setting [v1, ..., v5], as the original
+    control law applies it: full reactive injection up to v1, a dead band
+    v2..v3 and full absorption from v4. Production is full up to v4, drops
+    to zero just above it, rises linearly back to full at v5 and is zero
+    above v5 (vertical steps are repeated voltages).
+    """
+    v1, v2, v3, v4, v5 = (float(v) for v in breakpoints)
+    return {"volt_var": ([v1, v2, v3, v4], [1.0, 0.0, 0.0, -1.0]),
+            "volt_watt": ([v4, v4, v5, v5], [1.0, 0.0, 1.0, 0.0])}
+
+
+def check_curves(curves, node="*"):
+    """
+    Normalize a curve set ({"volt_var": points, "volt_watt": points}, where
+    points is a list of (v, y) pairs) to a list of voltages and a list of
+    values per function. Missing functions are disabled, so the keys
+    present are the node's curve type.
+    """
+    unknown = sorted(set(curves) - set(CURVES))
+    if unknown:
+        raise ValueError(f"Unknown control curves {unknown} for node '{node}'")
+    checked = {}
+    for name in CURVES:
+        points = curves.get(name)
+        if points is None:
+            checked[name] = DISABLED[name]
+            continue
+        if len(points) == 0 or any(len(point) != 2 for point in points):
+            raise ValueError(f"Curve {name} of node '{node}' needs a non-empty list of (v, y) points")
+        v = [float(point[0]) for point in points]
+        y = [float(point[1]) for point in points]
+        if np.any(np.diff(v) < 0):
+            raise ValueError(f"Curve {name} of node '{node}' has decreasing voltages: {v}")
+        checked[name] = (v, y)
+    return checked
+
+
+def match_curves(keys, spec):
+    """
+    Curve sets of config.CONTROL_CURVES for the node keys: spec maps
+    shell-style node patterns to curve sets and the first matching pattern
+    applies (case-insensitive). Returns {key: curves} for matched keys.
+    """
+    matched = {}
+    for pattern, curves in (spec or {}).items():
+        checked = check_curves(curves, pattern)
+        for key in keys:
+            if key not in matched and fnmatchcase(key, pattern.lower()):
+                matched[key] = checked
+    return matched
+
+
+def compile_tables(curve_sets, name):
+    """
+    Pack curve name of curve_sets (S members x N nodes of checked curve
+    sets) into lookup tables with a common number of points K: voltages,
+    values and the slopes of the segments starting at each point, all
+    S x N x K. Every curve repeats its last point up to K, at least once,
+    so the padding segments have zero width and slope, and the last
+    segment holds the last value.
+    """
+    n_members, n_nodes = len(curve_sets), len(curve_sets[0])
+    n_points = 1 + max(len(curves[name][0]) for member in curve_sets for curves in member)
+    v_table = np.empty((n_members, n_nodes, n_points))
+    y_table = np.empty((n_members, n_nodes, n_points))
+    for k, member in enumerate(curve_sets):
+        for i, curves in enumerate(member):
+            v, y = curves[name]
+            v_table[k, i, :len(v)] = v
+            v_table[k, i, len(v):] = v[-1]
+            y_table[k, i, :len(y)] = y
+            y_table[k, i, len(y):] = y[-1]
+    width = np.diff(v_table, axis=-1)
+    slope = np.zeros((n_members, n_nodes, n_points))
+    np.divide(np.diff(y_table, axis=-1), width, out=slope[..., :-1], where=width > 0)
+    return v_table, y_table, slope
+
+
+def interpolate(v_table, y_table, slope, v):
+    """
+    Evaluate the packed curves at v (one voltage per curve, shaped like the
+    tables without their last axis). Values are held beyond the first and
+    last points; at a breakpoint the lower segment applies, so a vertical
+    step takes its upper value just above the breakpoint.
+    """
+    v = np.asarray(v, dtype=float)
+    n_points = v_table.shape[-1]
+    # Segment of each voltage: the last one starting below it, as an
+    # index into the flattened tables (one gather per table).
+    segment = np.clip((v_table < v[..., np.newaxis]).sum(axis=-1) - 1, 0, n_points - 2)
+    index = np.arange(v.size).reshape(v.shape) * n_points + segment
+    v_flat = v_table.reshape(-1)
+    v0 = v_flat[index]
+    return y_table.reshape(-1)[index] + slope.reshape(-1)[index] * (np.clip(v, v0, v_flat[index + 1]) - v0)
@@ -0,0 +1,136 @@
+# federates/feeder_reduction.py
+
+import numpy as np
+from opendssdirect import dss
+import os
+import time
+from .linear_surrogate import get_voltage_keys, apply_loads
+
+# Reduction parameters.
+METER_NAME = "feeder_reduction"  # EnergyMeter added when the circuit has none
+SHORT_LINE_ZMAG = 0.1            # |Z| [ohm] below which "shortlines" merges a line
+DEFAULT_OPTIONS = ("default", "dangling")
+
+
+def load_buses(engine=dss):
+    """Return the names of all buses with a load connected."""
+    buses = set()
+    for name in engine.Loads.AllNames():
+        engine.Circuit.SetActiveElement(f"Load.{name}")
+        buses.add(engine.CktElement.BusNames()[0].split('.')[0].lower())
+    return buses
+
+
+def circuit_size(engine=dss):
+    """Return the number of buses, nodes and enabled lines of the circuit."""
+    n_lines = 0
+    for name in engine.Lines.AllNames():
+        engine.Circuit.SetActiveElement(f"Line.{name}")
+        n_lines += engine.CktElement.Enabled()
+    return {"buses": len(engine.Circuit.AllBusNames()), "nodes": engine.Circuit.NumNodes(), "lines": n_lines}
+
+
+def reduce_feeder(keep_buses=(), options=DEFAULT_OPTIONS, engine=dss):
+    """
+    Reduce the active circuit in place with OpenDSS's circuit reduction.
+
+    Every bus with a load (which also carries the PV injections) and every
+    bus in keep_buses is kept. options is a sequence of:
+      "default"    merge series line segments through unkept buses
+      "dangling"   remove branches ending without a load or kept bus
+      "shortlines" merge lines with |Z| below SHORT_LINE_ZMAG
+    Returns the circuit size before and after.
+    """
+    before = circuit_size(engine)
+    keep = sorted(load_buses(engine) | {bus.lower() for bus in keep_buses})
+
+    # The reduction works on energy meter zones.
+    if engine.Meters.Count() == 0:
+        engine.PDElements.First()
+        engine.Command(f"New EnergyMeter.{METER_NAME} element={engine.PDElements.Name()} terminal=1")
+    engine.Command(f"Set KeepList=({' '.join(keep)})")
+    engine.Solution.Solve()
+
+    steps = {"default": engine.ReduceCkt.DoDefault, "dangling": engine.ReduceCkt.DoDangling,
+             "shortlines": engine.ReduceCkt.DoShortLines}
+    engine.ReduceCkt.KeepLoad(True)
+    engine.ReduceCkt.Zmag(SHORT_LINE_ZMAG)
+    for option in options:
+        if option not in steps:
+            raise ValueError(f"Unknown reduction option '{option}'")
+        steps[option]()
+    engine.Solution.Solve()
+    return {"before": before, "after": circuit_size(engine)}
+
+
+def reduction_report(path, keep_buses=(), options=DEFAULT_OPTIONS, n_samples=200, seed=0):
+    """
+    Compare the reduced feeder against the full one on n_samples random
+    load scalings (0.5 to 1.5 of nameplate, per load). Both models are
+    compiled in their own engine contexts, so the shared circuit is left
+    alone. The speed-up covers the solves only, not setting the loads;
+    voltage errors are taken over the nodes both models have.
+    """
+    full = dss.NewContext()
+    reduced = dss.NewContext()
+    for engine in (full, reduced):
+        engine.Command(f"Redirect {os.path.abspath(path)}")
+    sizes = reduce_feeder(keep_buses, options, reduced)
+
+    names = full.Loads.AllNames()
+    if reduced.Loads.AllNames() != names:
+        raise RuntimeError("The reduction changed the loads")
+    base_kw = np.empty(len(names))
+    base_kvar = np.empty(len(names))
+    for j, name in enumerate(names):
+        full.Loads.Name(name)
+        base_kw[j] = full.Loads.kW()
+        base_kvar[j] = full.Loads.kvar()
+
+    full_keys = get_voltage_keys(full)
+    reduced_keys = get_voltage_keys(reduced)
+    full_index = {key: i for i, key in enumerate(full_keys)}
+    common = [(full_index[key], i) for i, key in enumerate(reduced_keys) if key in full_index]
+    full_cols = np.array([c[0] for c in common], dtype=int)
+    reduced_cols = np.array([c[1] for c in common], dtype=int)
+
+    rng = np.random.default_rng(seed)
+    scale = rng.uniform(0.5, 1.5, (n_samples, len(names)))
+    elapsed = {}
+    voltages = {}
+    for label, engine in (("full", full), ("reduced", reduced)):
+        out = []
+        elapsed[label] = 0.0
+        for k in range(n_samples):
+            apply_loads(names, base_kw * scale[k], base_kvar * scale[k], engine)
+            start = time.perf_counter()
+            engine.Solution.Solve()
+            out.append(engine.Circuit.AllBusMagPu())
+            elapsed[label] += time.perf_counter() - start
+        voltages[label] = np.array(out)
+
+    error = np.abs(voltages["full"][:, full_cols] - voltages["reduced"][:, reduced_cols])
+    for engine in (full, reduced):
+        engine.Basic.ClearAll()
+    return {
+        "options": list(options),
+        "buses": f"{sizes['before']['buses']} -> {sizes['after']['buses']}",
+        "nodes": f"{sizes['before']['nodes']} -> {sizes['after']['nodes']}",
+        "lines": f"{sizes['before']['lines']} -> {sizes['after']['lines']}",
+        "removed_nodes": sorted(set(full_keys) - set(reduced_keys)),
+        "speedup": elapsed["full"] / elapsed["reduced"],
+        "full_solve_ms": 1e3 * elapsed["full"] / n_samples,
+        "reduced_solve_ms": 1e3 * elapsed["reduced"] / n_samples,
+        "max_abs_error": float(error.max()) if error.size else 0.0,
+        "mean_abs_error": float(error.mean()) if error.size else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    import config
+
+    options = getattr(config, "FEEDER_REDUCTION", None) or DEFAULT_OPTIONS
+    report = reduction_report(f"{config.DATA_DIR}/ieee37.dss", getattr(config, "MONITORED_BUSES", ()), options)
+    print("Feeder reduction report:")
+    for key, value in report.items():
+        print(f"  {key}: {value}")
@@ -0,0 +1,218 @@
+# federates/inverter_clusters.py
+
+import time
+import numpy as np
+from event_log import get_logger
+from .control_curves import CURVES
+from .inverter_federate import SOLAR_MIN_VALUE, calculate_injections_batch, initialize_ensemble_state
+
+log = get_logger("Inverter_Clusters")
+
+# Population parameters.
+DEFAULT_DEVICES = 1000     # Devices behind each PV node
+DEFAULT_BINS = 8           # Breakpoint-offset bins per node
+DEFAULT_OFFSET_STD = 0.01  # Standard deviation of the device breakpoint offsets [pu]
+DEFAULT_SBAR_SIGMA = 0.3   # Log-normal sigma of the device ratings
+MAX_BINS = 256             # Upper limit when refining the bins to a tolerance
+
+
+def sample_population(n_nodes, n_devices=DEFAULT_DEVICES, offset_std=DEFAULT_OFFSET_STD,
+                      sbar_sigma=DEFAULT_SBAR_SIGMA, seed=0):
+    """
+    Draw the device population of every node. Returns offsets (N x D),
+    added to all the voltages of the node's curves, and weights (N x D),
+    each device's share of the node's rating and solar production (every
+    row sums to 1). A single device per node is the node's own inverter,
+    so its offset is zero whatever offset_std is.
+    """
+    rng = np.random.default_rng(seed)
+    if n_devices == 1:
+        offset_std = 0.0
+    offsets = rng.normal(0.0, offset_std, (n_nodes, n_devices))
+    ratings = rng.lognormal(0.0, sbar_sigma, (n_nodes, n_devices))
+    return offsets, ratings / ratings.sum(axis=1, keepdims=True)
+
+
+class InverterClusters:
+    """
+    Binned representation of the inverter population behind each node.
+
+    Every node's devices are grouped into n_bins equal-width bins of their
+    breakpoint offset. A bin acts as one inverter with the bin's total
+    share of the node's rating and solar production and the share-weighted
+    mean offset. The control law is linear in rating and production for
+    given breakpoints, and every device of a node sees the same voltage,
+    so the only approximation is the offset spread within a bin; with one
+    bin per device (per_device()) the result is the device-level model.
+
+    The batched control law runs over N x B clusters: expand_settings()
+    and expand() map node arrays onto clusters, reduce() sums the cluster
+    injections back per node. Per-step cost depends on the number of
+    clusters, not devices.
+    """
+
+    def __init__(self, offsets, weights, n_bins=DEFAULT_BINS):
+        offsets = np.asarray(offsets, dtype=float)
+        weights = np.asarray(weights, dtype=float)
+        self.population = (offsets, weights)
+        n_nodes = offsets.shape[0]
+        self.n_bins = n_bins
+        self.n_devices = offsets.shape[1]
+        self.share = np.zeros((n_nodes, n_bins))
+        self.offset = np.zeros((n_nodes, n_bins))
+        self.width = np.zeros(n_nodes)
+        for i in range(n_nodes):
+            low, high = offsets[i].min(), offsets[i].max()
+            self.width[i] = (high - low) / n_bins
+            bins = np.minimum(((offsets[i] - low) / max(self.width[i], 1e-12)).astype(int), n_bins - 1)
+            self.share[i] = np.bincount(bins, weights=weights[i], minlength=n_bins)
+            weighted = np.bincount(bins, weights=weights[i] * offsets[i], minlength=n_bins)
+            centers = low + (np.arange(n_bins) + 0.5) * self.width[i]
+            self.offset[i] = np.where(self.share[i] > 0, weighted / np.maximum(self.share[i], 1e-300), centers)
+
+    @classmethod
+    def from_spec(cls, n_nodes, spec):
+        """Sample and bin a population as described by config.INVERTER_CLUSTERS."""
+        offsets, weights = sample_population(n_nodes, spec.get("devices", DEFAULT_DEVICES),
+                                             spec.get("offset_std", DEFAULT_OFFSET_STD),
+                                             spec.get("sbar_sigma", DEFAULT_SBAR_SIGMA), spec.get("seed", 0))
+        return cls(offsets, weights, spec.get("bins", DEFAULT_BINS))
+
+    @classmethod
+    def per_device(cls, offsets, weights):
+        """One cluster per device: the device-level reference."""
+        clusters = cls.__new__(cls)
+        clusters.population = (offsets, weights)
+        clusters.offset = np.asarray(offsets, dtype=float)
+        clusters.share = np.asarray(weights, dtype=float)
+        clusters.n_devices = clusters.n_bins = clusters.offset.shape[1]
+        clusters.width = np.zeros(clusters.offset.shape[0])
+        return clusters
+
+    @property
+    def n_clusters(self):
+        return self.share.size
+
+    def expand_settings(self, settings):
+        """Cluster settings from node settings (see build_ensemble_settings)."""
+        n_members = settings['sbar'].shape[0]
+        expanded = {
+            'sbar': (settings['sbar'][:, :, np.newaxis] * self.share).reshape(n_members, self.n_clusters),
+            'lpf_m': settings['lpf_m'],
+            'lpf_o': settings['lpf_o'],
+        }
+        # The bin offsets shift the curve voltages; values and slopes are
+        # the node's.
+        for name in CURVES:
+            for part in ('v', 'y', 'slope'):
+                table = settings[f'{name}_{part}'][:, :, np.newaxis, :]
+                if part == 'v':
+                    table = table + self.offset[np.newaxis, :, :, np.newaxis]
+                table = np.broadcast_to(table, table.shape[:2] + (self.n_bins, table.shape[-1]))
+                expanded[f'{name}_{part}'] = table.reshape(n_members, self.n_clusters, -1)
+        return expanded
+
+    def initial_state(self, n_members):
+        return initialize_ensemble_state(n_members, self.n_clusters)
+
+    def expand(self, values, scale=False):
+        """
+        Map node values (N or S x N) onto the clusters; with scale, split
+        them by the clusters' shares (solar production).
+        """
+        values = np.asarray(values, dtype=float)[..., np.newaxis]
+        values = values * self.share if scale else np.broadcast_to(values, values.shape[:-1] + (self.n_bins,))
+        return values.reshape(values.shape[:-2] + (self.n_clusters,))
+
+    def reduce(self, values):
+        """Sum cluster values (S x N*B) per node."""
+        values = np.asarray(values)
+        return values.reshape(values.shape[:-1] + (-1, self.n_bins)).sum(axis=-1)
+
+    def step(self, state, voltages, solar, settings, delta_t=1.0, solar_min=SOLAR_MIN_VALUE):
+        """
+        One step of the control law for all clusters. voltages is S x N,
+        solar N or S x N and settings the expanded settings. The solar
+        threshold applies to the node's production, as for one inverter.
+        Returns the node injections (p, q), each S x N.
+        """
+        p, q = calculate_injections_batch(state, self.expand(voltages), self.expand(solar, scale=True), settings,
+                                          delta_t=delta_t, solar_min=solar_min * self.share.reshape(-1))
+        return self.reduce(p), self.reduce(q)
+
+    def summary(self):
+        return {"nodes": self.share.shape[0], "devices_per_node": self.n_devices, "bins": self.n_bins,
+                "clusters": self.n_clusters, "max_bin_width_pu": float(self.width.max())}
+
+
+def cluster_error(clusters, reference, settings, voltages, solar, delta_t=1.0):
+    """
+    Run clusters and the per-device reference over the same voltage and
+    solar traces (T x N) with node settings for one member, and return the
+    largest injection error per node relative to the node's rating, for p
+    and q, with the time per step of both.
+    """
+    runs = {}
+    for label, model in (("clusters", clusters), ("reference", reference)):
+        expanded = model.expand_settings(settings)
+        state = model.initial_state(1)
+        p_out = np.empty(voltages.shape)
+        q_out = np.empty(voltages.shape)
+        start = time.perf_counter()
+        for t in range(len(voltages)):
+            p, q = model.step(state, voltages[t][np.newaxis], solar[t], expanded, delta_t)
+            p_out[t] = p[0]
+            q_out[t] = q[0]
+        runs[label] = (p_out, q_out, (time.perf_counter() - start) / len(voltages))
+
+    sbar = settings['sbar'][0]
+    return {
+        "p_error": np.abs(runs["clusters"][0] - runs["reference"][0]).max(axis=0) / sbar,
+        "q_error": np.abs(runs["clusters"][1] - runs["reference"][1]).max(axis=0) / sbar,
+        "cluster_step_ms": 1e3 * runs["clusters"][2],
+        "reference_step_ms": 1e3 * runs["reference"][2],
+    }
+
+
+def fit_clusters(offsets, weights, settings, voltages, solar, tolerance, n_bins=DEFAULT_BINS, delta_t=1.0):
+    """
+    Double the bins, starting from n_bins, until the largest error against
+    the per-device reference over the traces is within tolerance (a
+    fraction of the node rating). Returns the clusters and their errors.
+    """
+    reference = InverterClusters.per_device(offsets, weights)
+    while True:
+        clusters = InverterClusters(offsets, weights, n_bins)
+        error = cluster_error(clusters, reference, settings, voltages, solar, delta_t)
+        worst = max(error["p_error"].max(), error["q_error"].max())
+        if worst <= tolerance or n_bins >= MAX_BINS:
+            if worst > tolerance:
+                log.warn("tolerance_not_met", "Error {error} above tolerance {tolerance} at {bins} bins",
+                         error=worst, tolerance=tolerance, bins=n_bins)
+            return clusters, error
+        n_bins *= 2
+
+
+if __name__ == "__main__":
+    import sys
+    from .inverter_federate import DEFAULT_CONTROL_SETTING, S_BAR, build_ensemble_settings
+
+    # Compare the binned model against the per-device reference on a
+    # voltage trace sweeping the whole control curve.
+    n_devices = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DEVICES
+    n_nodes, steps = 30, 300
+    nodes = [f"n{i}" for i in range(n_nodes)]
+    settings = build_ensemble_settings([{}], nodes, {}, {})
+    t = np.arange(steps)[:, np.newaxis]
+    voltages = 1.03 + 0.05 * np.sin(2 * np.pi * t / steps + np.linspace(0, np.pi, n_nodes))
+    solar = np.broadcast_to(0.8 * S_BAR * np.abs(np.sin(np.pi * t / steps)), (steps, n_nodes))
+    offsets, weights = sample_population(n_nodes, n_devices)
+    reference = InverterClusters.per_device(offsets, weights)
+
+    print(f"{n_nodes} nodes x {n_devices} devices, curve {DEFAULT_CONTROL_SETTING}, {steps} steps:")
+    for n_bins in (1, 4, 8, 16, 32):
+        clusters = InverterClusters(offsets, weights, n_bins)
+        error = cluster_error(clusters, reference, settings, voltages, solar)
+        print(f"  {n_bins:3d} bins: max |dp| {100 * error['p_error'].max():.3f}%  "
+              f"max |dq| {100 * error['q_error'].max():.3f}% of rating  "
+              f"step {error['cluster_step_ms']:.3f} ms (per device: {error['reference_step_ms']:.3f} ms)")
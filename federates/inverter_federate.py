@@ -1,9 +1,14 @@
 import helics as h 
 import time
-import math
 from collections import deque
 import numpy as np
 import config  # Import the configuration
+from analytics import InverterUsage
+from event_log import get_logger
+from .control_curves import CURVES, compile_tables, check_curves, interpolate, legacy_curves, match_curves
+from .node_registry import NodeRegistry, get_registry
+
+log = get_logger("Inverter_Federate")
 
 # Control parameters for inverter/PV device logic.
 DEFAULT_CONTROL_SETTING = [0.98, 1.01, 1.02, 1.05, 1.07]
@@ -13,110 +18,330 @@ S_BAR = 200.0                    # Default apparent power rating (SBAR)
 SOLAR_MIN_VALUE = 5.0            # Minimum solar irradiance threshold
 DELTA_T = 1.0                    # Default time step
 
-def initialize_node_state():
-    """Initialize and return a state dictionary for one node."""
-    state = {
-        'p_set': deque([0, 0], maxlen=2),
-        'q_set': deque([0, 0], maxlen=2),
-        'p_out': deque([0, 0], maxlen=2),
-        'q_out': deque([0, 0], maxlen=2),
+def initialize_ensemble_state(n_members, n_nodes):
+    """
+    Initialize the state of an ensemble as S x N arrays. 'p_set'/'q_set'
+    hold the previous set points, the others the latest filter outputs.
+    """
+    shape = (n_members, n_nodes)
+    return {
+        'p_set': np.zeros(shape),
+        'q_set': np.zeros(shape),
+        'p_out': np.zeros(shape),
+        'q_out': np.zeros(shape),
         # Low-pass filtered voltage; initialize with nominal voltage (1.0 pu)
-        'lpf_v': deque([1.0, 1.0], maxlen=2)
+        'lpf_v': np.ones(shape),
     }
-    return state
-
-def calculate_injection_for_node(state, current_time, measured_voltage, measured_solar,
-                                 delta_t=DELTA_T,
-                                 control_setting=DEFAULT_CONTROL_SETTING,
-                                 lpf_m=LOW_PASS_FILTER_MEASURE,
-                                 lpf_o=LOW_PASS_FILTER_OUTPUT,
-                                 Sbar=S_BAR,
-                                 solar_min=SOLAR_MIN_VALUE):
+
+def build_ensemble_settings(members, node_names, node_breakpoints, node_sbar, curve_spec=None):
     """
-    Compute active (p) and reactive (q) power injections.
-    
-    Applies a low-pass filter to the voltage and uses the inverter control curve.
-    Active injections are returned as positive numbers, and the node‐specific
-    SBAR (apparent power rating) is applied.
+    Build the per-member settings arrays of an ensemble.
+
+    Every node's control curves come from curve_spec (config.CONTROL_CURVES,
+    see control_curves.match_curves), else from its entry in
+    node_breakpoints, else from DEFAULT_CONTROL_SETTING. Each member is a
+    dict that may set 'sbar_scaling', 'lpf_m', 'lpf_o', 'control_setting'
+    (five breakpoints used for every node), 'curves' (a curve set used for
+    every node) and 'breakpoint_offset' (added to the curve voltages);
+    anything not set falls back to the single-run defaults.
+
+    Returns a dict with the packed curve tables '<curve>_v', '<curve>_y'
+    and '<curve>_slope' (S x N x K) of every curve in control_curves.CURVES,
+    sbar (S x N), lpf_m and lpf_o (S x 1).
+    """
+    keys = [node.lower() for node in node_names]
+    matched = match_curves(keys, curve_spec if curve_spec is not None else getattr(config, "CONTROL_CURVES", None))
+    default_curves = legacy_curves(DEFAULT_CONTROL_SETTING)
+    base_curves = [matched.get(key, node_breakpoints.get(key, default_curves)) for key in keys]
+    base_sbar = np.array([node_sbar.get(key, S_BAR) for key in keys], dtype=float)
+
+    curve_sets = []
+    sbar = np.empty((len(members), len(keys)))
+    lpf_m = np.empty((len(members), 1))
+    lpf_o = np.empty((len(members), 1))
+    for k, member in enumerate(members):
+        if 'curves' in member:
+            curves = [check_curves(member['curves'])] * len(keys)
+        elif 'control_setting' in member:
+            curves = [legacy_curves(member['control_setting'])] * len(keys)
+        else:
+            curves = base_curves
+        offset = member.get('breakpoint_offset', 0.0)
+        if offset:
+            curves = [{name: ([v + offset for v in node[name][0]], node[name][1]) for name in CURVES}
+                      for node in curves]
+        curve_sets.append(curves)
+        sbar[k] = base_sbar * member.get('sbar_scaling', config.Sbar_scaling)
+        lpf_m[k] = member.get('lpf_m', LOW_PASS_FILTER_MEASURE)
+        lpf_o[k] = member.get('lpf_o', LOW_PASS_FILTER_OUTPUT)
+
+    settings = {'sbar': sbar, 'lpf_m': lpf_m, 'lpf_o': lpf_o}
+    for name in CURVES:
+        settings[f'{name}_v'], settings[f'{name}_y'], settings[f'{name}_slope'] = compile_tables(curve_sets, name)
+    return settings
+
+def calculate_injections_batch(state, measured_voltage, measured_solar, settings,
+                               delta_t=DELTA_T, solar_min=SOLAR_MIN_VALUE):
+    """
+    Batched control law for S members x N nodes.
+
+    measured_voltage is S x N, measured_solar is N (shared) or S x N.
+    Filters the voltage (trapezoidal low-pass, coefficient lpf_m) and
+    evaluates the packed Volt-Watt and Volt-VAR tables of settings at the
+    filtered voltage: p is the production scaled by the Volt-Watt curve,
+    q the reactive power left next to p scaled by the Volt-VAR curve. The
+    set points then pass the output filter (coefficient lpf_o). With the
+    five-breakpoint curves (control_curves.legacy_curves) this is the
+    original control law. Returns (p_out, q_out) as S x N arrays.
+    """
+    v = np.asarray(measured_voltage, dtype=float)
+    solar = np.broadcast_to(np.asarray(measured_solar, dtype=float), v.shape)
+    sbar = settings['sbar']
+    m = settings['lpf_m']
+    o = settings['lpf_o']
+
+    vkm1 = state['lpf_v']
+    lpf_v = (delta_t * m * (v + vkm1) - (delta_t * m - 2) * vkm1) / (2 + delta_t * m)
+
+    active = solar >= solar_min
+    watt = interpolate(settings['volt_watt_v'], settings['volt_watt_y'], settings['volt_watt_slope'], lpf_v)
+    var = interpolate(settings['volt_var_v'], settings['volt_var_y'], settings['volt_var_slope'], lpf_v)
+    pk = np.where(active, solar * watt, 0.0)
+    qk = np.where(active, np.sqrt(np.maximum(sbar**2 - pk**2, 0)) * var, 0.0)
+
+    p_out = (delta_t * o * (pk + state['p_set']) - (delta_t * o - 2) * state['p_out']) / (2 + delta_t * o)
+    q_out = (delta_t * o * (qk + state['q_set']) - (delta_t * o - 2) * state['q_out']) / (2 + delta_t * o)
+    state['p_set'] = pk
+    state['q_set'] = qk
+    state['p_out'] = p_out
+    state['q_out'] = q_out
+    state['lpf_v'] = lpf_v
+    return p_out, q_out
+
+class InverterFederate:
+    """
+    Inverter federate with its per-step work split out of the time loop, so
+    it can be driven by run_inverter_federate() or by the single-loop
+    orchestrator.
+
+    before_request(t) reads the latest voltages and solar production,
+    computes and publishes the injections for time t. There is no work
+    after a time grant.
+
+    With an ensemble (a list of member settings, see
+    build_ensemble_settings; defaults to config.ENSEMBLE) all members are
+    evaluated in one batched pass over S x N arrays. Their injections are
+    published on "injections_ensemble" and member 0 is also published on
+    "injections" as in a single run.
+
+    A single run is evaluated the same way, as an ensemble of one member.
+    Voltages are looked up by position through the node registry.
+
+    When the inverter steps faster than OpenDSS solves, it holds the last
+    solution's voltages, or with config.VOLTAGE_INTERPOLATION "linear"
+    extrapolates them from the last two solutions (see sampled_voltages).
     """
 
-    vk = measured_voltage
-    vkm1 = state['lpf_v'][-1]
-    solar_irr = measured_solar
+    name = "Inverter_Federate"
+
+    def __init__(self, node_names, time_step=1.0, breakpoints_df=None, sbar_df=None, ensemble=None,
+                 registry=None, broker=None):
+        self.node_names = node_names
+        self.node_keys = [node.lower() for node in node_names]
+        self.delta_t = time_step
+
+        fedinfo = h.helicsCreateFederateInfo()
+        h.helicsFederateInfoSetCoreName(fedinfo, self.name)
+        h.helicsFederateInfoSetCoreTypeFromString(fedinfo, "zmq")
+        if broker:
+            # Address of the (sub-)broker to join; see broker_topology.py.
+            h.helicsFederateInfoSetBroker(fedinfo, broker)
+        h.helicsFederateInfoSetTimeProperty(fedinfo, h.HELICS_PROPERTY_TIME_DELTA, self.delta_t)
+
+        self.fed = h.helicsCreateValueFederate(self.name, fedinfo)
+        self.pub = h.helicsFederateRegisterPublication(self.fed, "injections", h.HELICS_DATA_TYPE_STRING, "")
+
+        self.voltage_sub = h.helicsFederateRegisterSubscription(self.fed, "OpenDSS_Federate/voltage_out", "")
+        self.solar_sub = h.helicsFederateRegisterSubscription(self.fed, "Voltage_Consumer_Federate/solar", "")
+
+        self.node_breakpoints = load_node_breakpoints(breakpoints_df)
+        self.node_sbar = load_node_sbar(sbar_df)
+
+        # Position of the voltage node each inverter measures.
+        self.registry = get_registry() if registry is None else registry
+        self.voltage_columns = self.registry.voltage_positions(self.node_keys)
+        self.interpolation = getattr(config, "VOLTAGE_INTERPOLATION", "hold")
+        if self.interpolation not in ("hold", "linear"):
+            raise ValueError(f"Unknown voltage interpolation '{self.interpolation}'")
+        self.voltage_samples = deque(maxlen=2)
+
+        if ensemble is None:
+            ensemble = getattr(config, "ENSEMBLE", None)
+        self.ensemble = bool(ensemble)
+        members = ensemble or [{}]
+        self.ensemble_settings = build_ensemble_settings(
+            members, node_names, self.node_breakpoints, self.node_sbar)
+        self.ensemble_state = initialize_ensemble_state(len(members), len(node_names))
+
+        # Inverter populations behind each node, evaluated as binned clusters.
+        self.clusters = None
+        cluster_spec = getattr(config, "INVERTER_CLUSTERS", None)
+        if cluster_spec:
+            # Imported here, since inverter_clusters builds on this module.
+            from .inverter_clusters import InverterClusters
+            self.clusters = InverterClusters.from_spec(len(node_names), cluster_spec)
+            self.node_settings = self.ensemble_settings
+            self.ensemble_settings = self.clusters.expand_settings(self.node_settings)
+            self.ensemble_state = self.clusters.initial_state(len(members))
+            self.cluster_trace = [] if cluster_spec.get("verify") else None
+            print(f"[Inverter Federate] Inverter clusters: {self.clusters.summary()}")
+        if self.ensemble:
+            self.ensemble_pub = h.helicsFederateRegisterPublication(
+                self.fed, "injections_ensemble", h.HELICS_DATA_TYPE_STRING, "")
+            self.voltage_ensemble_sub = h.helicsFederateRegisterSubscription(
+                self.fed, "OpenDSS_Federate/voltage_ensemble", "")
+
+        # Count the number of nodes that use the default SBAR value.
+        default_sbar_count = sum(1 for node in node_names if node.lower() not in self.node_sbar)
+        print(f"Number of nodes using default SBAR value: {default_sbar_count} out of {len(node_names)}")
 
-    low_pass_filter_v = (delta_t * lpf_m * (vk + vkm1) - (delta_t * lpf_m - 2) * state['lpf_v'][-1]) / (2 + delta_t * lpf_m)
+        # Live reactive-power usage statistics.
+        self.usage = None
+        if getattr(config, "LIVE_ANALYTICS", False):
+            self.usage = InverterUsage(
+                self.node_keys,
+                sbar=[self.node_sbar.get(node.lower(), S_BAR) * config.Sbar_scaling for node in node_names],
+                default_dt=self.delta_t)
+
+    def before_request(self, current_time):
+        """Compute and publish the injections for current_time."""
+        # Reading the input clears its update flag, so check it first.
+        voltage_updated = h.helicsInputIsUpdated(self.voltage_sub)
+        voltage_str = h.helicsInputGetString(self.voltage_sub)
+        try:
+            voltage_data = eval(voltage_str) if voltage_str.strip().startswith('{') else {}
+        except Exception as e:
+            log.error("parse_failed", "Failed to parse voltage data: {error}", key="voltage", error=e)
+            voltage_data = {}
+
+        solar_str = h.helicsInputGetString(self.solar_sub)
+        try:
+            solar_data = eval(solar_str) if solar_str.strip().startswith('{') else {}
+        except Exception as e:
+            log.error("parse_failed", "Failed to parse solar production data: {error}", key="solar", error=e)
+            solar_data = {}
 
-    pk = 0.0
-    qk = 0.0
-    if solar_irr >= solar_min:
-        #print("low_pass_filter_v", low_pass_filter_v)
-        if low_pass_filter_v <= control_setting[4]:
-            pk = solar_irr  # Active injection taken as positive.
+        if self.ensemble:
+            voltages = self.ensemble_voltages(voltage_data)
+        else:
+            voltages = self.measured_voltages(voltage_data)[np.newaxis]
+        if self.interpolation == "linear":
+            voltages = self.sampled_voltages(current_time, voltages, voltage_updated)
+        solar = NodeRegistry.values(solar_data, self.node_keys, 0.0)
+        if self.clusters is None:
+            p, q = calculate_injections_batch(self.ensemble_state, voltages, solar, self.ensemble_settings,
+                                              delta_t=self.delta_t, solar_min=SOLAR_MIN_VALUE)
+        else:
+            p, q = self.clusters.step(self.ensemble_state, voltages, solar, self.ensemble_settings,
+                                      delta_t=self.delta_t, solar_min=SOLAR_MIN_VALUE)
+            if self.cluster_trace is not None:
+                self.cluster_trace.append((voltages[0], solar))
+        if self.ensemble:
+            h.helicsPublicationPublishString(
+                self.ensemble_pub, str({"nodes": self.node_keys, "p": p.tolist(), "q": q.tolist()}))
+
+        # Member 0 is the single run.
+        injections = {key: {"p": pk, "q": qk} for key, pk, qk in zip(self.node_keys, p[0].tolist(), q[0].tolist())}
+        h.helicsPublicationPublishString(self.pub, str(injections))
+        if self.usage is not None:
+            self.usage.update(current_time, p[0], q[0])
+
+    def measured_voltages(self, voltage_data):
+        """
+        Return the voltage every inverter measures, from a voltage payload;
+        1.0 pu where its node has no voltage.
+        """
+        v = self.registry.values(voltage_data, self.registry.voltage_keys)
+        found = self.voltage_columns >= 0
+        measured = np.ones(len(self.node_keys))
+        measured[found] = v[self.voltage_columns[found]]
+        measured[np.isnan(measured)] = 1.0
+        return measured
+
+    def sampled_voltages(self, current_time, voltages, updated):
+        """
+        Linearly extrapolate the voltages to current_time from the last two
+        OpenDSS solutions, for at most one solution interval past the last
+        one (first-order hold). voltages are the latest solution's, taken
+        as a new sample when updated.
+        """
+        if updated:
+            self.voltage_samples.append((h.helicsInputLastUpdateTime(self.voltage_sub), voltages))
+        if len(self.voltage_samples) < 2:
+            return voltages
+        (t0, v0), (t1, v1) = self.voltage_samples
+        if t1 <= t0:
+            return v1
+        fraction = min(max((current_time - t1) / (t1 - t0), 0.0), 1.0)
+        return v1 + fraction * (v1 - v0)
+
+    def ensemble_voltages(self, voltage_data):
+        """
+        Return the S x N measured voltages. Uses the voltage ensemble once
+        OpenDSS has published one, otherwise member 0's voltages for all.
+        """
+        n_members = self.ensemble_state['lpf_v'].shape[0]
+        voltage_str = h.helicsInputGetString(self.voltage_ensemble_sub)
+        if voltage_str.strip().startswith('{'):
             try:
-                q_avail = math.sqrt(max(Sbar**2 - pk**2, 0))
-            except Exception:
-                q_avail = 0.0
-
-            #print(f"Control setting: 0:{control_setting[0]}, 1: {control_setting[1]}, 2: {control_setting[2]}, 3: {control_setting[3]}, 4: {control_setting[4]}")
-            if low_pass_filter_v <= control_setting[0]:
-                qk = q_avail
-            elif control_setting[0] < low_pass_filter_v <= control_setting[1]:
-                c = q_avail / (control_setting[1] - control_setting[0])
-                qk = c * (control_setting[1] - low_pass_filter_v)
-            elif control_setting[1] < low_pass_filter_v <= control_setting[2]:
-                qk = 0.0
-            elif control_setting[2] < low_pass_filter_v <= control_setting[3]:
-                c = q_avail / (control_setting[3] - control_setting[2])
-                qk = -c * (low_pass_filter_v - control_setting[2])
-            elif control_setting[3] < low_pass_filter_v < control_setting[4]:
-                d = solar_irr / (control_setting[4] - control_setting[3])
-                pk = d * (low_pass_filter_v - control_setting[3])
-                try:
-                    qk = -math.sqrt(max(Sbar**2 - pk**2, 0))
-                except Exception:
-                    qk = 0.0
-        elif low_pass_filter_v >= control_setting[4]:
-            pk = 0.0
-            qk = -Sbar
-
-    state['p_set'].append(pk)
-    state['q_set'].append(qk)
-    p_out_new = (delta_t * LOW_PASS_FILTER_OUTPUT * (state['p_set'][-1] + state['p_set'][-2])
-                 - (delta_t * LOW_PASS_FILTER_OUTPUT - 2) * state['p_out'][-1]) / (2 + delta_t * LOW_PASS_FILTER_OUTPUT)
-    q_out_new = (delta_t * LOW_PASS_FILTER_OUTPUT * (state['q_set'][-1] + state['q_set'][-2])
-                 - (delta_t * LOW_PASS_FILTER_OUTPUT - 2) * state['q_out'][-1]) / (2 + delta_t * LOW_PASS_FILTER_OUTPUT)
-    state['p_out'].append(p_out_new)
-    state['q_out'].append(q_out_new)
-    state['lpf_v'].append(low_pass_filter_v)
-    
-    return solar_irr, p_out_new, q_out_new
+                payload = eval(voltage_str)
+                if payload['keys'] != self.registry.voltage_keys:
+                    raise ValueError("voltage keys do not match the node registry")
+                rows = np.asarray(payload['v'], dtype=float)
+                if rows.shape[0] == n_members:
+                    found = self.voltage_columns >= 0
+                    voltages = np.ones((n_members, len(self.node_keys)))
+                    voltages[:, found] = rows[:, self.voltage_columns[found]]
+                    return voltages
+                log.warn("ensemble_mismatch", "Voltage ensemble has {got} members, expected {expected}",
+                         got=rows.shape[0], expected=n_members)
+            except Exception as e:
+                log.error("parse_failed", "Failed to parse voltage ensemble: {error}", key="voltage_ensemble", error=e)
 
-def run_inverter_federate(node_names, simulation_time=30, time_step=1.0,
-                          breakpoints_df=None, sbar_df=None):
+        return np.tile(self.measured_voltages(voltage_data), (n_members, 1))
+
+    def after_grant(self, granted_time):
+        """Nothing to do after a time grant."""
+
+    def finalize(self):
+        h.helicsFederateFinalize(self.fed)
+        print("[Inverter Federate] Finalized.")
+
+        if self.clusters is not None and self.cluster_trace:
+            from .inverter_clusters import InverterClusters, cluster_error
+            reference = InverterClusters.per_device(*self.clusters.population)
+            error = cluster_error(self.clusters, reference, {key: value[:1] for key, value in self.node_settings.items()},
+                                  np.array([v for v, _ in self.cluster_trace]),
+                                  np.array([solar for _, solar in self.cluster_trace]), self.delta_t)
+            print(f"[Inverter Federate] Cluster error against the per-device reference: "
+                  f"max |dp| {100 * error['p_error'].max():.3f}%, max |dq| {100 * error['q_error'].max():.3f}% "
+                  f"of node rating ({error['cluster_step_ms']:.3f} ms vs {error['reference_step_ms']:.3f} ms per step)")
+
+        if self.usage is not None:
+            try:
+                self.usage.summary().to_csv("inverter_usage_summary.csv")
+                print("[Inverter Federate] Saved reactive-power usage to 'inverter_usage_summary.csv'")
+            except Exception as e:
+                print(f"[ERROR] Could not save inverter usage: {e}")
+
+
+def load_node_breakpoints(breakpoints_df):
     """
-    Run the inverter federate using node-specific control breakpoints and SBAR values.
-    If a node's breakpoints or SBAR value are not provided, the default values are used.
+    Build the mapping of node-specific control curves from the wide
+    breakpoints file (one column of five breakpoints per node; see
+    control_curves.legacy_curves). Curves with other numbers of points are
+    given in config.CONTROL_CURVES.
     """
-    delta_t = time_step
-    
-    fedinfo = h.helicsCreateFederateInfo()
-    h.helicsFederateInfoSetCoreName(fedinfo, "Inverter_Federate")
-    h.helicsFederateInfoSetCoreTypeFromString(fedinfo, "zmq")
-    h.helicsFederateInfoSetTimeProperty(fedinfo, h.HELICS_PROPERTY_TIME_DELTA, delta_t)
-    
-    fed = h.helicsCreateValueFederate("Inverter_Federate", fedinfo)
-    pub = h.helicsFederateRegisterPublication(fed, "injections", h.HELICS_DATA_TYPE_STRING, "")
-    
-    voltage_sub = h.helicsFederateRegisterSubscription(fed, "OpenDSS_Federate/voltage_out", "")
-    solar_sub = h.helicsFederateRegisterSubscription(fed, "Voltage_Consumer_Federate/solar", "")
-    
-    h.helicsFederateEnterExecutingMode(fed)
-    
-    # Initialize state for each node.
-    node_states = {node.lower(): initialize_node_state() for node in node_names}
-    
-    # Build mapping for node-specific breakpoint settings.
-        # Build mapping for node-specific breakpoint settings.
     node_breakpoints = {}
     if breakpoints_df is not None:
         # Since the file is wide (node names as columns and five rows), use this branch:
@@ -127,17 +352,22 @@ def run_inverter_federate(node_names, simulation_time=30, time_step=1.0,
                 # Get the five breakpoint values from the column.
                 settings = breakpoints_df[col].dropna().tolist()
                 if len(settings) == 5:
-                    node_breakpoints[col] = [float(x) for x in settings]
+                    node_breakpoints[col] = legacy_curves(settings)
                 else:
-                    print(f"[WARN] Column '{col}' does not have exactly 5 entries; got: {settings}")
+                    log.warn("invalid_breakpoints", "Column '{node}' does not have 5 breakpoints (got {settings}); "
+                             "give N-point curves in config.CONTROL_CURVES",
+                             key=col, node=col, settings=settings)
             except Exception as e:
-                print(f"[WARN] Invalid breakpoint values for node '{col}': {e}")
+                log.warn("invalid_breakpoints", "Invalid breakpoint values for node '{node}': {error}",
+                         key=col, node=col, error=e)
+
+        log.info("breakpoints_loaded", "Loaded node-specific breakpoints for {count} nodes",
+                 count=len(node_breakpoints), breakpoints=node_breakpoints)
+    return node_breakpoints
 
-        # Debug: print loaded breakpoints.
-        print("Loaded node-specific breakpoints:")
-        for node, settings in node_breakpoints.items():
-            print(f"  {node}: {settings}")
-    # Build mapping for node-specific SBAR values.
+
+def load_node_sbar(sbar_df):
+    """Build the mapping of node-specific SBAR values."""
     node_sbar = {}
     if sbar_df is not None:
         # If the DataFrame has just one row, use that row.
@@ -146,7 +376,7 @@ def run_inverter_federate(node_names, simulation_time=30, time_step=1.0,
                 try:
                     node_sbar[col.strip().lower()] = float(value)
                 except Exception as e:
-                    print(f"[WARN] Invalid SBAR value for node '{col}': {e}")
+                    log.warn("invalid_sbar", "Invalid SBAR value for node '{node}': {error}", key=col, node=col, error=e)
         else:
             if "node" in sbar_df.columns:
                 for _, row in sbar_df.iterrows():
@@ -154,69 +384,36 @@ def run_inverter_federate(node_names, simulation_time=30, time_step=1.0,
                     try:
                         node_sbar[node_name] = float(row['sbar'])
                     except Exception as e:
-                        print(f"[WARN] Invalid SBAR value for node '{node_name}': {e}")
-    
-    # Count the number of nodes that use the default SBAR value.
-    default_sbar_count = sum(1 for node in node_names if node.lower() not in node_sbar)
-    print(f"Number of nodes using default SBAR value: {default_sbar_count} out of {len(node_names)}")
-    
+                        log.warn("invalid_sbar", "Invalid SBAR value for node '{node}': {error}",
+                                 key=node_name, node=node_name, error=e)
+    return node_sbar
+
+
+def run_inverter_federate(node_names, simulation_time=30, time_step=1.0,
+                          breakpoints_df=None, sbar_df=None):
+    """
+    Run the inverter federate using node-specific control breakpoints and SBAR values.
+    If a node's breakpoints or SBAR value are not provided, the default values are used.
+    """
+    federate = InverterFederate(node_names, time_step, breakpoints_df, sbar_df)
+    h.helicsFederateEnterExecutingMode(federate.fed)
+
     current_time = 0
     while current_time < simulation_time:
-        # Retrieve voltage data.
-        voltage_timeout = 0
-        while not h.helicsInputIsUpdated(voltage_sub) and voltage_timeout < 100:
+        # Wait for voltage and solar production data.
+        timeout = 0
+        while not h.helicsInputIsUpdated(federate.voltage_sub) and timeout < 100:
             time.sleep(0.01)
-            voltage_timeout += 1
-        voltage_str = h.helicsInputGetString(voltage_sub)
-        try:
-            voltage_data = eval(voltage_str) if voltage_str.strip().startswith('{') else {}
-        except Exception as e:
-            print(f"[ERROR] Failed to parse voltage data: {e}")
-            voltage_data = {}
-        
-        # Retrieve solar production data.
-        solar_timeout = 0
-        while not h.helicsInputIsUpdated(solar_sub) and solar_timeout < 100:
+            timeout += 1
+        timeout = 0
+        while not h.helicsInputIsUpdated(federate.solar_sub) and timeout < 100:
             time.sleep(0.01)
-            solar_timeout += 1
-        solar_str = h.helicsInputGetString(solar_sub)
-        try:
-            solar_data = eval(solar_str) if solar_str.strip().startswith('{') else {}
-        except Exception as e:
-            print(f"[ERROR] Failed to parse solar production data: {e}")
-            solar_data = {}
-        
-        injections = {}
-        for node in node_names:
-            key = node.lower()
-            control_setting = node_breakpoints.get(key, DEFAULT_CONTROL_SETTING)
-            sbar_value = node_sbar.get(key, S_BAR)*config.Sbar_scaling
-            # Get measured voltage.
-            if key not in voltage_data and key.startswith('s'):
-                measured_voltage = voltage_data.get(key[1:], 1.0)
-            else:
-                measured_voltage = voltage_data.get(key, 1.0)
-            # Get measured solar.
-            measured_solar = solar_data.get(key, 0.0)
-            
-            state = node_states[key]
-            solar_irr, p_injection, q_injection = calculate_injection_for_node(
-                state, current_time, measured_voltage, measured_solar,
-                delta_t=delta_t,
-                control_setting=control_setting,
-                lpf_m=LOW_PASS_FILTER_MEASURE,
-                lpf_o=LOW_PASS_FILTER_OUTPUT,
-                Sbar=sbar_value,
-                solar_min=SOLAR_MIN_VALUE,
-            )
-            injections[key] = {"p": p_injection, "q": q_injection}
-        
-        h.helicsPublicationPublishString(pub, str(injections))
-        
-        next_time = current_time + delta_t
-        granted_time = h.helicsFederateRequestTime(fed, next_time)
+            timeout += 1
+
+        federate.before_request(current_time)
+
+        next_time = current_time + time_step
+        granted_time = h.helicsFederateRequestTime(federate.fed, next_time)
         current_time = granted_time
 
-    
-    h.helicsFederateFinalize(fed)
-    print("[Inverter Federate] Finalized.")
+    federate.finalize()
@@ -0,0 +1,346 @@
+# federates/linear_surrogate.py
+
+import numpy as np
+from opendssdirect import dss
+
+# Surrogate parameters.
+PERTURBATION_KW = 1.0        # kW step used to measure dV/dP
+PERTURBATION_KVAR = 1.0      # kvar step used to measure dV/dQ
+ERROR_BOUND = 0.002          # Max tolerated |V_exact - V_estimate| [pu]
+# Max predicted |dV| from the last exact solution [pu] before a step is
+# solved exactly. The estimate's error grows with the change it predicts;
+# 2.5 error bounds kept the closed-loop error on the IEEE 37 feeder within
+# ERROR_BOUND (orchestrator.py --surrogate-report), wider bands did not.
+MAX_PREDICTED_DV = 2.5 * ERROR_BOUND
+VERIFY_INTERVAL = 60         # Surrogate steps between verification solves
+REFRESH_MISSES = 3           # Verifications in a row above ERROR_BOUND (taps unmoved) before a rebuild
+
+# OpenDSS control mode that disables the control loop (e.g. regulator taps).
+CONTROLS_OFF = -1
+
+
+def get_voltage_keys(engine=dss):
+    """
+    Return the node keys of the active circuit in the order used by
+    dss.Circuit.AllBusMagPu() (bus name plus phase letter, e.g. '701a').
+    engine is the OpenDSS context to read (default: the shared one).
+    """
+    keys = []
+    for bus in engine.Circuit.AllBusNames():
+        engine.Circuit.SetActiveBus(bus)
+        for i in range(engine.Bus.NumNodes()):
+            keys.append(bus.lower() + chr(ord('a') + i))
+    return keys
+
+
+def apply_loads(load_names, kw, kvar, engine=dss):
+    """Write the kW/kvar vectors to the OpenDSS loads in load_names order."""
+    for name, p, q in zip(load_names, kw, kvar):
+        engine.Loads.Name(name)
+        engine.Loads.kW(float(p))
+        engine.Loads.kvar(float(q))
+
+
+def get_regulator_taps(engine=dss):
+    """Return the tap number of every RegControl, in AllNames() order."""
+    taps = []
+    for name in engine.RegControls.AllNames():
+        engine.RegControls.Name(name)
+        taps.append(engine.RegControls.TapNumber())
+    return taps
+
+
+def set_regulator_taps(taps, engine=dss):
+    """Restore tap numbers returned by get_regulator_taps()."""
+    for name, tap in zip(engine.RegControls.AllNames(), taps):
+        engine.RegControls.Name(name)
+        engine.RegControls.TapNumber(tap)
+
+
+def regulator_bands(keys, engine=dss):
+    """
+    Return (nodes, vreg, half_band): the position in keys of the node each
+    RegControl senses, and its set point and half bandwidth in pu of that
+    node. A regulator moves its taps once the sensed voltage leaves
+    vreg +/- half_band. Regulators with line-drop compensation, or whose
+    node is not in keys (e.g. reduced away), are left out.
+    """
+    nodes, vreg, half_band = [], [], []
+    for name in engine.RegControls.AllNames():
+        engine.RegControls.Name(name)
+        if engine.RegControls.ForwardR() or engine.RegControls.ForwardX():
+            continue
+        bus = engine.RegControls.MonitoredBus()
+        if not bus:
+            engine.Circuit.SetActiveElement(f"Transformer.{engine.RegControls.Transformer()}")
+            bus = engine.CktElement.BusNames()[engine.RegControls.Winding() - 1]
+        bus, _, phases = bus.lower().partition(".")
+        key = bus + chr(ord('a') + int(phases.split(".")[0] or 1) - 1)
+        if key not in keys:
+            continue
+        engine.Circuit.SetActiveBus(bus)
+        volts_per_pu = 1000 * engine.Bus.kVBase() / engine.RegControls.PTRatio()
+        nodes.append(keys.index(key))
+        vreg.append(engine.RegControls.ForwardVreg() / volts_per_pu)
+        half_band.append(engine.RegControls.ForwardBand() / 2 / volts_per_pu)
+    return np.array(nodes, dtype=int), np.array(vreg), np.array(half_band)
+
+
+def solve_exact(load_names, kw, kvar):
+    """Apply the load vectors, run a full power flow and return |V| in pu."""
+    apply_loads(load_names, kw, kvar)
+    dss.Solution.Solve()
+    return np.asarray(dss.Circuit.AllBusMagPu())
+
+
+def build_sensitivity_matrices(load_names, kw, kvar,
+                               delta_kw=PERTURBATION_KW,
+                               delta_kvar=PERTURBATION_KVAR):
+    """
+    Measure dV/dP and dV/dQ around the operating point (kw, kvar) by
+    perturbing each load in turn.
+
+    The operating point is solved with the controls active, and its
+    regulator taps are part of it: the perturbation solves run with the
+    controls off, so a perturbation never moves a tap.
+
+    Returns (v0, dv_dp, dv_dq, taps) where v0 has one entry per circuit
+    node, the matrices have one column per load and taps are the
+    regulator taps of the operating point.
+    """
+    kw = np.asarray(kw, dtype=float)
+    kvar = np.asarray(kvar, dtype=float)
+    v0 = solve_exact(load_names, kw, kvar)
+    taps = get_regulator_taps()
+    dv_dp = np.empty((v0.size, len(load_names)))
+    dv_dq = np.empty((v0.size, len(load_names)))
+
+    control_mode = dss.Solution.ControlMode()
+    dss.Solution.ControlMode(CONTROLS_OFF)
+    try:
+        for j, name in enumerate(load_names):
+            # Setting kW rescales kvar at the load's power factor, so kvar
+            # is written back to keep the perturbation to P alone.
+            dss.Loads.Name(name)
+            dss.Loads.kW(kw[j] + delta_kw)
+            dss.Loads.kvar(kvar[j])
+            dss.Solution.Solve()
+            dv_dp[:, j] = (np.asarray(dss.Circuit.AllBusMagPu()) - v0) / delta_kw
+            dss.Loads.kW(kw[j])
+            dss.Loads.kvar(kvar[j])
+
+            dss.Loads.kvar(kvar[j] + delta_kvar)
+            dss.Solution.Solve()
+            dv_dq[:, j] = (np.asarray(dss.Circuit.AllBusMagPu()) - v0) / delta_kvar
+            dss.Loads.kvar(kvar[j])
+    finally:
+        dss.Solution.ControlMode(control_mode)
+        set_regulator_taps(taps)
+
+    # Leave the circuit solved at the linearization point.
+    dss.Solution.Solve()
+    return v0, dv_dp, dv_dq, taps
+
+
+class LinearVoltageSurrogate:
+    """
+    Linearized power flow around an operating point:
+
+        V ~= v0 + dV/dP (P - P0) + dV/dQ (Q - Q0)
+
+    Every estimate is one matrix-vector product. A full solve is triggered
+    when the predicted voltage change leaves the linear band, when a
+    regulator would change taps or every verify_interval steps, and its
+    solution becomes the new operating point (v0, P0, Q0 and the
+    regulator taps). If the taps stayed put, the solve also corrects the
+    sensitivities with a rank-one (Broyden) update at no extra cost; only
+    refresh_misses verifications in a row above error_bound rebuild them.
+
+    Building the sensitivities takes 2 * loads + 2 power flows, so the
+    surrogate only pays off over longer runs. On the IEEE 37 feeder with
+    inverter feedback it needed 104 power flows for the first 59 steps,
+    203 for 599 and 223 for 1799 (an exact run: one per step).
+    """
+
+    def __init__(self, load_names,
+                 error_bound=ERROR_BOUND,
+                 max_predicted_dv=MAX_PREDICTED_DV,
+                 verify_interval=VERIFY_INTERVAL,
+                 delta_kw=PERTURBATION_KW,
+                 delta_kvar=PERTURBATION_KVAR,
+                 refresh_misses=REFRESH_MISSES):
+        self.load_names = list(load_names)
+        self.error_bound = error_bound
+        self.max_predicted_dv = max_predicted_dv
+        self.verify_interval = verify_interval
+        self.refresh_misses = refresh_misses
+        self.delta_kw = delta_kw
+        self.delta_kvar = delta_kvar
+
+        self.keys = get_voltage_keys()
+        self.reg_nodes, self.reg_vreg, self.reg_half_band = regulator_bands(self.keys)
+        self.kw0 = None
+        self.kvar0 = None
+        self.v0 = None
+        self.taps0 = None
+        self.reg_outside0 = None  # Regulators already out of band at the operating point
+        self.sensitivity = None   # [dV/dP | dV/dQ], shape (nodes, 2 * loads)
+        self.steps_since_verify = 0
+        self.misses = 0
+
+        # Counters for the accuracy report.
+        self.n_estimates = 0
+        self.n_exact_solves = 0
+        self.n_refreshes = 0
+        self.verify_errors = []
+
+    def refresh(self, kw, kvar):
+        """Relinearize around (kw, kvar)."""
+        self.kw0 = np.asarray(kw, dtype=float).copy()
+        self.kvar0 = np.asarray(kvar, dtype=float).copy()
+        self.v0, dv_dp, dv_dq, self.taps0 = build_sensitivity_matrices(
+            self.load_names, self.kw0, self.kvar0,
+            delta_kw=self.delta_kw, delta_kvar=self.delta_kvar)
+        self.sensitivity = np.hstack([dv_dp, dv_dq])
+        self.reg_outside0 = self.out_of_band(self.v0)
+        self.steps_since_verify = 0
+        self.misses = 0
+        self.n_refreshes += 1
+
+    def estimate(self, kw, kvar):
+        """Return the linear voltage estimate without any error checks."""
+        delta = np.concatenate([np.asarray(kw, dtype=float) - self.kw0,
+                                np.asarray(kvar, dtype=float) - self.kvar0])
+        return self.v0 + self.sensitivity @ delta
+
+    def update(self, kw, kvar, residual):
+        """
+        Broyden rank-one update for the exact change from the operating
+        point to (kw, kvar): afterwards estimate(kw, kvar) is off by
+        residual less, and directions orthogonal to the change keep their
+        sensitivities.
+        """
+        delta = np.concatenate([np.asarray(kw, dtype=float) - self.kw0,
+                                np.asarray(kvar, dtype=float) - self.kvar0])
+        norm = delta @ delta
+        if norm > 0:
+            self.sensitivity += np.outer(residual, delta / norm)
+
+    def anchor(self, kw, kvar, voltages, taps):
+        """Move the expansion point to an exact solution, keeping the sensitivities."""
+        self.kw0 = np.asarray(kw, dtype=float).copy()
+        self.kvar0 = np.asarray(kvar, dtype=float).copy()
+        self.v0 = np.asarray(voltages, dtype=float).copy()
+        self.taps0 = list(taps)
+        self.reg_outside0 = self.out_of_band(self.v0)
+
+    def out_of_band(self, voltages, margin=0.0):
+        """Whether each regulator's sensed voltage is outside its band narrowed by margin."""
+        return np.abs(voltages[self.reg_nodes] - self.reg_vreg) > self.reg_half_band - margin
+
+    def solve(self, kw, kvar):
+        """
+        Return |V| in pu for the given load vectors, using the linear
+        estimate when it is trusted and a full solve otherwise.
+        """
+        if self.sensitivity is None:
+            self.refresh(kw, kvar)
+            return self.v0.copy()
+
+        v_est = self.estimate(kw, kvar)
+        self.steps_since_verify += 1
+        predicted_dv = np.max(np.abs(v_est - self.v0))
+        # Leaving a regulator's band would move its taps, which the linear
+        # model cannot follow; an estimate within error_bound of the band
+        # edge may be on either side of it.
+        taps_move = np.any(self.out_of_band(v_est, self.error_bound) & ~self.reg_outside0)
+        if predicted_dv <= self.max_predicted_dv and not taps_move \
+                and self.steps_since_verify < self.verify_interval:
+            self.n_estimates += 1
+            return v_est
+
+        v_exact = solve_exact(self.load_names, kw, kvar)
+        taps = get_regulator_taps()
+        self.n_exact_solves += 1
+        self.steps_since_verify = 0
+        error = float(np.max(np.abs(v_exact - v_est)))
+        self.verify_errors.append(error)
+        if taps != self.taps0:
+            # A tap change is a new operating point of the same linear model.
+            self.misses = 0
+        else:
+            self.update(kw, kvar, v_exact - v_est)
+            self.misses = self.misses + 1 if error > self.error_bound else 0
+            if self.misses >= self.refresh_misses:
+                # The updates do not keep up, so the sensitivities are off.
+                self.refresh(kw, kvar)
+                return v_exact
+        self.anchor(kw, kvar, v_exact, taps)
+        return v_exact
+
+    def summary(self):
+        """Return a dict of counters and verification errors."""
+        errors = np.asarray(self.verify_errors)
+        return {
+            "estimates": self.n_estimates,
+            "exact_solves": self.n_exact_solves,
+            "refreshes": self.n_refreshes,
+            # A refresh solves the operating point, two perturbations per
+            # load and the operating point again.
+            "power_flow_solves": self.n_exact_solves + self.n_refreshes * (2 * len(self.load_names) + 2),
+            "max_verify_error": float(errors.max()) if errors.size else 0.0,
+            "mean_verify_error": float(errors.mean()) if errors.size else 0.0,
+        }
+
+
+def accuracy_report(load_names, kw_profiles, kvar_profiles, **surrogate_kwargs):
+    """
+    Compare the surrogate against the exact solver over a sequence of
+    operating points (arrays shaped steps x loads). The operating points
+    are fixed, so nothing reacts to the estimates; see
+    orchestrator.surrogate_report() for the closed co-simulation loop.
+
+    Every step is solved with both engines, so the reported errors cover
+    the steps the surrogate answered from its linear model. Returns a dict
+    with the error statistics and the surrogate counters.
+    """
+    kw_profiles = np.asarray(kw_profiles, dtype=float)
+    kvar_profiles = np.asarray(kvar_profiles, dtype=float)
+    surrogate = LinearVoltageSurrogate(load_names, **surrogate_kwargs)
+
+    errors = np.empty(len(kw_profiles))
+    for k, (kw, kvar) in enumerate(zip(kw_profiles, kvar_profiles)):
+        v_est = surrogate.solve(kw, kvar)
+        v_exact = solve_exact(load_names, kw, kvar)
+        errors[k] = np.max(np.abs(v_exact - v_est))
+
+    report = surrogate.summary()
+    report.update({
+        "steps": len(errors),
+        "max_abs_error": float(errors.max()),
+        "mean_abs_error": float(errors.mean()),
+        "p99_abs_error": float(np.percentile(errors, 99)),
+    })
+    return report
+
+
+if __name__ == "__main__":
+    import config
+
+    # Accuracy report on a randomized walk around the nameplate loads.
+    dss.Command(f"Redirect {config.DATA_DIR}/ieee37.dss")
+    names = dss.Loads.AllNames()
+    base_kw = np.empty(len(names))
+    base_kvar = np.empty(len(names))
+    for j, name in enumerate(names):
+        dss.Loads.Name(name)
+        base_kw[j] = dss.Loads.kW()
+        base_kvar[j] = dss.Loads.kvar()
+
+    rng = np.random.default_rng(0)
+    steps = int(config.SIMULATION_TIME / config.TIME_STEP)
+    scale = np.clip(1.0 + np.cumsum(rng.normal(0.0, 0.01, (steps, len(names))), axis=0), 0.2, 1.8)
+    report = accuracy_report(names, base_kw * scale, base_kvar * scale)
+    print("Linear surrogate accuracy report:")
+    for key, value in report.items():
+        print(f"  {key}: {value}")
@@ -0,0 +1,176 @@
+# federates/node_registry.py
+
+import numpy as np
+import pandas as pd
+from opendssdirect import dss
+import os
+import threading
+import config  # Import configuration
+from event_log import get_logger
+from .linear_surrogate import get_voltage_keys
+from .feeder_reduction import reduce_feeder
+
+log = get_logger("Node_Registry")
+
+
+def canonical_name(column):
+    """
+    Name used for a CSV column throughout the co-simulation: without a
+    '_pv' suffix and with every capital 'S' in lower case
+    ('S701a_pv' -> 's701a').
+    """
+    if column.endswith('_pv'):
+        column = column[:-3]
+    return column.replace('S', 's')
+
+
+def load_name(node):
+    """OpenDSS load name of a node ('701a' or 'S701a' -> 's701a')."""
+    if not node.startswith('S') and not node.startswith('s'):
+        node = 'S' + node
+    return node.lower()
+
+
+class NodeRegistry:
+    """
+    Integer indices for every name a node goes by, built once from the
+    circuit and the CSV headers.
+
+    voltage_keys    bus-phase keys ('701a') in dss.Circuit.AllBusMagPu()
+                    order; voltage_labels are the same keys as written to
+                    the output CSV ('701a'.capitalize()).
+    load_names      OpenDSS loads in dss.Loads.AllNames() order.
+    load_columns    load_data columns; column_load[i] is the load of
+                    column i.
+    pv_nodes        solar_data columns (the inverter nodes); pv_keys are
+                    the keys of the injection payloads, pv_load[i] the load
+                    that carries node i's injection and pv_voltage[i] the
+                    voltage node the inverter measures ('s701a' -> '701a').
+    Every index array holds -1 where there is no match; the mismatches are
+    reported once, when the registry is built.
+    """
+
+    def __init__(self, voltage_keys, load_names, load_columns, pv_nodes):
+        self.voltage_keys = list(voltage_keys)
+        self.voltage_labels = [key.capitalize() for key in self.voltage_keys]
+        self.voltage_index = {key: i for i, key in enumerate(self.voltage_keys)}
+
+        self.load_names = list(load_names)
+        self.load_index = {name: j for j, name in enumerate(self.load_names)}
+
+        self.load_columns = list(load_columns)
+        self.column_load = self.load_positions(self.load_columns)
+
+        self.pv_nodes = list(pv_nodes)
+        self.pv_keys = [node.lower() for node in self.pv_nodes]
+        self.pv_load = self.load_positions(self.pv_nodes)
+        self.pv_voltage = self.voltage_positions(self.pv_keys)
+
+    def load_positions(self, nodes):
+        """Position in load_names of each node's load; -1 where there is none."""
+        return np.array([self.load_index.get(load_name(node), -1) for node in nodes], dtype=int)
+
+    def voltage_positions(self, keys):
+        """
+        Position in voltage_keys of the voltage node each inverter key
+        measures: the key itself, else the key without its 's' prefix;
+        -1 where there is neither.
+        """
+        positions = []
+        for key in keys:
+            if key not in self.voltage_index and key.startswith('s'):
+                positions.append(self.voltage_index.get(key[1:], -1))
+            else:
+                positions.append(self.voltage_index.get(key, -1))
+        return np.array(positions, dtype=int)
+
+    def mismatches(self):
+        """Return the names that have no counterpart, by kind."""
+        used_loads = set(self.column_load[self.column_load >= 0])
+        return {
+            "load_columns_without_load": [c for c, j in zip(self.load_columns, self.column_load) if j < 0],
+            "loads_without_column": [n for j, n in enumerate(self.load_names) if j not in used_loads],
+            "pv_without_load": [n for n, j in zip(self.pv_nodes, self.pv_load) if j < 0],
+            "pv_without_voltage": [n for n, i in zip(self.pv_nodes, self.pv_voltage) if i < 0],
+        }
+
+    def report(self):
+        """Log every name mismatch once."""
+        messages = {
+            "load_columns_without_load": "Load columns without an OpenDSS load (ignored): {names}",
+            "loads_without_column": "OpenDSS loads without a load column (kept at nameplate): {names}",
+            "pv_without_load": "PV nodes without a load (injections ignored): {names}",
+            "pv_without_voltage": "PV nodes without a voltage node (measure 1.0 pu): {names}",
+        }
+        for kind, names in self.mismatches().items():
+            if names:
+                log.warn("name_mismatch", messages[kind], key=kind, names=names)
+        log.info("registry_built", "Registered {n_nodes} voltage nodes, {n_loads} loads and {n_pv} PV nodes",
+                 n_nodes=len(self.voltage_keys), n_loads=len(self.load_names), n_pv=len(self.pv_nodes))
+
+    @staticmethod
+    def values(payload, names, default=np.nan):
+        """
+        Values of a name-keyed payload dict as an array in names order.
+        Publishers build their payloads in registry order, so the usual
+        case is a single pass over the values.
+        """
+        if len(payload) == len(names) and list(payload) == names:
+            return np.fromiter(payload.values(), dtype=float, count=len(names))
+        return np.array([payload.get(name, default) for name in names], dtype=float)
+
+    def injection_arrays(self, injections):
+        """p and q of an injections payload as arrays in pv_keys order (0 where missing)."""
+        if list(injections) == self.pv_keys:
+            items = injections.values()
+        else:
+            items = [injections.get(key, {}) for key in self.pv_keys]
+        p = np.array([float(item.get('p', 0)) for item in items])
+        q = np.array([float(item.get('q', 0)) for item in items])
+        return p, q
+
+    @classmethod
+    def from_feeder(cls, path, load_columns, pv_nodes, reduction=None, keep_buses=()):
+        """
+        Build the registry of the feeder at path (reduced like the OpenDSS
+        federate's) in a separate engine context, so the shared circuit is
+        left alone.
+        """
+        engine = dss.NewContext() if hasattr(dss, "NewContext") else dss
+        engine.Command(f"Redirect {os.path.abspath(path)}")
+        if reduction:
+            reduce_feeder(keep_buses, reduction, engine)
+        registry = cls(get_voltage_keys(engine), engine.Loads.AllNames(), load_columns, pv_nodes)
+        if engine is not dss:
+            engine.Basic.ClearAll()
+        return registry
+
+
+_registries = {}
+_registry_lock = threading.Lock()
+
+
+def csv_columns(path):
+    """Canonical names of the columns of a CSV file, read from its header."""
+    return [canonical_name(column) for column in pd.read_csv(path, nrows=0).columns if column != 'time']
+
+
+def get_registry(load_columns=None, pv_nodes=None):
+    """
+    Return the process-wide registry of the configured feeder, reduction
+    and data, building it on first use. Columns not given are read from
+    the headers of load_data.csv and solar_data.csv.
+    """
+    if load_columns is None:
+        load_columns = csv_columns(f"{config.DATA_DIR}/load_data.csv")
+    if pv_nodes is None:
+        pv_nodes = csv_columns(f"{config.DATA_DIR}/solar_data.csv")
+    path = f"{config.BASE_DIR}/data/ieee37.dss"
+    reduction = tuple(getattr(config, "FEEDER_REDUCTION", None) or ())
+    keep_buses = tuple(getattr(config, "MONITORED_BUSES", ()))
+    key = (path, reduction, keep_buses, tuple(load_columns), tuple(pv_nodes))
+    with _registry_lock:
+        if key not in _registries:
+            _registries[key] = NodeRegistry.from_feeder(path, load_columns, pv_nodes, reduction, keep_buses)
+            _registries[key].report()
+        return _registries[key]
@@ -1,138 +1,429 @@
 import helics as h
+import numpy as np  # before opendssdirect, see circuit_pool.py
 from opendssdirect import dss
 import time
 import os
 import config  # Import configuration
+from event_log import get_logger
+from .linear_surrogate import (LinearVoltageSurrogate, get_voltage_keys, apply_loads,
+                               get_regulator_taps, set_regulator_taps)
+from .circuit_pool import CircuitPool
+from .power_flow_cache import get_shared_cache
+from .feeder_reduction import reduce_feeder
+from .node_registry import get_registry
+from .voltage_monitor import VoltageMonitor
 
-# Convert CSV node names to the DSS naming convention.
-def csv_to_dss_name(csv_name):
-    if not csv_name.startswith('S') and not csv_name.startswith('s'):
-        csv_name = 'S' + csv_name
-    return csv_name.lower()
-
-def run_opendss_federate():
-    fedinfo = h.helicsCreateFederateInfo()
-    h.helicsFederateInfoSetCoreName(fedinfo, "OpenDSS_Federate")
-    h.helicsFederateInfoSetCoreTypeFromString(fedinfo, "zmq")
-    h.helicsFederateInfoSetTimeProperty(fedinfo, h.HELICS_PROPERTY_TIME_DELTA, config.TIME_STEP)
-    
-    fed = h.helicsCreateValueFederate("OpenDSS_Federate", fedinfo)
-    # Subscription for net demand from the Voltage Consumer Federate.
-    sub = h.helicsFederateRegisterSubscription(fed, "Voltage_Consumer_Federate/load", "")
-    # New subscription for inverter injections from the Inverter Federate.
-    inverter_sub = h.helicsFederateRegisterSubscription(fed, "Inverter_Federate/injections", "")
-    # Publication for voltage output.
-    pub = h.helicsFederateRegisterPublication(fed, "voltage_out", h.HELICS_DATA_TYPE_STRING, "")
-    
-    h.helicsFederateEnterExecutingMode(fed)
-    
-    # Load the IEEE37 DSS file.
-    dss.Command(f"Redirect {config.BASE_DIR}/data/ieee37.dss")
-    print("Loads in DSS after redirect:", dss.Loads.AllNames())
-    print("Buses in DSS:", dss.Circuit.AllBusNames())
-    
-    # If available, create a mapping for each load’s initial reactive power.
-    # This assumes that each load is defined in OpenDSS with both kW and kVAR.
-    initial_reactive = {}
-    for load_name in dss.Loads.AllNames():
-        dss.Loads.Name(load_name)
-        try:
-            # Attempt to read the reactive power; if not available, default to 0.
-            reactive_val = dss.Loads.kvar()  
-        except Exception as e:
-            print(f"[WARN] Could not retrieve kvar for load {load_name}: {e}")
-            reactive_val = 0
-        initial_reactive[load_name] = reactive_val
+log = get_logger("OpenDSS_Federate")
 
-    current_time = 0
-    while current_time < config.SIMULATION_TIME:
-        next_time = current_time + config.TIME_STEP
-        granted_time = h.helicsFederateRequestTime(fed, next_time)
-        
-        # Wait for load update from the load publisher.
-        timeout_counter = 0
-        while not h.helicsInputIsUpdated(sub):
-            time.sleep(0.01)
-            timeout_counter += 1
-            if timeout_counter > 100:
-                print(f"[WARN] No load received at t={granted_time}")
-                break
-        
-        load_str = h.helicsInputGetString(sub)
+
+# Initial state of the circuit compiled by compile_circuit(), used to
+# reset it instead of compiling it again.
+_compiled = None
+
+
+def compile_circuit(path, reuse=False, reduction=None, keep_buses=()):
+    """
+    Compile the feeder at path into the shared engine and, with a list of
+    reduction options, reduce it keeping the load buses and keep_buses
+    (see feeder_reduction.reduce_feeder). With reuse, a feeder this
+    process already compiled the same way and that is still active is
+    reset to its initial load kW/kvar and regulator taps instead, which
+    skips parsing and reducing the feeder again. The next solve then
+    starts from the previous solution rather than a flat start; the
+    results agree within the power-flow tolerance.
+
+    Returns the reduction summary on a fresh compile (an empty dict
+    without reduction) and None on a reset.
+    """
+    global _compiled
+    setup = (path, tuple(reduction or ()), tuple(sorted(keep_buses)))
+    if reuse and _compiled is not None and _compiled["setup"] == setup \
+            and dss.Circuit.Name() == _compiled["circuit"]:
+        apply_loads(_compiled["load_names"], _compiled["kw"], _compiled["kvar"])
+        set_regulator_taps(_compiled["taps"])
+        return None
+
+    dss.Command(f"Redirect {path}")
+    summary = reduce_feeder(keep_buses, reduction) if reduction else {}
+    load_names = dss.Loads.AllNames()
+    kw = []
+    kvar = []
+    for name in load_names:
+        dss.Loads.Name(name)
+        kw.append(dss.Loads.kW())
+        kvar.append(dss.Loads.kvar())
+    _compiled = {"setup": setup, "circuit": dss.Circuit.Name(), "load_names": load_names,
+                 "kw": kw, "kvar": kvar, "taps": get_regulator_taps()}
+    return summary
+
+
+class OpenDSSFederate:
+    """
+    OpenDSS federate with its per-step work split out of the time loop, so
+    it can be driven by run_opendss_federate() or by the single-loop
+    orchestrator.
+
+    after_grant(t) reads the latest load and inverter injections, solves
+    the power flow and publishes the voltages. There is no work before a
+    time request.
+
+    solver selects the power-flow engine: "exact" runs dss.Solution.Solve()
+    every step, "linear" uses the voltage-sensitivity surrogate from
+    linear_surrogate.py. Defaults to config.POWER_FLOW_SOLVER. With
+    config.POWER_FLOW_CACHE_SIZE > 0, exact solves go through the
+    process-wide PowerFlowCache keyed on the loads quantized to
+    config.POWER_FLOW_CACHE_RESOLUTION.
+
+    With ensemble_size > 1 (default: the length of config.ENSEMBLE) the
+    federate also reads the inverter's "injections_ensemble", solves the
+    feeder once per member and publishes all voltages on
+    "voltage_ensemble"; "voltage_out" carries member 0. With parallel
+    (default: config.PARALLEL_CIRCUITS) and the exact solver, each member
+    gets its own circuit instance in a CircuitPool and all members are
+    solved concurrently.
+
+    With a monitor specification (config.MONITOR, see voltage_monitor.py)
+    "voltage_out" only carries the voltages the inverters measure, and the
+    recorded nodes and closed aggregate windows go out on "monitor".
+    """
+
+    name = "OpenDSS_Federate"
+
+    def __init__(self, solver=None, time_step=None, ensemble_size=None, parallel=None,
+                 reuse_circuit=False, registry=None, broker=None):
+        if solver is None:
+            solver = getattr(config, "POWER_FLOW_SOLVER", "exact")
+        if solver not in ("exact", "linear"):
+            raise ValueError(f"Unknown power-flow solver '{solver}'")
+        self.solver = solver
+        self.time_step = config.TIME_STEP if time_step is None else time_step
+        self.reuse_circuit = reuse_circuit
+        self.registry = registry
+
+        fedinfo = h.helicsCreateFederateInfo()
+        h.helicsFederateInfoSetCoreName(fedinfo, self.name)
+        h.helicsFederateInfoSetCoreTypeFromString(fedinfo, "zmq")
+        if broker:
+            # Address of the (sub-)broker to join; see broker_topology.py.
+            h.helicsFederateInfoSetBroker(fedinfo, broker)
+        h.helicsFederateInfoSetTimeProperty(fedinfo, h.HELICS_PROPERTY_TIME_DELTA, self.time_step)
+
+        self.fed = h.helicsCreateValueFederate(self.name, fedinfo)
+        # Subscription for net demand from the Voltage Consumer Federate.
+        self.sub = h.helicsFederateRegisterSubscription(self.fed, "Voltage_Consumer_Federate/load", "")
+        # New subscription for inverter injections from the Inverter Federate.
+        self.inverter_sub = h.helicsFederateRegisterSubscription(self.fed, "Inverter_Federate/injections", "")
+        # Publication for voltage output.
+        self.pub = h.helicsFederateRegisterPublication(self.fed, "voltage_out", h.HELICS_DATA_TYPE_STRING, "")
+        self.monitor_spec = getattr(config, "MONITOR", None)
+        if self.monitor_spec is not None:
+            self.monitor_pub = h.helicsFederateRegisterPublication(self.fed, "monitor", h.HELICS_DATA_TYPE_STRING, "")
+
+        if ensemble_size is None:
+            ensemble_size = len(getattr(config, "ENSEMBLE", None) or [None])
+        self.ensemble_size = ensemble_size
+        if parallel is None:
+            parallel = getattr(config, "PARALLEL_CIRCUITS", False)
+        self.parallel = parallel and ensemble_size > 1 and solver == "exact"
+        self.pool = None
+        if ensemble_size > 1:
+            self.ensemble_sub = h.helicsFederateRegisterSubscription(
+                self.fed, "Inverter_Federate/injections_ensemble", "")
+            self.ensemble_pub = h.helicsFederateRegisterPublication(
+                self.fed, "voltage_ensemble", h.HELICS_DATA_TYPE_STRING, "")
+
+    def load_circuit(self):
+        """
+        Load the IEEE37 circuit, reduced if config.FEEDER_REDUCTION is set,
+        and set up the load vectors and solver. With reuse_circuit, an
+        already compiled circuit is reset instead (see compile_circuit).
+        """
+        reduction = getattr(config, "FEEDER_REDUCTION", None)
+        summary = compile_circuit(f"{config.BASE_DIR}/data/ieee37.dss", self.reuse_circuit,
+                                  reduction, getattr(config, "MONITORED_BUSES", ()))
+        if summary is None:
+            log.info("circuit_reset", "Reset the compiled circuit to its initial state")
+        else:
+            log.info("circuit_loaded", "Loaded circuit with {n_loads} loads and {n_buses} buses",
+                     n_loads=len(dss.Loads.AllNames()), n_buses=len(dss.Circuit.AllBusNames()),
+                     loads=dss.Loads.AllNames(), buses=dss.Circuit.AllBusNames())
+            if summary:
+                log.info("circuit_reduced", "Reduced the feeder ({options}) from {before} to {after}",
+                         options=reduction, before=summary["before"], after=summary["after"])
+
+        # If available, create a mapping for each load’s initial reactive power.
+        # This assumes that each load is defined in OpenDSS with both kW and kVAR.
+        self.initial_reactive = {}
+        for load_name in dss.Loads.AllNames():
+            dss.Loads.Name(load_name)
+            try:
+                # Attempt to read the reactive power; if not available, default to 0.
+                reactive_val = dss.Loads.kvar()
+            except Exception as e:
+                log.warn("kvar_unavailable", "Could not retrieve kvar for load {load}: {error}",
+                         key=load_name, load=load_name, error=e)
+                reactive_val = 0
+            self.initial_reactive[load_name] = reactive_val
+
+        # Current kW/kvar of every load, kept in dss.Loads.AllNames() order.
+        self.load_names = dss.Loads.AllNames()
+        self.load_kw = np.empty(len(self.load_names))
+        for j, load_name in enumerate(self.load_names):
+            dss.Loads.Name(load_name)
+            self.load_kw[j] = dss.Loads.kW()
+        self.load_kvar = np.array([self.initial_reactive[name] for name in self.load_names], dtype=float)
+        self.initial_kvar = self.load_kvar.copy()
+
+        self.surrogate = None
+        if self.solver == "linear":
+            self.surrogate = LinearVoltageSurrogate(self.load_names)
+            self.voltage_keys = self.surrogate.keys
+        else:
+            self.voltage_keys = get_voltage_keys()
+
+        self.cache = None
+        cache_size = getattr(config, "POWER_FLOW_CACHE_SIZE", 0)
+        if cache_size and self.solver == "exact":
+            feeder = (_compiled["setup"], tuple(self.load_names), tuple(self.voltage_keys))
+            self.cache = get_shared_cache(getattr(config, "POWER_FLOW_CACHE_RESOLUTION", 0.01), cache_size, feeder)
+
+        # Payload names are resolved to load and voltage positions once.
+        if self.registry is None:
+            self.registry = get_registry()
+        if self.registry.load_names != self.load_names or self.registry.voltage_keys != self.voltage_keys:
+            raise RuntimeError("The node registry does not match the loaded circuit")
+
+        # Voltages published on "voltage_out": all, or with a monitor only
+        # those the inverters measure.
+        self.monitor = VoltageMonitor.from_config(self.voltage_keys, self.monitor_spec, self.time_step)
+        self.published = np.arange(len(self.voltage_keys))
+        if self.monitor is not None:
+            self.published = np.unique(self.registry.pv_voltage[self.registry.pv_voltage >= 0])
+            log.info("monitor_created", "Monitoring {recorded} of {nodes} nodes and aggregates {aggregates}; "
+                     "publishing {published} voltages to the inverters", published=len(self.published),
+                     **self.monitor.summary())
+        self.published_keys = [self.voltage_keys[i] for i in self.published]
+
+        # Regulator taps move during a solve, so every ensemble member keeps
+        # its own positions instead of inheriting the previous member's.
+        self.member_taps = [get_regulator_taps() for _ in range(self.ensemble_size)]
+
+        if self.parallel:
+            self.pool = CircuitPool([f"{config.BASE_DIR}/data/ieee37.dss"] * self.ensemble_size,
+                                    getattr(config, "CIRCUIT_WORKERS", None),
+                                    reduction, getattr(config, "MONITORED_BUSES", ()))
+            if self.pool.load_names[0] != self.load_names or self.pool.voltage_keys[0] != self.voltage_keys:
+                raise RuntimeError("Circuit instances do not match the federate's circuit")
+
+    def before_request(self, current_time):
+        """Nothing to do before a time request."""
+
+    def after_grant(self, granted_time):
+        """Apply the latest load and injections, solve and publish voltages."""
+        load_str = h.helicsInputGetString(self.sub)
         load = {}
         if load_str.strip().startswith('{'):
             try:
                 load = eval(load_str)
             except Exception as e:
-                print(f"[ERROR] Failed to parse load: {e}")
+                log.error("parse_failed", "Failed to parse load: {error}", key="load", error=e)
         else:
-            print(f"[WARN] Invalid load string: '{load_str}'")
-        
-        # Wait briefly for inverter injection data.
-        inverter_timeout = 0
-        while not h.helicsInputIsUpdated(inverter_sub) and inverter_timeout < 100:
-            time.sleep(0.01)
-            inverter_timeout += 1
-        
-        inverter_injections_str = h.helicsInputGetString(inverter_sub)
+            log.warn("invalid_input", "Invalid load string: '{value}'", key="load", value=load_str)
+
+        inverter_injections_str = h.helicsInputGetString(self.inverter_sub)
         inverter_injections = {}
         if inverter_injections_str.strip().startswith('{'):
             try:
                 inverter_injections = eval(inverter_injections_str)
             except Exception as e:
-                print(f"[ERROR] Failed to parse inverter injections: {e}")
+                log.error("parse_failed", "Failed to parse inverter injections: {error}", key="injections", error=e)
         else:
-            print(f"[WARN] Invalid inverter injection string: '{inverter_injections_str}'")
-        
+            log.warn("invalid_input", "Invalid inverter injection string: '{value}'",
+                     key="injections", value=inverter_injections_str)
+
+        if self.ensemble_size > 1:
+            ensemble_voltages = self.solve_ensemble(load)
+            h.helicsPublicationPublishString(
+                self.ensemble_pub, str({"keys": self.voltage_keys, "v": ensemble_voltages.tolist()}))
+            self.publish_voltages(granted_time, ensemble_voltages[0])
+            return
+
         # Process net demand and adjust using inverter active and reactive power injections.
-        print_flag = True  # flag to control printing of load values
-        for bus, kw in load.items():
-            dss_bus = csv_to_dss_name(bus)
-            modified_kw = kw
-            # Get the original reactive load (if available) or set a default (e.g., 0).
-            modified_kvar = initial_reactive.get(dss_bus, 0)
-            if dss_bus in inverter_injections:
-                try:
-                    p_inj = float(inverter_injections[dss_bus].get('p', 0))
-                    q_inj = float(inverter_injections[dss_bus].get('q', 0))
-                    modified_kw = kw - p_inj
-                    modified_kvar = modified_kvar - q_inj
-                    if print_flag:
-                        print(f"[INFO] t={granted_time} | Node {dss_bus}: load={kw}, inverter p_injection={p_inj}, "
-                              f"modified load={modified_kw}, inverter q_injection={q_inj}, modified kvar load={modified_kvar}")
-                        print_flag = False  # Only print once per time step
-                except Exception as e:
-                    print(f"[ERROR] Error processing inverter injection for {dss_bus}: {e}")
-            
-            if dss_bus in dss.Loads.AllNames():
-                dss.Loads.Name(dss_bus)
-                dss.Loads.kW(modified_kw)
-                try:
-                    # Update the reactive power demand as well.
-                    dss.Loads.kvar(modified_kvar)
-                except Exception as e:
-                    print(f"[WARN] Unable to update kvar for {dss_bus}: {e}")
-            else:
-                print(f"[INFO] Load {dss_bus} not found. Skipping.")
-        
-        # Solve the power flow in OpenDSS.
-        dss.Solution.Solve()
-        
-        # Collect voltage values.
-        voltage_dict = {}
-        bus_names = dss.Circuit.AllBusNames()
-        for bus in bus_names:
-            dss.Circuit.SetActiveBus(bus)
-            voltage_data = dss.Bus.puVmagAngle()
-            num_phases = dss.Bus.NumNodes()
-            for i in range(num_phases):
-                phase_label = chr(ord('a') + i)
-                key = bus.lower() + phase_label
-                voltage_dict[key] = voltage_data[2 * i]
-        
-        # Publish the voltage data.
-        h.helicsPublicationPublishString(pub, str(voltage_dict))
+        rows = self.update_loads(load)
+        if inverter_injections:
+            try:
+                p, q = self.registry.injection_arrays(inverter_injections)
+                # Injections only apply to the loads updated this step.
+                updated = np.zeros(len(self.load_names), dtype=bool)
+                updated[rows] = True
+                nodes = np.flatnonzero(self.registry.pv_load >= 0)
+                nodes = nodes[updated[self.registry.pv_load[nodes]]]
+                targets = self.registry.pv_load[nodes]
+                self.load_kw[targets] -= p[nodes]
+                self.load_kvar[targets] -= q[nodes]
+                if log.debug_enabled and len(nodes):
+                    # Trace the first modified load of each step.
+                    i, j = nodes[0], targets[0]
+                    log.debug("inverter_injection",
+                              "t={t} | Node {node}: load={kw}, inverter p_injection={p}, modified load={modified_kw}, "
+                              "inverter q_injection={q}, modified kvar load={modified_kvar}",
+                              rate_limit=False, t=granted_time, node=self.load_names[j], kw=self.load_kw[j] + p[i],
+                              p=p[i], modified_kw=self.load_kw[j], q=q[i], modified_kvar=self.load_kvar[j])
+            except Exception as e:
+                log.error("injection_failed", "Error processing inverter injections: {error}",
+                          key="injections", error=e)
+
+        if self.surrogate is None:
+            # Solve the power flow in OpenDSS.
+            apply_loads([self.load_names[j] for j in rows], self.load_kw[rows], self.load_kvar[rows])
+            voltages = self.solve_applied(self.load_kw, self.load_kvar)
+        else:
+            # Linear estimate; the surrogate falls back to a full solve itself.
+            voltages = self.surrogate.solve(self.load_kw, self.load_kvar)
+
+        self.publish_voltages(granted_time, voltages)
+
+    def publish_voltages(self, granted_time, voltages):
+        """Publish the voltages, and with a monitor its outputs for granted_time."""
+        voltages = np.asarray(voltages)
+        voltage_dict = dict(zip(self.published_keys, voltages[self.published].tolist()))
+        h.helicsPublicationPublishString(self.pub, str(voltage_dict))
+        if self.monitor is not None:
+            # The open windows go along with every publication, so the
+            # consumer can flush them from whichever one it reads last.
+            closed = self.monitor.update(granted_time, voltages)
+            h.helicsPublicationPublishString(self.monitor_pub, str(
+                {"v": voltages[self.monitor.record].tolist(), "aggregates": closed,
+                 "open": self.monitor.open_rows()}))
+
+    def update_loads(self, load):
+        """
+        Set the kW of every load with a column in the load payload and reset
+        its kvar to the initial value. Returns the positions updated.
+        """
+        kw = self.registry.values(load, self.registry.load_columns)
+        present = (self.registry.column_load >= 0) & ~np.isnan(kw)
+        rows = self.registry.column_load[present]
+        self.load_kw[rows] = kw[present]
+        self.load_kvar[rows] = self.initial_kvar[rows]
+        return rows
+
+    def solve_loads(self, kw, kvar):
+        """Solve the feeder for full kW/kvar vectors and return |V| in pu."""
+        if self.surrogate is None:
+            apply_loads(self.load_names, kw, kvar)
+            return self.solve_applied(kw, kvar)
+        return self.surrogate.solve(kw, kvar)
+
+    def solve_applied(self, kw, kvar):
+        """
+        Solve the circuit, whose loads are already set to kw/kvar, and
+        return |V| in pu; served from the cache when it is enabled.
+        """
+        if self.cache is None:
+            dss.Solution.Solve()
+            return np.asarray(dss.Circuit.AllBusMagPu())
+
+        def solve():
+            dss.Solution.Solve()
+            return dss.Circuit.AllBusMagPu(), get_regulator_taps()
+
+        voltages, taps = self.cache.solve(kw, kvar, get_regulator_taps(), solve)
+        if list(taps) != get_regulator_taps():
+            # A hit leaves the taps where the cached solve ended.
+            set_regulator_taps(taps)
+        return voltages
+
+    def solve_ensemble(self, load):
+        """
+        Solve the feeder once per ensemble member with the member's
+        injections subtracted from the common load. Returns S x nodes |V|.
+        """
+        self.update_loads(load)
+
+        p = q = None
+        ensemble_str = h.helicsInputGetString(self.ensemble_sub)
+        if ensemble_str.strip().startswith('{'):
+            try:
+                payload = eval(ensemble_str)
+                if payload['nodes'] == self.registry.pv_keys:
+                    columns = self.registry.pv_load
+                else:
+                    columns = self.registry.load_positions(payload['nodes'])
+                found = columns >= 0
+                p = np.asarray(payload['p'], dtype=float)[:, found]
+                q = np.asarray(payload['q'], dtype=float)[:, found]
+                columns = columns[found]
+                if p.shape[0] != self.ensemble_size:
+                    log.warn("ensemble_mismatch", "Injection ensemble has {got} members, expected {expected}",
+                             got=p.shape[0], expected=self.ensemble_size)
+                    p = q = None
+            except Exception as e:
+                log.error("parse_failed", "Failed to parse injection ensemble: {error}", key="injections_ensemble", error=e)
+                p = q = None
+
+        kw = np.tile(self.load_kw, (self.ensemble_size, 1))
+        kvar = np.tile(self.load_kvar, (self.ensemble_size, 1))
+        if p is not None:
+            kw[:, columns] -= p
+            kvar[:, columns] -= q
+        if self.pool is not None:
+            return np.array(self.pool.solve(kw, kvar))
+
+        voltages = np.empty((self.ensemble_size, len(self.voltage_keys)))
+        for k in range(self.ensemble_size):
+            if self.surrogate is None:
+                set_regulator_taps(self.member_taps[k])
+            voltages[k] = self.solve_loads(kw[k], kvar[k])
+            if self.surrogate is None:
+                self.member_taps[k] = get_regulator_taps()
+        return voltages
+
+    def finalize(self):
+        if self.surrogate is not None:
+            print(f"[OpenDSS Federate] Linear surrogate summary: {self.surrogate.summary()}")
+        if self.cache is not None:
+            print(f"[OpenDSS Federate] Power-flow cache summary: {self.cache.summary()}")
+        if self.pool is not None:
+            print(f"[OpenDSS Federate] Circuit pool summary: {self.pool.summary()}")
+            self.pool.close()
+        h.helicsFederateFinalize(self.fed)
+        print("[OpenDSS Federate] Finalized.")
+
+
+def run_opendss_federate(solver=None):
+    """
+    Run the OpenDSS federate.
+
+    solver selects the power-flow engine: "exact" runs dss.Solution.Solve()
+    every step, "linear" uses the voltage-sensitivity surrogate from
+    linear_surrogate.py. Defaults to config.POWER_FLOW_SOLVER.
+    """
+    federate = OpenDSSFederate(solver)
+    h.helicsFederateEnterExecutingMode(federate.fed)
+    federate.load_circuit()
+
+    current_time = 0
+    while current_time < config.SIMULATION_TIME:
+        next_time = current_time + config.TIME_STEP
+        granted_time = h.helicsFederateRequestTime(federate.fed, next_time)
+
+        # Wait for load update from the load publisher.
+        timeout_counter = 0
+        while not h.helicsInputIsUpdated(federate.sub):
+            time.sleep(0.01)
+            timeout_counter += 1
+            if timeout_counter > 100:
+                log.warn("input_timeout", "No load received at t={t}", key="load", t=granted_time)
+                break
+
+        # Wait briefly for inverter injection data.
+        inverter_timeout = 0
+        while not h.helicsInputIsUpdated(federate.inverter_sub) and inverter_timeout < 100:
+            time.sleep(0.01)
+            inverter_timeout += 1
+
+        federate.after_grant(granted_time)
         current_time = granted_time
-    
-    h.helicsFederateFinalize(fed)
-    print("[OpenDSS Federate] Finalized.")
+
+    federate.finalize()
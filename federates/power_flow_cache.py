@@ -0,0 +1,106 @@
+# federates/power_flow_cache.py
+
+from collections import OrderedDict
+import numpy as np
+
+# Cache parameters.
+DEFAULT_RESOLUTION = 0.01    # kW / kvar quantization step of the key
+DEFAULT_MAX_ENTRIES = 10000  # Solutions kept before the least recently used is evicted
+VERIFY_INTERVAL = 100        # Cache hits between verification solves (0 disables)
+
+
+class PowerFlowCache:
+    """
+    LRU cache of power-flow solutions.
+
+    The key is the kW/kvar vector rounded to multiples of resolution,
+    together with the control state the solve starts from (the regulator
+    taps), since the same loads can settle on different taps. Every entry
+    keeps the voltages and the control state after the solve, so a hit
+    can put the circuit in the same state a real solve would have.
+
+    A hit returns a solution computed for loads up to resolution / 2 away
+    from the requested ones. To measure that error, every verify_interval
+    -th hit is solved anyway and compared with the cached voltages.
+    """
+
+    def __init__(self, resolution=DEFAULT_RESOLUTION, max_entries=DEFAULT_MAX_ENTRIES,
+                 verify_interval=VERIFY_INTERVAL):
+        self.resolution = resolution
+        self.max_entries = max_entries
+        self.verify_interval = verify_interval
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.verified = 0
+        self.max_error = 0.0
+        self.memory_bytes = 0
+
+    def key(self, kw, kvar, state=()):
+        quantized = np.rint(np.concatenate([kw, kvar]) / self.resolution).astype(np.int64)
+        return quantized.tobytes(), tuple(state)
+
+    @staticmethod
+    def _entry_bytes(key, voltages, state):
+        return len(key[0]) + 8 * len(key[1]) + voltages.nbytes + 8 * len(state)
+
+    def solve(self, kw, kvar, state, solve_fn):
+        """
+        Return (voltages, state_after) for the loads kw/kvar starting from
+        control state, from the cache or from solve_fn() on a miss.
+        solve_fn must solve the circuit with kw/kvar already applied and
+        return the same pair.
+        """
+        key = self.key(kw, kvar, state)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            if not self.verify_interval or self.hits % self.verify_interval:
+                return entry
+            voltages, state_after = solve_fn()
+            voltages = np.asarray(voltages, dtype=float)
+            self.verified += 1
+            self.max_error = max(self.max_error, float(np.max(np.abs(voltages - entry[0]))))
+            self.entries[key] = (voltages, tuple(state_after))
+            return self.entries[key]
+
+        self.misses += 1
+        voltages, state_after = solve_fn()
+        voltages = np.asarray(voltages, dtype=float)
+        self.entries[key] = (voltages, tuple(state_after))
+        self.memory_bytes += self._entry_bytes(key, voltages, state_after)
+        while len(self.entries) > self.max_entries:
+            old_key, (old_voltages, old_state) = self.entries.popitem(last=False)
+            self.memory_bytes -= self._entry_bytes(old_key, old_voltages, old_state)
+        return self.entries[key]
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        return {
+            "lookups": lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "memory_mb": self.memory_bytes / 2**20,
+            "resolution": self.resolution,
+            "verified_hits": self.verified,
+            "max_quantization_error_pu": self.max_error,
+        }
+
+
+_shared = {}
+
+
+def get_shared_cache(resolution=DEFAULT_RESOLUTION, max_entries=DEFAULT_MAX_ENTRIES, feeder=()):
+    """
+    Return the process-wide cache for these parameters, so repeated runs
+    in one process (sweeps, the simulation server) share their solutions.
+    feeder identifies the compiled circuit (path, reduction, kept buses,
+    load names and voltage keys): runs on a different or differently
+    reduced feeder get their own cache, never the other's voltages.
+    """
+    key = (resolution, max_entries, tuple(feeder))
+    if key not in _shared:
+        _shared[key] = PowerFlowCache(resolution, max_entries)
+    return _shared[key]
@@ -0,0 +1,130 @@
+# federates/profiles.py
+
+import numpy as np
+from event_log import get_logger
+
+log = get_logger("Profiles")
+
+# Interpolation methods of the load and solar profiles.
+PROFILE_METHODS = ("zoh", "linear", "cubic")
+
+# Grid points resampled at once when a profile is read on a time grid.
+DEFAULT_CHUNK_STEPS = 4096
+
+
+def monotone_slopes(times, data):
+    """
+    Shape-preserving (Fritsch-Carlson / PCHIP) slopes of data (rows at
+    times, one column per series) for cubic Hermite interpolation: zero
+    at local extrema and where a segment is flat, elsewhere a weighted
+    harmonic mean of the neighbouring secants, so every interval stays
+    within its end values. The end slopes are the one-sided three-point
+    estimates, limited the same way.
+    """
+    h = np.diff(times)[:, np.newaxis]
+    secant = np.diff(data, axis=0) / h
+    slopes = np.zeros_like(data)
+    if len(times) == 2:
+        slopes[:] = secant
+        return slopes
+
+    h0, h1 = h[:-1], h[1:]
+    d0, d1 = secant[:-1], secant[1:]
+    w0, w1 = 2 * h1 + h0, h1 + 2 * h0
+    same_sign = d0 * d1 > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        harmonic = (w0 + w1) / (w0 / d0 + w1 / d1)
+    slopes[1:-1] = np.where(same_sign, harmonic, 0.0)
+
+    for end, (ha, hb, da, db) in ((0, (h[0], h[1], secant[0], secant[1])),
+                                  (-1, (h[-1], h[-2], secant[-1], secant[-2]))):
+        slope = ((2 * ha + hb) * da - ha * db) / (ha + hb)
+        slope = np.where(np.sign(slope) != np.sign(da), 0.0, slope)
+        slope = np.where((np.sign(da) != np.sign(db)) & (np.abs(slope) > 3 * np.abs(da)), 3 * da, slope)
+        slopes[end] = slope
+    return slopes
+
+
+class ProfileResampler:
+    """
+    A load or solar profile (a DataFrame with a 'time' column and one
+    column per node) mapped onto arbitrary simulation times.
+
+    method is "zoh" (the last row at or before t), "linear" or "cubic"
+    (shape-preserving cubic Hermite, see monotone_slopes(): it never
+    leaves the range of the two rows around t, so e.g. solar production
+    stays non-negative and within its maximum). Outside the profile the
+    first or last row is held.
+
+    values(times) resamples a whole time vector in one vectorized pass.
+    at(t) returns one row as a dict; with time_step it resamples the grid
+    k * time_step lazily, chunk_steps points at a time, so a fine-step run
+    costs one array lookup per step.
+    """
+
+    def __init__(self, df, method="zoh", time_step=None, chunk_steps=DEFAULT_CHUNK_STEPS):
+        if method not in PROFILE_METHODS:
+            raise ValueError(f"Unknown profile interpolation '{method}', expected one of {PROFILE_METHODS}")
+        df = df.sort_values('time')
+        self.columns = [col for col in df.columns if col != 'time']
+        self.times = df['time'].to_numpy(dtype=float)
+        self.data = df[self.columns].to_numpy(dtype=float)
+        self.method = method
+        self.slopes = None
+        if method == "cubic" and len(self.times) > 1:
+            self.slopes = monotone_slopes(self.times, self.data)
+        self.time_step = time_step
+        self.chunk_steps = chunk_steps
+        self.chunk_index = None
+        self.chunk = None
+
+    def check_range(self, times):
+        """Warn when any of times lies outside the profile."""
+        times = np.asarray(times, dtype=float)
+        if ((times < self.times[0]) | (times > self.times[-1])).any():
+            log.warn("beyond_profile", "Times {first}..{last} s outside the profile ({start}..{end} s); "
+                     "holding the end rows", first=float(times.min()), last=float(times.max()),
+                     start=float(self.times[0]), end=float(self.times[-1]))
+
+    def values(self, times, warn=True):
+        """Profile rows at times (a vector): a len(times) x columns array."""
+        times = np.asarray(times, dtype=float)
+        if warn:
+            self.check_range(times)
+        times = np.clip(times, self.times[0], self.times[-1])
+        if self.method == "zoh" or len(self.times) == 1:
+            return self.data[np.searchsorted(self.times, times, side='right') - 1]
+
+        # Interval [times[i], times[i + 1]] holding each time, and the
+        # position s in [0, 1] within it.
+        i = np.clip(np.searchsorted(self.times, times, side='right') - 1, 0, len(self.times) - 2)
+        width = self.times[i + 1] - self.times[i]
+        s = ((times - self.times[i]) / width)[:, np.newaxis]
+        y0, y1 = self.data[i], self.data[i + 1]
+        if self.method == "linear":
+            return y0 + s * (y1 - y0)
+        m0 = self.slopes[i] * width[:, np.newaxis]
+        m1 = self.slopes[i + 1] * width[:, np.newaxis]
+        s2, s3 = s * s, s * s * s
+        return ((2 * s3 - 3 * s2 + 1) * y0 + (s3 - 2 * s2 + s) * m0
+                + (-2 * s3 + 3 * s2) * y1 + (s3 - s2) * m1)
+
+    def grid(self, start, stop, step):
+        """Times start, start + step, ... up to stop and the rows at them."""
+        times = start + step * np.arange(int(np.floor((stop - start) / step + 1e-9)) + 1)
+        return times, self.values(times)
+
+    def at(self, t):
+        """The profile row at time t as a dict by column."""
+        if self.time_step:
+            k = int(round(t / self.time_step))
+            if abs(k * self.time_step - t) < 1e-9:
+                chunk_index = k // self.chunk_steps
+                if chunk_index != self.chunk_index:
+                    first = chunk_index * self.chunk_steps
+                    # The chunk may run past the profile; only t is checked.
+                    self.chunk = self.values(self.time_step * np.arange(first, first + self.chunk_steps), warn=False)
+                    self.chunk_index = chunk_index
+                self.check_range([t])
+                return dict(zip(self.columns, self.chunk[k % self.chunk_steps].tolist()))
+        return dict(zip(self.columns, self.values([t])[0].tolist()))
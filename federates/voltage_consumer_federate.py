@@ -2,82 +2,180 @@
 
 import helics as h
 import pandas as pd
+import numpy as np
 import time
+import config
+from analytics import VoltageStatistics
+from event_log import get_logger
+from .node_registry import get_registry
+from .profiles import DEFAULT_CHUNK_STEPS, ProfileResampler
+from .voltage_monitor import VoltageMonitor
 
-# Helper function for converting DSS names to CSV convention.
-def dss_to_csv_name(dss_name):
-    return dss_name.capitalize()
+log = get_logger("Voltage_Consumer_Federate")
 
-def get_values_at_time(t, df):
-    if t in df['time'].values:
-        row = df[df['time'] == t].iloc[0]
-    else:
-        row = df.iloc[-1]
-    return row.drop('time').to_dict()
+def get_values_at_time(t, df, method="zoh"):
+    """Profile row at time t (one-off lookup; see ProfileResampler)."""
+    return ProfileResampler(df, method).at(t)
 
-def run_voltage_consumer_federate(solar_data, load_data, node_names, simulation_time, time_step=1.0):
-    fedinfo = h.helicsCreateFederateInfo()
-    h.helicsFederateInfoSetCoreName(fedinfo, "Voltage_Consumer_Federate")
-    h.helicsFederateInfoSetCoreTypeFromString(fedinfo, "zmq")
-    h.helicsFederateInfoSetTimeProperty(fedinfo, h.HELICS_PROPERTY_TIME_DELTA, time_step)
-    
-    fed = h.helicsCreateValueFederate("Voltage_Consumer_Federate", fedinfo)
-    pub_load = h.helicsFederateRegisterPublication(fed, "load", h.HELICS_DATA_TYPE_STRING, "")
-    pub_solar = h.helicsFederateRegisterPublication(fed, "solar", h.HELICS_DATA_TYPE_STRING, "")
-    #pub = h.helicsFederateRegisterPublication(fed, "net_demand", h.HELICS_DATA_TYPE_STRING, "")
-    sub = h.helicsFederateRegisterSubscription(fed, "OpenDSS_Federate/voltage_out", "")
-    
-    h.helicsFederateEnterExecutingMode(fed)
-    time.sleep(1)  # Ensure publisher is ready
-    
-    current_time = 0
-    voltage_timeseries = []
-    
-    while current_time < simulation_time:
-        solar_values = get_values_at_time(current_time, solar_data)
-        load_values = get_values_at_time(current_time, load_data)
+class VoltageConsumerFederate:
+    """
+    Voltage consumer federate with its per-step work split out of the time
+    loop, so it can be driven by run_voltage_consumer_federate() or by the
+    single-loop orchestrator.
+
+    before_request(t) publishes the load and solar values for time t,
+    resampled from the profiles onto the federate's time grid with
+    config.PROFILE_INTERPOLATION;
+    after_grant(t) records the latest voltages under time t, as one array
+    per step in node registry order. With a monitor specification
+    (config.MONITOR) it records the monitored nodes and the aggregate rows
+    published on "monitor" instead; finalize() adds the windows still open
+    in the last publication read.
+    """
+
+    name = "Voltage_Consumer_Federate"
+
+    def __init__(self, solar_data, load_data, node_names, time_step=1.0, registry=None, broker=None):
+        self.solar_data = solar_data
+        self.load_data = load_data
+        self.node_names = node_names
+        self.time_step = time_step
+        method = getattr(config, "PROFILE_INTERPOLATION", "zoh")
+        chunk_steps = getattr(config, "PROFILE_CHUNK_STEPS", DEFAULT_CHUNK_STEPS)
+        self.solar_profile = ProfileResampler(solar_data, method, time_step, chunk_steps)
+        self.load_profile = ProfileResampler(load_data, method, time_step, chunk_steps)
+
+        fedinfo = h.helicsCreateFederateInfo()
+        h.helicsFederateInfoSetCoreName(fedinfo, self.name)
+        h.helicsFederateInfoSetCoreTypeFromString(fedinfo, "zmq")
+        if broker:
+            # Address of the (sub-)broker to join; see broker_topology.py.
+            h.helicsFederateInfoSetBroker(fedinfo, broker)
+        h.helicsFederateInfoSetTimeProperty(fedinfo, h.HELICS_PROPERTY_TIME_DELTA, time_step)
+
+        self.fed = h.helicsCreateValueFederate(self.name, fedinfo)
+        self.pub_load = h.helicsFederateRegisterPublication(self.fed, "load", h.HELICS_DATA_TYPE_STRING, "")
+        self.pub_solar = h.helicsFederateRegisterPublication(self.fed, "solar", h.HELICS_DATA_TYPE_STRING, "")
+        #pub = h.helicsFederateRegisterPublication(fed, "net_demand", h.HELICS_DATA_TYPE_STRING, "")
+        self.registry = get_registry() if registry is None else registry
+        self.monitor = VoltageMonitor.from_config(self.registry.voltage_keys, getattr(config, "MONITOR", None),
+                                                  time_step)
+        if self.monitor is None:
+            self.sub = h.helicsFederateRegisterSubscription(self.fed, "OpenDSS_Federate/voltage_out", "")
+            self.voltage_labels = self.registry.voltage_labels
+        else:
+            self.sub = h.helicsFederateRegisterSubscription(self.fed, "OpenDSS_Federate/monitor", "")
+            self.voltage_labels = [key.capitalize() for key in self.monitor.record_keys]
+
+        self.voltage_times = []
+        self.voltage_rows = []
+        self.aggregate_rows = []
+        self.open_aggregates = []
+        # Live voltage statistics.
+        self.live_stats = None
+        if getattr(config, "LIVE_ANALYTICS", False):
+            self.live_stats = VoltageStatistics(self.voltage_labels, default_dt=self.time_step)
+
+    def before_request(self, current_time):
+        """Publish the load and solar values for current_time."""
+        solar_values = self.solar_profile.at(current_time)
+        load_values = self.load_profile.at(current_time)
+
+        h.helicsPublicationPublishString(self.pub_load, str(load_values))
+        h.helicsPublicationPublishString(self.pub_solar, str(solar_values))
 
-        h.helicsPublicationPublishString(pub_load, str(load_values))
-        h.helicsPublicationPublishString(pub_solar, str(solar_values))
-        
         # Compute net demand for each node (load minus solar generation)
         #net_demand = {node.lower(): load_values.get(node, 0) - solar_values.get(node, 0) for node in node_names}
         #h.helicsPublicationPublishString(pub, str(net_demand))
         #print(f"[Consumer] Time: {current_time} | Net Demand: {net_demand.get('s701a', 'N/A')}")
-        
-        next_time = current_time + time_step
-        granted_time = h.helicsFederateRequestTime(fed, next_time)
-        #print(f"[Consumer] Granted time: {granted_time}")
-        current_time = granted_time
-        
-        # Wait for voltage update
-        voltage_timeout = 0
-        while not h.helicsInputIsUpdated(sub) and voltage_timeout < 100:
-            time.sleep(0.01)
-            voltage_timeout += 1
-        
-        voltage_str = h.helicsInputGetString(sub)
+
+    def after_grant(self, granted_time):
+        """Record the latest voltages under granted_time."""
+        # Stepping faster than the OpenDSS federate reads a publication
+        # again; its closed windows are only taken once.
+        updated = h.helicsInputIsUpdated(self.sub)
+        voltage_str = h.helicsInputGetString(self.sub)
         if voltage_str.strip().startswith('{'):
             try:
                 voltage_data = eval(voltage_str)
                 if isinstance(voltage_data, dict):
-                    voltage_data_csv = {dss_to_csv_name(key): value for key, value in voltage_data.items()}
-                    voltage_data_csv['time'] = current_time
-                    voltage_timeseries.append(voltage_data_csv.copy())
+                    if self.monitor is None:
+                        voltages = self.registry.values(voltage_data, self.registry.voltage_keys)
+                    else:
+                        voltages = np.asarray(voltage_data["v"], dtype=float)
+                        if updated:
+                            self.aggregate_rows.extend(voltage_data["aggregates"])
+                            self.open_aggregates = voltage_data["open"]
+                    self.voltage_times.append(granted_time)
+                    self.voltage_rows.append(voltages)
+                    if self.live_stats is not None:
+                        self.live_stats.update(granted_time, voltages)
                     #print(f"[Consumer] Time: {current_time} | Voltages: {voltage_data_csv.get('701a', 'N/A')}")
                 else:
-                    print(f"[WARN] Received non-dict voltage data: {voltage_data}")
+                    log.warn("invalid_input", "Received non-dict voltage data: {value}", key="voltage", value=voltage_data)
             except Exception as e:
-                print(f"[ERROR] Failed to evaluate voltage data: {e}")
+                log.error("parse_failed", "Failed to evaluate voltage data: {error}", key="voltage", error=e)
         else:
-            print(f"[WARN] Empty or malformed voltage string: '{voltage_str}'")
-    
-    h.helicsFederateFinalize(fed)
-    print("[Voltage Consumer Federate] Finalized.")
-    
-    try:
-        voltage_df = pd.DataFrame(voltage_timeseries)
-        voltage_df.to_csv("voltage_timeseries.csv", index=False)
-        print("[Voltage Data] Saved to 'voltage_timeseries.csv'")
-    except Exception as e:
-        print(f"[ERROR] Could not save voltage data: {e}")
+            log.warn("invalid_input", "Empty or malformed voltage string: '{value}'", key="voltage", value=voltage_str)
+
+    def voltage_frame(self):
+        """
+        Recorded voltages as a DataFrame: one column per node, then 'time'.
+        A monitor with aggregates only records no nodes, leaving 'time'.
+        """
+        values = np.array(self.voltage_rows, dtype=float).reshape(len(self.voltage_times), len(self.voltage_labels))
+        voltage_df = pd.DataFrame(values, columns=self.voltage_labels)
+        voltage_df['time'] = self.voltage_times
+        return voltage_df
+
+    def finalize(self):
+        h.helicsFederateFinalize(self.fed)
+        print("[Voltage Consumer Federate] Finalized.")
+        self.aggregate_rows.extend(self.open_aggregates)
+        self.open_aggregates = []
+
+        try:
+            voltage_df = self.voltage_frame()
+            voltage_df.to_csv("voltage_timeseries.csv", index=False)
+            print("[Voltage Data] Saved to 'voltage_timeseries.csv'")
+        except Exception as e:
+            print(f"[ERROR] Could not save voltage data: {e}")
+
+        if self.aggregate_rows:
+            try:
+                pd.DataFrame(self.aggregate_rows).to_csv("voltage_aggregates.csv", index=False)
+                print("[Voltage Data] Saved aggregates to 'voltage_aggregates.csv'")
+            except Exception as e:
+                print(f"[ERROR] Could not save voltage aggregates: {e}")
+
+        if self.live_stats is not None:
+            try:
+                self.live_stats.summary().to_csv("voltage_summary.csv")
+                print("[Voltage Data] Saved live statistics to 'voltage_summary.csv'")
+            except Exception as e:
+                print(f"[ERROR] Could not save voltage statistics: {e}")
+
+
+def run_voltage_consumer_federate(solar_data, load_data, node_names, simulation_time, time_step=1.0):
+    federate = VoltageConsumerFederate(solar_data, load_data, node_names, time_step)
+    h.helicsFederateEnterExecutingMode(federate.fed)
+    time.sleep(1)  # Ensure publisher is ready
+
+    current_time = 0
+    while current_time < simulation_time:
+        federate.before_request(current_time)
+
+        next_time = current_time + time_step
+        granted_time = h.helicsFederateRequestTime(federate.fed, next_time)
+        #print(f"[Consumer] Granted time: {granted_time}")
+        current_time = granted_time
+
+        # Wait for voltage update
+        voltage_timeout = 0
+        while not h.helicsInputIsUpdated(federate.sub) and voltage_timeout < 100:
+            time.sleep(0.01)
+            voltage_timeout += 1
+
+        federate.after_grant(current_time)
+
+    federate.finalize()
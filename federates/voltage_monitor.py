@@ -0,0 +1,114 @@
+# federates/voltage_monitor.py
+
+from fnmatch import fnmatchcase
+import numpy as np
+
+# Statistics an aggregate may compute over its nodes and window.
+AGGREGATE_STATS = ("min", "max", "mean")
+
+
+def select_nodes(keys, patterns, exclude=()):
+    """
+    Positions in keys of the keys matching any of the shell-style patterns
+    ('701a', '7*', '799r?'), in keys order and without the excluded ones.
+    Matching is case-insensitive.
+    """
+    patterns = [pattern.lower() for pattern in patterns]
+    exclude = [pattern.lower() for pattern in exclude]
+    return np.array([i for i, key in enumerate(keys)
+                     if any(fnmatchcase(key, p) for p in patterns)
+                     and not any(fnmatchcase(key, p) for p in exclude)], dtype=int)
+
+
+class VoltageMonitor:
+    """
+    Declarative selection of the voltages to keep (config.MONITOR).
+
+    spec is a dict with
+      "record"      node patterns recorded at full resolution
+      "exclude"     node patterns left out of everything (e.g. "sourcebus*")
+      "aggregates"  list of {"name", "nodes" (patterns, default all),
+                    "stats" (any of min/max/mean), "window" (seconds,
+                    default one step)} computed live over the nodes and
+                    fixed time windows [k * window, (k + 1) * window)
+    update(t, V) takes the full voltage vector in voltage_keys order and
+    returns the aggregate rows of the windows that closed at t, so only
+    the recorded values and those rows need to leave the publisher.
+    open_rows() gives the rows of the windows still open, over the samples
+    so far, for a reader that stops before they close.
+    """
+
+    def __init__(self, voltage_keys, spec, time_step=1.0):
+        self.voltage_keys = list(voltage_keys)
+        self.time_step = time_step
+        exclude = spec.get("exclude", ())
+        self.record = select_nodes(self.voltage_keys, spec.get("record", ()), exclude)
+        self.record_keys = [self.voltage_keys[i] for i in self.record]
+
+        self.aggregates = []
+        for aggregate in spec.get("aggregates", ()):
+            stats = list(aggregate.get("stats", AGGREGATE_STATS))
+            unknown = sorted(set(stats) - set(AGGREGATE_STATS))
+            if unknown:
+                raise ValueError(f"Unknown statistics {unknown} in aggregate '{aggregate['name']}'")
+            nodes = select_nodes(self.voltage_keys, aggregate.get("nodes", ("*",)), exclude)
+            if len(nodes) == 0:
+                raise ValueError(f"Aggregate '{aggregate['name']}' matches no nodes")
+            self.aggregates.append({"name": aggregate["name"], "nodes": nodes, "stats": stats,
+                                    "window": float(aggregate.get("window", time_step)), "window_index": None})
+
+    @classmethod
+    def from_config(cls, voltage_keys, spec, time_step=1.0):
+        """The monitor of spec (config.MONITOR), or None to keep every node."""
+        return None if spec is None else cls(voltage_keys, spec, time_step)
+
+    def _reset(self, aggregate, window_index):
+        aggregate["window_index"] = window_index
+        aggregate["min"] = np.inf
+        aggregate["max"] = -np.inf
+        aggregate["sum"] = 0.0
+        aggregate["count"] = 0
+
+    def _row(self, aggregate):
+        window = aggregate["window"]
+        row = {"name": aggregate["name"], "t_start": aggregate["window_index"] * window,
+               "t_end": (aggregate["window_index"] + 1) * window, "samples": aggregate["count"]}
+        for stat in aggregate["stats"]:
+            row[stat] = aggregate[stat] if stat != "mean" else aggregate["sum"] / max(aggregate["count"], 1)
+        return row
+
+    def _close(self, aggregate):
+        row = self._row(aggregate)
+        aggregate["window_index"] = None
+        return row
+
+    def update(self, t, voltages):
+        """
+        Fold in the voltages at time t. Returns the rows of the windows that
+        end before the next step.
+        """
+        voltages = np.asarray(voltages, dtype=float)
+        closed = []
+        for aggregate in self.aggregates:
+            window = aggregate["window"]
+            index = int(np.floor(t / window + 1e-9))
+            if aggregate["window_index"] is not None and index != aggregate["window_index"]:
+                closed.append(self._close(aggregate))
+            if aggregate["window_index"] is None:
+                self._reset(aggregate, index)
+            values = voltages[aggregate["nodes"]]
+            aggregate["min"] = min(aggregate["min"], float(np.nanmin(values)))
+            aggregate["max"] = max(aggregate["max"], float(np.nanmax(values)))
+            aggregate["sum"] += float(np.nanmean(values))
+            aggregate["count"] += 1
+            if t + self.time_step >= (index + 1) * window - 1e-9:
+                closed.append(self._close(aggregate))
+        return closed
+
+    def open_rows(self):
+        """Rows of the windows still open, without closing them."""
+        return [self._row(aggregate) for aggregate in self.aggregates if aggregate["window_index"] is not None]
+
+    def summary(self):
+        return {"nodes": len(self.voltage_keys), "recorded": len(self.record),
+                "aggregates": [a["name"] for a in self.aggregates]}
@@ -0,0 +1,336 @@
+# hosting_capacity.py
+
+import argparse
+import math
+import os
+import time
+import numpy as np
+import pandas as pd
+import config  # Import the configuration
+
+from analytics import RANGE_A
+from event_log import get_logger
+from federates import CircuitPool
+from federates.inverter_federate import (SOLAR_MIN_VALUE, build_ensemble_settings, calculate_injections_batch,
+                                         initialize_ensemble_state, load_node_breakpoints, load_node_sbar)
+from federates.linear_surrogate import apply_loads, get_regulator_taps, set_regulator_taps
+from federates.node_registry import get_registry
+from main import load_inputs
+
+log = get_logger("Hosting_Capacity")
+
+# Search parameters.
+V_LIMIT = RANGE_A[1]     # Over-voltage limit [pu]
+MAX_MULTIPLIER = 10.0    # Largest PV multiplier searched
+TOLERANCE = 0.05         # Width of the final multiplier bracket
+N_WINDOWS = 3            # Critical windows evaluated per candidate
+WINDOW_STEPS = 30        # Steps per critical window
+WARMUP_STEPS = 10        # Steps simulated before each window so the inverter filters settle
+
+
+def critical_windows(solar, load, n_windows=N_WINDOWS, window=WINDOW_STEPS, warmup=WARMUP_STEPS):
+    """
+    Return the start rows of the n_windows non-overlapping windows with the
+    highest mean net export (total PV minus total load), where over-voltage
+    is most likely. solar and load are time x column arrays; every window
+    leaves warmup rows before it.
+    """
+    net = solar.sum(axis=1) - load.sum(axis=1)
+    if len(net) < warmup + window:
+        raise ValueError(f"The profiles have {len(net)} rows, a window needs {warmup + window}")
+    score = np.convolve(net, np.ones(window) / window, mode="valid")
+    score[:warmup] = -np.inf
+    starts = []
+    for start in np.argsort(score)[::-1]:
+        if len(starts) == n_windows or score[start] == -np.inf:
+            break
+        if all(abs(start - other) >= window for other in starts):
+            starts.append(int(start))
+    return sorted(starts)
+
+
+class HostingCapacitySearch:
+    """
+    Search for the largest PV multiplier before any node exceeds v_limit.
+
+    In "node" mode every PV node gets its own search, with its solar
+    production and inverter rating scaled by the multiplier and every
+    other node at its base size; in "feeder" mode all nodes are scaled
+    together. Each search narrows a bracket [lo, hi] on the multiplier,
+    assuming the peak voltage grows with it: the first round tries 0 and
+    max_multiplier, then every round tries `candidates` points spread
+    over the bracket (one point is bisection) and keeps the interval
+    between the last passing and the first failing point, until it is
+    narrower than tolerance.
+
+    A candidate is not run over the whole horizon but over the critical
+    windows of the profiles (see critical_windows), each preceded by a few
+    warm-up steps. The quasi-static loop is the co-simulation's: the
+    inverter control law (calculate_injections_batch) acts on the previous
+    step's voltages and the net loads are solved in OpenDSS. All
+    candidates of all searches and windows in a round are ensemble
+    members, solved together on a CircuitPool with one circuit instance
+    per member.
+    """
+
+    def __init__(self, inputs, mode="node", nodes=None, candidates=1, max_multiplier=MAX_MULTIPLIER,
+                 tolerance=TOLERANCE, v_limit=V_LIMIT, n_windows=N_WINDOWS, window=WINDOW_STEPS,
+                 warmup=WARMUP_STEPS, workers=None, registry=None):
+        if mode not in ("node", "feeder"):
+            raise ValueError(f"Unknown hosting-capacity mode '{mode}'")
+        self.mode = mode
+        self.candidates = candidates
+        self.max_multiplier = max_multiplier
+        self.tolerance = tolerance
+        self.v_limit = v_limit
+        self.window = window
+        self.warmup = warmup
+        self.workers = workers if workers is not None else getattr(config, "CIRCUIT_WORKERS", None)
+        self.registry = get_registry() if registry is None else registry
+
+        self.node_names = list(inputs["node_names"])
+        self.node_keys = [node.lower() for node in self.node_names]
+        self.voltage_columns = self.registry.voltage_positions(self.node_keys)
+        self.node_breakpoints = load_node_breakpoints(inputs["breaking_points"])
+        self.node_sbar = load_node_sbar(inputs["sbar_df"])
+        self.peak_kw = np.array([self.node_sbar.get(key, 0.0) for key in self.node_keys])
+
+        # Profiles as time x column arrays, in node and load-column order.
+        load_columns = [column for column, j in zip(self.registry.load_columns, self.registry.column_load) if j >= 0]
+        n_rows = min(len(inputs["solar_data"]), len(inputs["load_data"]))
+        self.solar = inputs["solar_data"][self.node_names].to_numpy(dtype=float)[:n_rows]
+        self.load = inputs["load_data"][load_columns].to_numpy(dtype=float)[:n_rows]
+        self.load_rows = self.registry.column_load[self.registry.column_load >= 0]
+        self.windows = critical_windows(self.solar, self.load, n_windows, window, warmup)
+
+        if mode == "feeder":
+            self.searches = ["feeder"]
+        else:
+            unknown = sorted(set(nodes or ()) - set(self.node_keys))
+            if unknown:
+                raise ValueError(f"Unknown PV nodes {unknown}")
+            self.searches = [key for key in self.node_keys if not nodes or key in nodes]
+
+        self.pool = None
+        self.rounds = 0
+        self.simulations = 0
+        self.simulated_steps = 0
+
+    def multipliers(self, searches, values):
+        """Per-member multiplier of every PV node (members x nodes)."""
+        scale = np.ones((len(searches), len(self.node_keys)))
+        for k, (search, value) in enumerate(zip(searches, values)):
+            if search == "feeder":
+                scale[k] = value
+            else:
+                scale[k, self.node_keys.index(search)] = value
+        return scale
+
+    def open_pool(self, n_members):
+        if self.pool is not None and len(self.pool) >= n_members:
+            return
+        if self.pool is not None:
+            self.pool.close()
+        path = f"{config.BASE_DIR}/data/ieee37.dss"
+        self.pool = CircuitPool([path] * n_members, self.workers, getattr(config, "FEEDER_REDUCTION", None),
+                                getattr(config, "MONITORED_BUSES", ()))
+        if self.pool.load_names[0] != self.registry.load_names \
+                or self.pool.voltage_keys[0] != self.registry.voltage_keys:
+            raise RuntimeError("Circuit instances do not match the node registry")
+        self.base_taps = get_regulator_taps(self.pool.engines[0])
+        engine = self.pool.engines[0]
+        self.base_kw = np.empty(len(self.registry.load_names))
+        self.base_kvar = np.empty(len(self.registry.load_names))
+        for j, name in enumerate(self.registry.load_names):
+            engine.Loads.Name(name)
+            self.base_kw[j] = engine.Loads.kW()
+            self.base_kvar[j] = engine.Loads.kvar()
+
+    def reset_instance(self, engine, k):
+        """Restore instance k's base loads, initial taps and a flat start."""
+        apply_loads(self.pool.load_names[k], self.base_kw, self.base_kvar, engine)
+        set_regulator_taps(self.base_taps, engine)
+        self.pool.reinitialize(engine)
+
+    def evaluate(self, searches, values):
+        """
+        Simulate every (search, multiplier) candidate over all critical
+        windows. Returns the peak voltage of each candidate and the key of
+        the node where it occurred. A candidate whose power flow does not
+        converge, or gives non-finite voltages, at any step violates the
+        limit with an infinite peak.
+        """
+        n_candidates = len(searches)
+        n_windows = len(self.windows)
+        n_members = n_candidates * n_windows
+        self.open_pool(n_members)
+        # Every member starts from the feeder's base state, whatever the
+        # instance solved before (possibly a diverged candidate).
+        self.pool.map(self.reset_instance, range(len(self.pool)))
+
+        # Member k runs candidate k // n_windows over window k % n_windows.
+        scale = np.repeat(self.multipliers(searches, values), n_windows, axis=0)
+        members = [{}] * n_members
+        settings = build_ensemble_settings(members, self.node_names, self.node_breakpoints, self.node_sbar)
+        settings['sbar'] *= scale
+        state = initialize_ensemble_state(n_members, len(self.node_keys))
+        found = self.voltage_columns >= 0
+        pv_found = self.registry.pv_load >= 0
+        pv_nodes = np.flatnonzero(pv_found)
+        pv_rows = self.registry.pv_load[pv_found]
+        rows = np.tile(np.asarray(self.windows) - self.warmup, n_candidates)
+
+        measured = np.ones((n_members, len(self.node_keys)))
+        peak = np.full(n_members, -np.inf)
+        peak_node = np.zeros(n_members, dtype=int)
+        failed = np.zeros(n_members, dtype=bool)
+        for step in range(self.warmup + self.window):
+            t = rows + step
+            p, q = calculate_injections_batch(state, measured, self.solar[t] * scale, settings,
+                                              solar_min=SOLAR_MIN_VALUE)
+            kw = np.tile(self.base_kw, (n_members, 1))
+            kvar = np.tile(self.base_kvar, (n_members, 1))
+            kw[:, self.load_rows] = self.load[t]
+            for k in range(n_members):
+                np.subtract.at(kw[k], pv_rows, p[k, pv_nodes])
+                np.subtract.at(kvar[k], pv_rows, q[k, pv_nodes])
+            voltages = np.array(self.pool.solve(kw, kvar, n_members))
+            failed |= ~self.pool.converged[:n_members]
+            measured[:, found] = voltages[:, self.voltage_columns[found]]
+            if step >= self.warmup:
+                worst = voltages.argmax(axis=1)
+                v = voltages[np.arange(n_members), worst]
+                higher = v > peak
+                peak[higher] = v[higher]
+                peak_node[higher] = worst[higher]
+        peak[failed] = np.inf
+        self.simulations += n_members
+        self.simulated_steps += n_members * (self.warmup + self.window)
+
+        # A candidate's peak is the highest over its windows.
+        peak = peak.reshape(n_candidates, n_windows)
+        peak_node = peak_node.reshape(n_candidates, n_windows)
+        window = peak.argmax(axis=1)
+        keys = self.registry.voltage_keys
+        return peak.max(axis=1), [keys[peak_node[i, w]] for i, w in enumerate(window)]
+
+    def run(self):
+        """Run all searches; returns the capacity table as a DataFrame."""
+        start = time.perf_counter()
+        self.open_pool(len(self.searches) * max(2, self.candidates) * len(self.windows))
+        lo = {search: 0.0 for search in self.searches}
+        hi = {search: self.max_multiplier for search in self.searches}
+        status = {}
+        peak_at_lo = {}
+        worst_at_hi = {}
+
+        # Round 0 checks both ends of the range.
+        searches = self.searches * 2
+        values = [0.0] * len(self.searches) + [self.max_multiplier] * len(self.searches)
+        peak, worst = self.evaluate(searches, values)
+        self.rounds += 1
+        n = len(self.searches)
+        for i, search in enumerate(self.searches):
+            peak_at_lo[search] = peak[i]
+            if peak[i] > self.v_limit:
+                status[search] = "violated_at_zero"
+                hi[search] = 0.0
+                worst_at_hi[search] = worst[i]
+            elif peak[n + i] <= self.v_limit:
+                status[search] = "above_range"
+                lo[search] = self.max_multiplier
+                peak_at_lo[search] = peak[n + i]
+            else:
+                worst_at_hi[search] = worst[n + i]
+
+        while True:
+            active = [s for s in self.searches if s not in status and hi[s] - lo[s] > self.tolerance]
+            if not active:
+                break
+            searches = []
+            values = []
+            for search in active:
+                step = (hi[search] - lo[search]) / (self.candidates + 1)
+                for c in range(1, self.candidates + 1):
+                    searches.append(search)
+                    values.append(lo[search] + c * step)
+            peak, worst = self.evaluate(searches, values)
+            self.rounds += 1
+            for i, search in enumerate(active):
+                span = slice(i * self.candidates, (i + 1) * self.candidates)
+                # The bracket ends at the first failing candidate.
+                for value, v, node in zip(values[span], peak[span], worst[span]):
+                    if v > self.v_limit:
+                        hi[search] = value
+                        worst_at_hi[search] = node
+                        break
+                    lo[search] = value
+                    peak_at_lo[search] = v
+            log.info("round_done", "Round {round}: {active} searches narrowed", round=self.rounds,
+                     active=len(active))
+
+        table = []
+        for search in self.searches:
+            peak_kw = self.peak_kw.sum() if search == "feeder" else self.peak_kw[self.node_keys.index(search)]
+            table.append({
+                "search": search,
+                "capacity_multiplier": lo[search],
+                "upper_multiplier": hi[search],
+                "capacity_kw": lo[search] * peak_kw,
+                "v_max_at_capacity": peak_at_lo[search],
+                "limiting_node": worst_at_hi.get(search),
+                "status": status.get(search, "converged"),
+            })
+        self.elapsed = time.perf_counter() - start
+        return pd.DataFrame(table).set_index("search")
+
+    def summary(self):
+        """Search cost next to a grid sweep of the same resolution over the full profiles."""
+        grid_points = math.floor(self.max_multiplier / self.tolerance) + 1
+        grid_steps = len(self.searches) * grid_points * len(self.solar)
+        return {
+            "searches": len(self.searches),
+            "rounds": self.rounds,
+            "simulations": self.simulations,
+            "simulated_steps": self.simulated_steps,
+            "grid_sweep_simulations": len(self.searches) * grid_points,
+            "grid_sweep_steps": grid_steps,
+            "step_reduction": grid_steps / max(self.simulated_steps, 1),
+            "elapsed_s": getattr(self, "elapsed", 0.0),
+        }
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the PV hosting capacity per node or of the feeder.")
+    parser.add_argument("--mode", choices=("node", "feeder"), default="node")
+    parser.add_argument("--nodes", nargs="+", help="PV nodes to search (node mode; default: all)")
+    parser.add_argument("--candidates", type=int, default=None,
+                        help="points tried per search and round (default: 1 per node, 3 for the feeder)")
+    parser.add_argument("--max", type=float, default=MAX_MULTIPLIER, help="largest PV multiplier searched")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="final bracket width")
+    parser.add_argument("--v-limit", type=float, default=V_LIMIT, help="over-voltage limit [pu]")
+    parser.add_argument("--windows", type=int, default=N_WINDOWS, help="critical windows per candidate")
+    parser.add_argument("--window", type=int, default=WINDOW_STEPS, help="steps per window")
+    parser.add_argument("--warmup", type=int, default=WARMUP_STEPS, help="warm-up steps before each window")
+    parser.add_argument("--output", default="hosting_capacity.csv")
+    args = parser.parse_args()
+
+    # Set the working directory using the configuration
+    os.chdir(config.BASE_DIR)
+    candidates = args.candidates or (3 if args.mode == "feeder" else 1)
+    search = HostingCapacitySearch(load_inputs(save_max_solar=False), args.mode, args.nodes, candidates,
+                                   args.max, args.tolerance, args.v_limit, args.windows, args.window,
+                                   args.warmup)
+    try:
+        table = search.run()
+    finally:
+        search.close()
+    table.to_csv(args.output)
+    print(table.to_string())
+    print(f"Saved the capacity table to '{args.output}'.")
+    print(f"Search cost: {search.summary()}")
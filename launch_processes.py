@@ -0,0 +1,130 @@
+# launch_processes.py
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import config  # Import the configuration
+
+from main import load_inputs
+from orchestrator import FEDERATE_ORDER, create_federates, run_federates, start_brokers
+
+# Seconds to wait for a child to exit after SIGTERM before killing it.
+SHUTDOWN_TIMEOUT = 5.0
+
+# Seconds between checks of the child processes.
+MONITOR_INTERVAL = 0.2
+
+
+# =============================================================================
+# Child side
+# =============================================================================
+def run_child(name, solver=None, broker=None):
+    """
+    Run one federate in this process, joining the broker at address broker
+    (default: the local broker). Inputs are read from config.DATA_DIR here
+    rather than passed from the parent, so no DataFrame is pickled.
+    """
+    inputs = {}
+    if name != "opendss":
+        # Only the inverter writes max_solar_production.csv, so concurrent
+        # children never write the same file.
+        inputs = load_inputs(save_max_solar=(name == "inverter"))
+    federates = create_federates(inputs, [name], solver, brokers={name: broker})
+    latencies = run_federates(federates, pacing_log=f"pacing_log_{name}.csv")
+    print(f"[{federates[0].name}] {len(latencies)} steps, "
+          f"mean step latency {1e3 * latencies.mean():.2f} ms.")
+
+
+# =============================================================================
+# Parent side
+# =============================================================================
+def forward_output(name, stream):
+    """Print every line of a child's output, prefixed with its name."""
+    for line in iter(stream.readline, ''):
+        print(f"[{name}] {line}", end='', flush=True)
+    stream.close()
+
+
+def stop_children(children):
+    """Terminate all running children, killing any that ignore SIGTERM."""
+    for proc in children.values():
+        if proc.poll() is None:
+            proc.terminate()
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+    for name, proc in children.items():
+        try:
+            proc.wait(timeout=max(deadline - time.monotonic(), 0))
+        except subprocess.TimeoutExpired:
+            print(f"[WARN] {name} did not exit after SIGTERM; killing it.")
+            proc.kill()
+            proc.wait()
+
+
+def launch(names=FEDERATE_ORDER, solver=None):
+    """
+    Start the local brokers in this process (a broker tree with
+    config.BROKER_GROUPS) and one child process per federate, forward
+    their output and wait for them to finish. If a child fails or the
+    launcher is interrupted, the remaining children are shut down.
+    Returns a dict of exit codes per federate.
+    """
+    close_brokers, brokers = start_brokers(names)
+    children = {}
+    forwarders = []
+    try:
+        for name in names:
+            cmd = [sys.executable, "-u", os.path.abspath(__file__), "--child", name]
+            if solver is not None:
+                cmd += ["--solver", solver]
+            if name in brokers:
+                cmd += ["--broker", brokers[name]]
+            proc = subprocess.Popen(cmd, cwd=config.BASE_DIR, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, text=True)
+            children[name] = proc
+            forwarder = threading.Thread(target=forward_output, args=(name, proc.stdout), daemon=True)
+            forwarder.start()
+            forwarders.append(forwarder)
+
+        while any(proc.poll() is None for proc in children.values()):
+            failed = [name for name, proc in children.items() if proc.poll() not in (None, 0)]
+            if failed:
+                print(f"[ERROR] Federate process(es) {failed} failed; stopping the others.")
+                break
+            time.sleep(MONITOR_INTERVAL)
+    except KeyboardInterrupt:
+        print("[WARN] Interrupted; stopping federate processes.")
+    finally:
+        stop_children(children)
+        for forwarder in forwarders:
+            forwarder.join(timeout=1.0)
+        close_brokers()
+
+    return {name: proc.returncode for name, proc in children.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run each federate in its own process.")
+    parser.add_argument("--federates", nargs="+", default=list(FEDERATE_ORDER),
+                        choices=FEDERATE_ORDER, help="federates to launch")
+    parser.add_argument("--solver", choices=("exact", "linear"), default=None,
+                        help="power-flow engine of the OpenDSS federate")
+    parser.add_argument("--child", choices=FEDERATE_ORDER, help=argparse.SUPPRESS)
+    parser.add_argument("--broker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Set the working directory using the configuration
+    os.chdir(config.BASE_DIR)
+    if args.child is not None:
+        # Let the parent decide when to stop; a Ctrl-C in the terminal
+        # reaches the whole process group.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        run_child(args.child, args.solver, args.broker)
+    else:
+        wall = time.perf_counter()
+        exit_codes = launch(args.federates, args.solver)
+        print(f"Simulation complete in {time.perf_counter() - wall:.2f} s. Exit codes: {exit_codes}")
+        sys.exit(0 if all(code == 0 for code in exit_codes.values()) else 1)
@@ -0,0 +1,269 @@
+# orchestrator.py
+
+import argparse
+import os
+import time
+import helics as h
+import numpy as np
+import config  # Import the configuration
+
+from federates import VoltageConsumerFederate, OpenDSSFederate, InverterFederate
+from main import load_inputs, start_broker, close_broker, run_threaded
+from broker_topology import BrokerTree
+from pacing import DEADLINE_TOLERANCE, RealTimePacer
+
+# Federates in the order they are stepped within each time step.
+FEDERATE_ORDER = ("consumer", "opendss", "inverter")
+
+
+def federate_schedule(name, inputs):
+    """
+    Update period and offset of federate name from config.FEDERATE_PERIODS
+    (default: every config.TIME_STEP). The federate samples at
+    offset + k * period for k = 1, 2, ...
+    """
+    spec = (getattr(config, "FEDERATE_PERIODS", None) or {}).get(name, config.TIME_STEP)
+    period, offset = spec if isinstance(spec, (tuple, list)) else (spec, 0.0)
+    if period == "data":
+        # Native resolution of the load and solar profiles.
+        period = float(np.median(np.diff(inputs["load_data"]["time"].values)))
+    period, offset = float(period), float(offset)
+    if period <= 0 or not 0 <= offset < period:
+        raise ValueError(f"Invalid schedule for federate '{name}': period {period}, offset {offset}")
+    return period, offset
+
+
+def create_federates(inputs, names=FEDERATE_ORDER, solver=None, reuse_circuit=False, brokers=None):
+    """
+    Create the requested federates (registration only) in names order.
+    reuse_circuit lets the OpenDSS federate reset an already compiled
+    circuit instead of compiling it again. brokers maps a federate name to
+    the address of the broker it joins (default: the local broker).
+
+    Each federate steps at its own period (see federate_schedule()), which
+    is also its time delta; period and offset are kept on the federate for
+    run_federates().
+    """
+    brokers = brokers or {}
+    federates = []
+    for name in names:
+        period, offset = federate_schedule(name, inputs)
+        if name == "consumer":
+            federate = VoltageConsumerFederate(
+                inputs["solar_data"], inputs["load_data"], inputs["node_names"], period,
+                broker=brokers.get(name))
+        elif name == "opendss":
+            federate = OpenDSSFederate(solver, period, reuse_circuit=reuse_circuit, broker=brokers.get(name))
+        elif name == "inverter":
+            federate = InverterFederate(
+                inputs["node_names"], period, inputs["breaking_points"], inputs["sbar_df"],
+                broker=brokers.get(name))
+        else:
+            raise ValueError(f"Unknown federate '{name}'")
+        h.helicsFederateSetTimeProperty(federate.fed, h.HELICS_PROPERTY_TIME_PERIOD, period)
+        h.helicsFederateSetTimeProperty(federate.fed, h.HELICS_PROPERTY_TIME_OFFSET, offset)
+        # Grants only at the requested times, even when an input changes
+        # in between (a faster federate publishing).
+        h.helicsFederateSetFlagOption(federate.fed, h.HELICS_FLAG_UNINTERRUPTIBLE, True)
+        federate.period, federate.offset = period, offset
+        federates.append(federate)
+    return federates
+
+
+def run_federates(federates, pacing_log="pacing_log.csv"):
+    """
+    Step already-created federates to config.SIMULATION_TIME.
+
+    Every federate without a pending request runs, in list order, its
+    before_request() hook and requests its next sample time with
+    helicsFederateRequestTimeAsync. The federates with the earliest pending
+    time are then granted (helicsFederateRequestTimeComplete; no other
+    federate can hold them back, since all have requested later times) and
+    their after_grant() hooks run. With equal periods every federate is
+    stepped in every round, as one time step. The hooks read whatever
+    value each input holds, i.e. the latest sample of a slower federate,
+    so nothing polls or sleeps, and the interleaving is the same on every
+    run. A federate finalizes once it reaches the end of the simulation.
+
+    Sample times are computed as offset + k * period rather than summed,
+    so fast federates stay on their grid over long runs.
+
+    With config.REAL_TIME_SPEEDUP every round is released at its simulated
+    time divided by the speed-up (1.0 for wall-clock speed), and deadline
+    misses are written to pacing_log with the phase that caused them (see
+    pacing.RealTimePacer).
+
+    Returns the wall-clock latency of each round of grants in seconds,
+    without the time spent waiting for a deadline.
+    """
+    # Entering executing mode blocks until every federate is ready, so it
+    # has to be asynchronous when one thread owns several of them.
+    for federate in federates:
+        h.helicsFederateEnterExecutingModeAsync(federate.fed)
+    for federate in federates:
+        h.helicsFederateEnterExecutingModeComplete(federate.fed)
+    for federate in federates:
+        if isinstance(federate, OpenDSSFederate):
+            federate.load_circuit()
+
+    speedup = getattr(config, "REAL_TIME_SPEEDUP", None)
+    pacer = RealTimePacer(speedup, getattr(config, "DEADLINE_TOLERANCE", DEADLINE_TOLERANCE))
+    latencies = []
+    current = [0.0] * len(federates)
+    samples = [0] * len(federates)
+    pending = {}
+    while True:
+        step_start = time.perf_counter()
+        for i, federate in enumerate(federates):
+            if i not in pending and current[i] < config.SIMULATION_TIME:
+                federate.before_request(current[i])
+                pacer.lap(f"{federate.name}.before_request")
+                samples[i] += 1
+                period = getattr(federate, "period", config.TIME_STEP)
+                pending[i] = round(getattr(federate, "offset", 0.0) + samples[i] * period, 9)
+                h.helicsFederateRequestTimeAsync(federate.fed, pending[i])
+        if not pending:
+            break
+
+        next_time = min(pending.values())
+        pacer.lap("request")
+        waited = pacer.release(next_time)
+        due = sorted(i for i, requested in pending.items() if requested == next_time)
+        granted = [h.helicsFederateRequestTimeComplete(federates[i].fed) for i in due]
+        pacer.lap("grant")
+        for i, granted_time in zip(due, granted):
+            federates[i].after_grant(granted_time)
+            pacer.lap(f"{federates[i].name}.after_grant")
+            current[i] = granted_time
+            del pending[i]
+        # A finished federate would hold back the grants of the others past
+        # its own last time, so it finalizes right away.
+        for i in due:
+            if current[i] >= config.SIMULATION_TIME:
+                federates[i].finalize()
+                pacer.lap(f"{federates[i].name}.finalize")
+        latencies.append(time.perf_counter() - step_start - waited)
+
+    if speedup is not None:
+        summary = pacer.summary()
+        print(f"[Pacing] {speedup}x real time: {summary['misses']} of {summary['rounds']} deadlines missed, "
+              f"lateness p99 {summary['lateness_p99_ms']:.2f} ms (max {summary['lateness_max_ms']:.2f} ms), "
+              f"round work p99 {summary['work_p99_ms']:.2f} ms; misses by phase {summary['misses_by_phase']}")
+        try:
+            pacer.frame().to_csv(pacing_log, index=False)
+            print(f"[Pacing] Saved round timing to '{pacing_log}'")
+        except Exception as e:
+            print(f"[ERROR] Could not save pacing log: {e}")
+    return np.array(latencies)
+
+
+def start_brokers(names):
+    """
+    Start the brokers for the federates in names: one local broker, or
+    with config.BROKER_GROUPS a root broker with a sub-broker per group.
+    Returns a close function and each federate's broker address.
+    """
+    groups = getattr(config, "BROKER_GROUPS", None)
+    if groups:
+        tree, brokers = BrokerTree.for_federates(names, groups)
+        return tree.close, brokers
+    broker = start_broker(len(names))
+    return lambda: close_broker(broker), {}
+
+
+def run_single_loop(inputs, names=FEDERATE_ORDER, solver=None):
+    """
+    Drive the requested federates from one thread against local brokers.
+    Returns the wall-clock latency of each round of grants in seconds.
+    """
+    close_brokers, brokers = start_brokers(names)
+    federates = create_federates(inputs, names, solver, brokers=brokers)
+    latencies = run_federates(federates)
+    close_brokers()
+    return latencies
+
+
+def benchmark(inputs):
+    """
+    Run the threaded launcher and the single-loop orchestrator on the same
+    inputs and print wall time, CPU time and per-step latency for both.
+    """
+    steps = int(round(config.SIMULATION_TIME / config.TIME_STEP))
+    results = {}
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    run_threaded(inputs)
+    results["threaded"] = (time.perf_counter() - wall, time.process_time() - cpu, None)
+    h.helicsCleanupLibrary()
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    latencies = run_single_loop(inputs)
+    results["single_loop"] = (time.perf_counter() - wall, time.process_time() - cpu, latencies)
+    h.helicsCleanupLibrary()
+
+    print(f"Launcher benchmark ({steps} steps of {config.TIME_STEP} s):")
+    for name, (wall, cpu, latencies) in results.items():
+        line = (f"  {name:12s} wall={wall:8.2f} s  cpu={cpu:8.2f} s  "
+                f"wall/step={1e3 * wall / steps:8.2f} ms  cpu/step={1e3 * cpu / steps:8.2f} ms")
+        if latencies is not None:
+            line += (f"  step p50={1e3 * np.percentile(latencies, 50):.2f} ms"
+                     f"  p99={1e3 * np.percentile(latencies, 99):.2f} ms")
+        print(line)
+    return results
+
+
+def surrogate_report(inputs, names=FEDERATE_ORDER):
+    """
+    Run the co-simulation with the exact and with the linear power flow and
+    print how far the voltages published by the linear run are from the
+    exact run's, with the surrogate's counters. Both runs close the loop:
+    the inverters react to the published voltages and the regulators act,
+    so the errors include their feedback.
+    """
+    runs = {}
+    for solver in ("exact", "linear"):
+        close_brokers, brokers = start_brokers(names)
+        federates = create_federates(inputs, names, solver, brokers=brokers)
+        run_federates(federates)
+        close_brokers()
+        h.helicsCleanupLibrary()
+        runs[solver] = {type(federate).__name__: federate for federate in federates}
+
+    exact = runs["exact"]["VoltageConsumerFederate"].voltage_frame().set_index("time")
+    linear = runs["linear"]["VoltageConsumerFederate"].voltage_frame().set_index("time")
+    errors = (linear - exact).abs().max(axis=1).to_numpy()
+    report = runs["linear"]["OpenDSSFederate"].surrogate.summary()
+    report.update({
+        "steps": len(errors),
+        "max_abs_error": float(errors.max()),
+        "mean_abs_error": float(errors.mean()),
+        "p99_abs_error": float(np.percentile(errors, 99)),
+        "steps_over_bound": int((errors > runs["linear"]["OpenDSSFederate"].surrogate.error_bound).sum()),
+    })
+    print("Linear surrogate accuracy in the co-simulation loop:")
+    for key, value in report.items():
+        print(f"  {key}: {value}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the co-simulation from a single loop.")
+    parser.add_argument("--federates", nargs="+", default=list(FEDERATE_ORDER),
+                        choices=FEDERATE_ORDER, help="federates to run, in stepping order")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="compare against the threaded launcher in main.py")
+    parser.add_argument("--surrogate-report", action="store_true",
+                        help="compare the linear power-flow surrogate against exact solves")
+    args = parser.parse_args()
+
+    # Set the working directory using the configuration
+    os.chdir(config.BASE_DIR)
+    inputs = load_inputs()
+    if args.benchmark:
+        benchmark(inputs)
+    elif args.surrogate_report:
+        surrogate_report(inputs, args.federates)
+    else:
+        latencies = run_single_loop(inputs, args.federates)
+        print(f"Simulation complete. {len(latencies)} rounds, "
+              f"mean round latency {1e3 * latencies.mean():.2f} ms.")
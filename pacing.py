@@ -0,0 +1,102 @@
+# pacing.py
+
+import time
+import numpy as np
+import pandas as pd
+from event_log import get_logger
+
+log = get_logger("Pacing")
+
+# Lateness of a round beyond which it counts as a deadline miss [s].
+DEADLINE_TOLERANCE = 0.005
+
+# The last part of every wait is spent spinning instead of sleeping, since
+# time.sleep() may overshoot by about a scheduler tick [s].
+SPIN_MARGIN = 0.002
+
+
+class RealTimePacer:
+    """
+    Wall-clock pacing of a federate loop.
+
+    release(t) waits until simulated time t is due, i.e. t / speedup
+    seconds of wall time after start(); speedup None runs as fast as
+    possible and only keeps the records. lap(phase) charges the wall time
+    since the previous lap to phase, so the work between two releases is
+    split into phases (e.g. "Inverter_Federate.before_request", "grant").
+
+    A release later than its deadline by more than tolerance is a deadline
+    miss. It is attributed to the phase that took the longest since the
+    previous release.
+    """
+
+    def __init__(self, speedup=None, tolerance=DEADLINE_TOLERANCE, spin_margin=SPIN_MARGIN):
+        if speedup is not None and speedup <= 0:
+            raise ValueError(f"Speed-up factor must be positive, got {speedup}")
+        self.speedup = speedup
+        self.tolerance = tolerance
+        self.spin_margin = spin_margin
+        self.rows = []
+        self.start()
+
+    def start(self):
+        """Align simulated time 0 with now."""
+        self.t0 = time.perf_counter()
+        self.last = self.t0
+        self.phases = {}
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def release(self, sim_time):
+        """
+        Wait until sim_time is due and record the round that ends here.
+        Returns the time spent waiting.
+        """
+        work = sum(self.phases.values())
+        cause, cause_time = max(self.phases.items(), key=lambda item: item[1], default=(None, 0.0))
+        arrived = now = time.perf_counter()
+        lateness = 0.0
+        if self.speedup is not None:
+            deadline = self.t0 + sim_time / self.speedup
+            if now < deadline - self.spin_margin:
+                time.sleep(deadline - self.spin_margin - now)
+            while time.perf_counter() < deadline:
+                pass
+            now = time.perf_counter()
+            lateness = now - deadline
+        miss = lateness > self.tolerance
+        if miss:
+            log.warn("deadline_miss", "Released t={time} {lateness} ms late; slowest phase {phase} ({phase_ms} ms)",
+                     key=cause, time=sim_time, lateness=round(1e3 * lateness, 3), phase=cause,
+                     phase_ms=round(1e3 * cause_time, 3))
+        self.rows.append({"time": sim_time, "wall": now - self.t0, "lateness": lateness, "work": work,
+                          "miss": miss, "phase": cause, "phase_time": cause_time})
+        self.phases = {}
+        self.last = now
+        return now - arrived
+
+    def frame(self):
+        """One row per release: lateness, work since the previous one and its slowest phase."""
+        return pd.DataFrame(self.rows, columns=["time", "wall", "lateness", "work", "miss", "phase", "phase_time"])
+
+    def summary(self):
+        df = self.frame()
+        if df.empty:
+            return {"rounds": 0, "misses": 0}
+        misses = df[df["miss"]]
+        return {
+            "speedup": self.speedup,
+            "rounds": len(df),
+            "misses": len(misses),
+            "miss_rate": len(misses) / len(df),
+            "lateness_p50_ms": 1e3 * float(np.percentile(df["lateness"], 50)),
+            "lateness_p99_ms": 1e3 * float(np.percentile(df["lateness"], 99)),
+            "lateness_max_ms": 1e3 * float(df["lateness"].max()),
+            "work_p50_ms": 1e3 * float(np.percentile(df["work"], 50)),
+            "work_p99_ms": 1e3 * float(np.percentile(df["work"], 99)),
+            "work_max_ms": 1e3 * float(df["work"].max()),
+            "misses_by_phase": misses["phase"].value_counts().to_dict(),
+        }
@@ -1,36 +1,280 @@
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
-# Load the voltage timeseries data
-df = pd.read_csv("voltage_timeseries.csv")
-
-# --- Choose Your Plotting Option ---
-
-# None for all nodes, array of strings for specific nodes
-nodes_to_plot = ["701a", "701b", "701c", "727a", "727b", "727c"]
-#nodes_to_plot = None
-
-# --- Determine Which Nodes to Plot ---
-if nodes_to_plot is None or len(nodes_to_plot) == 0:
-    # Automatically choose all columns except the "time" column.
-    nodes_to_plot = [col for col in df.columns if col != "time"]
-else:
-    # Check that each specified node exists in the DataFrame.
-    missing = [n for n in nodes_to_plot if n not in df.columns]
-    if missing:
-        print(f"[ERROR] The following nodes are missing in the CSV: {missing}")
-        print("Available nodes:", list(df.columns))
-        exit()
-
-# --- Plotting ---
-plt.figure(figsize=(10, 6))
-for node in nodes_to_plot:
-    plt.plot(df['time'], df[node], label=node)
-
-plt.xlabel("Time [s]")
-plt.ylabel("Voltage Magnitude [pu]")
-plt.title("Voltage Magnitude Over Time")
-plt.grid(True)
-plt.legend()
-plt.tight_layout()
-plt.show()
+# Voltage timeseries written by the voltage consumer federate.
+CSV_PATH = "voltage_timeseries.csv"
+
+# Rows read per chunk; bounds memory independently of the file length.
+CHUNK_SIZE = 100_000
+
+# Points drawn per trace after downsampling.
+MAX_POINTS = 2000
+
+# Min/max buckets kept per output point before LTTB picks the final points.
+PREAGGREGATION_FACTOR = 4
+
+
+# =============================================================================
+# Lazy loading
+# =============================================================================
+def read_columns(path):
+    """Return the column names of a CSV file without reading its rows."""
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def iter_chunks(path, columns, time_window=None, chunksize=CHUNK_SIZE):
+    """
+    Yield DataFrames holding only 'time' and the requested columns,
+    restricted to time_window = (start, end). Rows are assumed to be
+    sorted by time, so reading stops once the window has been passed.
+    """
+    usecols = ['time'] + [c for c in columns if c != 'time']
+    reader = pd.read_csv(path, usecols=usecols, chunksize=chunksize)
+    for chunk in reader:
+        if time_window is not None:
+            start, end = time_window
+            if chunk['time'].iloc[0] > end:
+                break
+            chunk = chunk[(chunk['time'] >= start) & (chunk['time'] <= end)]
+            if chunk.empty:
+                continue
+        yield chunk
+
+
+def time_range(path, time_window=None):
+    """
+    Return the (first, last) time in the file, clipped to time_window.
+    Only the first data row and the tail of the file are read.
+    """
+    columns = read_columns(path)
+    t_first = float(pd.read_csv(path, usecols=['time'], nrows=1)['time'].iloc[0])
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        size = f.tell()
+        block = 4096
+        while True:
+            f.seek(max(size - block, 0))
+            lines = f.read().splitlines()
+            if len(lines) > 2 or block >= size:
+                break
+            block *= 2
+    last_line = next(line for line in reversed(lines) if line.strip())
+    t_last = float(last_line.decode().split(',')[columns.index('time')])
+    if time_window is not None:
+        t_first = max(t_first, time_window[0])
+        t_last = min(t_last, time_window[1])
+    if t_first > t_last:
+        raise ValueError(f"No rows of '{path}' fall inside the time window {time_window}")
+    return t_first, t_last
+
+
+# =============================================================================
+# Downsampling
+# =============================================================================
+class MinMaxBuckets:
+    """
+    Streaming min/max envelope of one or more traces over fixed time buckets.
+    Chunks are folded in with update(); only n_buckets values per trace
+    and statistic are kept in memory.
+    """
+
+    def __init__(self, names, t_start, t_end, n_buckets):
+        self.names = list(names)
+        self.t_start = t_start
+        self.width = max((t_end - t_start) / n_buckets, np.finfo(float).tiny)
+        self.n_buckets = n_buckets
+        shape = (n_buckets, len(self.names))
+        self.vmin = np.full(shape, np.inf)
+        self.vmax = np.full(shape, -np.inf)
+        self.tmin = np.full(shape, np.nan)
+        self.tmax = np.full(shape, np.nan)
+
+    def update(self, t, values):
+        """Fold a chunk of times (n,) and values (n, traces) into the buckets."""
+        t = np.asarray(t, dtype=float)
+        values = np.asarray(values, dtype=float).reshape(len(t), len(self.names))
+        bucket = np.clip(((t - self.t_start) / self.width).astype(int), 0, self.n_buckets - 1)
+        # Rows are time-sorted, so each bucket is a contiguous run.
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        ids = bucket[starts]
+        ends = np.r_[starts[1:], len(t)]
+        for s, e, b in zip(starts, ends, ids):
+            block = values[s:e]
+            i_min = np.nanargmin(np.where(np.isnan(block), np.inf, block), axis=0)
+            i_max = np.nanargmax(np.where(np.isnan(block), -np.inf, block), axis=0)
+            cols = np.arange(block.shape[1])
+            new_min = block[i_min, cols]
+            new_max = block[i_max, cols]
+            lower = new_min < self.vmin[b]
+            higher = new_max > self.vmax[b]
+            self.vmin[b, lower] = new_min[lower]
+            self.tmin[b, lower] = t[s:e][i_min[lower]]
+            self.vmax[b, higher] = new_max[higher]
+            self.tmax[b, higher] = t[s:e][i_max[higher]]
+
+    def points(self, j):
+        """Return the (t, v) envelope points of trace j in time order."""
+        t = np.column_stack([self.tmin[:, j], self.tmax[:, j]]).ravel()
+        v = np.column_stack([self.vmin[:, j], self.vmax[:, j]]).ravel()
+        # Drop empty buckets and the repeated point of single-sample buckets.
+        same = np.column_stack([np.zeros(self.n_buckets, dtype=bool),
+                                self.tmax[:, j] == self.tmin[:, j]]).ravel()
+        keep = ~np.isnan(t) & ~same
+        t, v = t[keep], v[keep]
+        order = np.argsort(t, kind='stable')
+        return t[order], v[order]
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling. Returns at most n_out
+    points, always keeping the first and last sample.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    out_idx = np.empty(n_out, dtype=int)
+    out_idx[0] = 0
+    out_idx[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point for the final bucket).
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a])
+                      - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out_idx[i + 1] = a
+    return x[out_idx], y[out_idx]
+
+
+def load_decimated(path, nodes, time_window=None, max_points=MAX_POINTS,
+                   method="lttb", chunksize=CHUNK_SIZE):
+    """
+    Read the given node columns in one streaming pass and return
+    {node: (t, v)} with at most max_points points per node.
+
+    method="minmax" keeps the min and max of max_points/2 time buckets;
+    method="lttb" keeps PREAGGREGATION_FACTOR times more buckets and then
+    selects the final points with LTTB.
+    """
+    if method not in ("lttb", "minmax"):
+        raise ValueError(f"Unknown downsampling method '{method}'")
+    t_start, t_end = time_range(path, time_window)
+    n_buckets = max(max_points // 2, 1)
+    if method == "lttb":
+        n_buckets *= PREAGGREGATION_FACTOR
+    buckets = MinMaxBuckets(nodes, t_start, t_end, n_buckets)
+    for chunk in iter_chunks(path, nodes, time_window, chunksize):
+        buckets.update(chunk['time'].to_numpy(), chunk[nodes].to_numpy(dtype=float))
+
+    traces = {}
+    for j, node in enumerate(nodes):
+        t, v = buckets.points(j)
+        if method == "lttb":
+            t, v = lttb(t, v, max_points)
+        traces[node] = (t, v)
+    return traces
+
+
+def load_envelope(path, nodes=None, time_window=None, max_points=MAX_POINTS,
+                  chunksize=CHUNK_SIZE):
+    """
+    Compute the band spanned by all (or the given) nodes in one streaming
+    pass. Returns (t, lower, upper, mean) with one entry per time bucket.
+    """
+    if nodes is None:
+        nodes = [c for c in read_columns(path) if c != 'time']
+    t_start, t_end = time_range(path, time_window)
+    n_buckets = max(max_points, 1)
+    width = max((t_end - t_start) / n_buckets, np.finfo(float).tiny)
+
+    lower = np.full(n_buckets, np.inf)
+    upper = np.full(n_buckets, -np.inf)
+    total = np.zeros(n_buckets)
+    count = np.zeros(n_buckets)
+    for chunk in iter_chunks(path, nodes, time_window, chunksize):
+        values = chunk[nodes].to_numpy(dtype=float)
+        t = chunk['time'].to_numpy(dtype=float)
+        bucket = np.clip(((t - t_start) / width).astype(int), 0, n_buckets - 1)
+        np.minimum.at(lower, bucket, np.nanmin(values, axis=1))
+        np.maximum.at(upper, bucket, np.nanmax(values, axis=1))
+        np.add.at(total, bucket, np.nansum(values, axis=1))
+        np.add.at(count, bucket, np.sum(~np.isnan(values), axis=1))
+
+    keep = count > 0
+    centers = t_start + (np.arange(n_buckets) + 0.5) * width
+    return centers[keep], lower[keep], upper[keep], total[keep] / count[keep]
+
+
+# =============================================================================
+# Plotting
+# =============================================================================
+def plot_nodes(path, nodes, time_window=None, max_points=MAX_POINTS, method="lttb", ax=None):
+    """Plot the downsampled voltage traces of the given nodes."""
+    if ax is None:
+        ax = plt.gca()
+    for node, (t, v) in load_decimated(path, nodes, time_window, max_points, method).items():
+        ax.plot(t, v, label=node)
+    return ax
+
+
+def plot_envelope(path, nodes=None, time_window=None, max_points=MAX_POINTS, ax=None):
+    """Plot the min/max band and mean of all (or the given) nodes."""
+    if ax is None:
+        ax = plt.gca()
+    t, lower, upper, mean = load_envelope(path, nodes, time_window, max_points)
+    ax.fill_between(t, lower, upper, alpha=0.3, label="min/max (all nodes)")
+    ax.plot(t, mean, color="k", linewidth=1.0, label="mean (all nodes)")
+    return ax
+
+
+if __name__ == "__main__":
+    # --- Choose Your Plotting Option ---
+
+    # None for all nodes, array of strings for specific nodes
+    nodes_to_plot = ["701a", "701b", "701c", "727a", "727b", "727c"]
+    #nodes_to_plot = None
+
+    # (start, end) in seconds, or None for the whole run
+    time_window = None
+
+    # "lttb" (shape preserving) or "minmax" (envelope per bucket)
+    downsample_method = "lttb"
+
+    # Draw the min/max band of all nodes behind the selected traces
+    show_envelope = False
+
+    # --- Determine Which Nodes to Plot ---
+    available = read_columns(CSV_PATH)
+    if nodes_to_plot is None or len(nodes_to_plot) == 0:
+        # Automatically choose all columns except the "time" column.
+        nodes_to_plot = [col for col in available if col != "time"]
+    else:
+        # Check that each specified node exists in the CSV header.
+        missing = [n for n in nodes_to_plot if n not in available]
+        if missing:
+            print(f"[ERROR] The following nodes are missing in the CSV: {missing}")
+            print("Available nodes:", available)
+            exit()
+
+    # --- Plotting ---
+    plt.figure(figsize=(10, 6))
+    if show_envelope:
+        plot_envelope(CSV_PATH, time_window=time_window)
+    plot_nodes(CSV_PATH, nodes_to_plot, time_window, method=downsample_method)
+
+    plt.xlabel("Time [s]")
+    plt.ylabel("Voltage Magnitude [pu]")
+    plt.title("Voltage Magnitude Over Time")
+    plt.grid(True)
+    plt.legend()
+    plt.tight_layout()
+    plt.show()
@@ -0,0 +1,188 @@
+# sim_server.py
+
+import argparse
+import ast
+import os
+import time
+from multiprocessing.connection import Listener, Client
+import helics as h
+import config  # Import the configuration
+
+from event_log import get_logger
+from federates import VoltageConsumerFederate, InverterFederate
+from federates.opendss_federate import compile_circuit
+from main import load_inputs, start_broker, close_broker
+from orchestrator import FEDERATE_ORDER, create_federates, run_federates
+
+log = get_logger("Simulation_Server")
+
+# config settings a scenario may override. Paths and input data are fixed
+# for the lifetime of the server.
+SCENARIO_SETTINGS = ("SIMULATION_TIME", "TIME_STEP", "Sbar_scaling", "POWER_FLOW_SOLVER",
+                     "LIVE_ANALYTICS", "ENSEMBLE", "PARALLEL_CIRCUITS", "CIRCUIT_WORKERS",
+                     "POWER_FLOW_CACHE_SIZE", "POWER_FLOW_CACHE_RESOLUTION",
+                     "FEEDER_REDUCTION", "MONITORED_BUSES", "INVERTER_CLUSTERS",
+                     "MONITOR", "FEDERATE_PERIODS", "VOLTAGE_INTERPOLATION",
+                     "PROFILE_INTERPOLATION", "PROFILE_CHUNK_STEPS", "REAL_TIME_SPEEDUP",
+                     "DEADLINE_TOLERANCE", "CONTROL_CURVES")
+
+
+class SimulationServer:
+    """
+    Long-lived process that keeps the inputs loaded and the circuit
+    compiled, and runs scenarios sent over a local socket.
+
+    A request is a dict: {"command": "run", "settings": {...},
+    "federates": [...]} runs one scenario with the given config overrides
+    (see SCENARIO_SETTINGS) and returns its voltages and statistics;
+    {"command": "status"} and {"command": "shutdown"} do what they say.
+    Between scenarios the overrides are undone, the federates are freed
+    and the circuit is reset to its initial state, so every scenario
+    starts from the same state.
+    """
+
+    def __init__(self, address=None, authkey=None):
+        self.address = address or getattr(config, "SERVER_ADDRESS", ("localhost", 6500))
+        self.authkey = authkey or getattr(config, "SERVER_AUTHKEY", b"helics-sim")
+        start = time.perf_counter()
+        self.inputs = load_inputs()
+        compile_circuit(f"{config.BASE_DIR}/data/ieee37.dss")
+        self.startup_time = time.perf_counter() - start
+        self.started = time.time()
+        self.runs = 0
+
+    def run_scenario(self, settings=None, names=FEDERATE_ORDER):
+        """Run one scenario with settings applied to config; returns the results dict."""
+        settings = settings or {}
+        unknown = sorted(set(settings) - set(SCENARIO_SETTINGS))
+        if unknown:
+            raise ValueError(f"Settings {unknown} cannot be changed per scenario")
+        missing = object()
+        saved = {name: getattr(config, name, missing) for name in settings}
+        for name, value in settings.items():
+            setattr(config, name, value)
+
+        broker = None
+        federates = []
+        completed = False
+        try:
+            start = time.perf_counter()
+            broker = start_broker(len(names))
+            federates = create_federates(self.inputs, names, reuse_circuit=True)
+            setup_time = time.perf_counter() - start
+            latencies = run_federates(federates)
+            run_time = time.perf_counter() - start - setup_time
+            completed = True
+        finally:
+            # Free the federates rather than cleaning up the whole library,
+            # which takes longer than a short scenario.
+            for federate in federates:
+                if completed:
+                    h.helicsFederateFree(federate.fed)
+                else:
+                    h.helicsFederateDestroy(federate.fed)
+            close_broker(broker)
+            for name, value in saved.items():
+                if value is missing:
+                    delattr(config, name)
+                else:
+                    setattr(config, name, value)
+        self.runs += 1
+
+        results = {"ok": True, "steps": len(latencies), "setup_time": setup_time, "run_time": run_time,
+                   "mean_step_latency": float(latencies.mean()) if len(latencies) else 0.0}
+        for federate in federates:
+            if isinstance(federate, VoltageConsumerFederate):
+                results["voltages"] = federate.voltage_frame()
+                if federate.monitor is not None:
+                    results["voltage_aggregates"] = federate.aggregate_rows
+                if federate.live_stats is not None:
+                    results["voltage_summary"] = federate.live_stats.summary()
+            elif isinstance(federate, InverterFederate) and federate.usage is not None:
+                results["inverter_usage"] = federate.usage.summary()
+        return results
+
+    def status(self):
+        return {"ok": True, "pid": os.getpid(), "uptime": time.time() - self.started,
+                "startup_time": self.startup_time, "runs": self.runs}
+
+    def handle(self, request):
+        """Answer one request; errors are returned, not raised."""
+        command = request.get("command", "run")
+        try:
+            if command == "run":
+                return self.run_scenario(request.get("settings"), request.get("federates") or FEDERATE_ORDER)
+            if command in ("status", "shutdown"):
+                return self.status()
+            raise ValueError(f"Unknown command '{command}'")
+        except Exception as e:
+            log.error("request_failed", "Request {command} failed: {error}", rate_limit=False,
+                      command=command, error=e)
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    def serve(self):
+        """Accept connections until a shutdown request arrives."""
+        with Listener(self.address, authkey=self.authkey) as listener:
+            print(f"[Server] Listening on {self.address[0]}:{self.address[1]} "
+                  f"(startup took {self.startup_time:.2f} s).")
+            while True:
+                with listener.accept() as conn:
+                    while True:
+                        try:
+                            request = conn.recv()
+                        except EOFError:
+                            break
+                        conn.send(self.handle(request))
+                        if request.get("command") == "shutdown":
+                            print(f"[Server] Shutting down after {self.runs} runs.")
+                            return
+
+
+def send_request(request, address=None, authkey=None):
+    """Send one request to a running SimulationServer and return its reply."""
+    address = address or getattr(config, "SERVER_ADDRESS", ("localhost", 6500))
+    authkey = authkey or getattr(config, "SERVER_AUTHKEY", b"helics-sim")
+    with Client(address, authkey=authkey) as conn:
+        conn.send(request)
+        return conn.recv()
+
+
+def run_remote(settings=None, names=None, address=None, authkey=None):
+    """Run a scenario on a running SimulationServer and return its results dict."""
+    results = send_request({"command": "run", "settings": settings or {}, "federates": names},
+                           address, authkey)
+    if not results["ok"]:
+        raise RuntimeError(f"Scenario failed on the server: {results['error']}")
+    return results
+
+
+def parse_setting(text):
+    """Parse NAME=VALUE; VALUE is a Python literal or else a plain string."""
+    name, _, value = text.partition("=")
+    try:
+        return name, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return name, value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the co-simulation warm and run scenarios on request.")
+    parser.add_argument("command", choices=("serve", "run", "status", "shutdown"))
+    parser.add_argument("--set", dest="settings", action="append", default=[], metavar="NAME=VALUE",
+                        help=f"scenario override for run, one of {', '.join(SCENARIO_SETTINGS)}")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        # Set the working directory using the configuration
+        os.chdir(config.BASE_DIR)
+        SimulationServer().serve()
+    elif args.command == "run":
+        wall = time.perf_counter()
+        results = run_remote(dict(parse_setting(s) for s in args.settings))
+        print(f"Scenario complete: {results['steps']} steps, setup {results['setup_time']:.2f} s, "
+              f"run {results['run_time']:.2f} s, round trip {time.perf_counter() - wall:.2f} s.")
+        if "voltage_summary" in results:
+            summary = results["voltage_summary"]
+            print(f"Voltage range: {summary['v_min'].min():.4f} - {summary['v_max'].max():.4f} pu")
+    else:
+        print(send_request({"command": args.command}))